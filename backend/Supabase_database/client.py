@@ -1,6 +1,10 @@
 import os
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
+import httpx
+from postgrest import SyncPostgrestClient
+from storage3 import SyncStorageClient
 from supabase import create_client, Client
 
 # Lade .env Datei aus dem backend Ordner
@@ -11,19 +15,83 @@ load_dotenv(env_path)
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 
+# One HTTP connection pool per process, shared by all user clients (keep-alive instead of a new TCP/TLS handshake per call)
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "10"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "120"))
+
+_http_client: httpx.Client | None = None
+_http_client_lock = threading.Lock()
+
+
 def get_anon_client() -> Client:
     if not SUPABASE_URL or not SUPABASE_ANON_KEY:
         raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set in the environment (.env file).")
     return create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
 
 
+def get_http_client() -> httpx.Client:
+    # Created on first use, so every process (API workers, Aufmass worker) gets its own pool
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                limits = httpx.Limits(max_connections=SUPABASE_MAX_CONNECTIONS, max_keepalive_connections=SUPABASE_MAX_KEEPALIVE, keepalive_expiry=60)
+                _http_client = httpx.Client(limits=limits, timeout=SUPABASE_TIMEOUT, follow_redirects=True)
+    return _http_client
+
+
+def close_http_client():
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+class UserClient:
+    """
+    Lightweight replacement of the supabase Client for the user-scoped calls in this backend (.table(), .storage, .postgrest).
+    The PostgREST and Storage clients only hold the headers with the user's JWT; all requests go through the shared
+    connection pool of get_http_client(), so creating a UserClient per handler call costs no HTTP session.
+    """
+
+    def __init__(self, access_token: str):
+        self.headers = {"apiKey": SUPABASE_ANON_KEY, "Authorization": f"Bearer {access_token}"}
+        self._postgrest: SyncPostgrestClient | None = None
+        self._storage: SyncStorageClient | None = None
+
+    @property
+    def postgrest(self) -> SyncPostgrestClient:
+        if self._postgrest is None:
+            self._postgrest = SyncPostgrestClient(f"{SUPABASE_URL}/rest/v1", headers=dict(self.headers), http_client=get_http_client())
+        return self._postgrest
+
+    @property
+    def storage(self) -> SyncStorageClient:
+        if self._storage is None:
+            self._storage = SyncStorageClient(f"{SUPABASE_URL}/storage/v1/", headers=dict(self.headers), http_client=get_http_client())
+        return self._storage
+
+    def table(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def from_(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def rpc(self, fn: str, params: dict | None = None, **kwargs):
+        return self.postgrest.rpc(fn, params or {}, **kwargs)
+
+
 # per-request client limited by a user JWT (RLS enforced):
 
-def get_user_client(access_token: str) -> Client:
+def get_user_client(access_token: str) -> UserClient:
     """Return a Supabase client that is authenticated as the given user.
 
     The client uses the *anon* key — therefore it is only allowed to perform
     the operations permitted by Row-Level-Security policies for that user.
+    The JWT is sent as header of every request, the HTTP connections are
+    shared with all other user clients of the process (see UserClient).
 
     Args:
         access_token: The JWT obtained from `supabase.auth.getSession()` in the
@@ -36,24 +104,4 @@ def get_user_client(access_token: str) -> Client:
     if not SUPABASE_URL or not SUPABASE_ANON_KEY:
         raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set in the environment (.env file).")
 
-    client: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-
-    # -------------------------------------------------------------------
-    # Inject the JWT so PostgREST & Storage requests are authorised as the user
-    # -------------------------------------------------------------------
-
-    # 1) PostgREST – preferred: dedicated auth() helper (supabase-py ≥1.0)
-    try:
-        client.postgrest.auth(access_token)  # type: ignore[attr-defined]
-    except AttributeError:
-        # Older postgrest client; fall back to header patching below
-        pass
-
-    # 2) Update default headers so *future* PostgREST / Storage clients pick it up
-    client.options.headers["Authorization"] = f"Bearer {access_token}"
-
-    # 3) If storage client already instantiated, patch its session headers
-    if hasattr(client, "_storage") and client._storage is not None:  # type: ignore[attr-defined]
-        client._storage.session.headers.update({"Authorization": f"Bearer {access_token}"})  # type: ignore[attr-defined]
-
-    return client 
\ No newline at end of file
+    return UserClient(access_token)
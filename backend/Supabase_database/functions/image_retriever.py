@@ -1,6 +1,22 @@
+import hashlib
+import os
+import threading
+import time
+
 import supabase
 from ..client import get_user_client
 
+# Signed URLs are created in batches of this many paths (one storage request per batch)
+SIGNED_URL_BATCH_SIZE = int(os.getenv("SIGNED_URL_BATCH_SIZE", "100"))
+# Created URLs are reused until this many seconds before they expire (at most half of their lifetime)
+SIGNED_URL_REFRESH_MARGIN = 300
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "5000"))
+
+# (token hash, bucket, path, expires_in) -> (signed url, reuse until). Keyed by token, so a URL is only handed out
+# to the caller whose storage permissions (RLS) it was created with.
+_signed_url_cache = {}
+_signed_url_lock = threading.Lock()
+
 # -------------------------------------------------------------------
 # Helpers
 # -------------------------------------------------------------------
@@ -52,6 +68,49 @@ def get_building_images(
     
     return response.data
 
+def create_signed_urls(supabase_client, access_token: str, bucket: str, paths: list[str], expires_in: int) -> dict:
+    """
+    Signed URLs for several files of a bucket: cached URLs that are still valid long enough are reused,
+    the others are created with create_signed_urls in batches of SIGNED_URL_BATCH_SIZE.
+    Returns {path: signed url or None}.
+    """
+    token_hash = hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+    now = time.time()
+    urls = {}
+    missing = []
+    with _signed_url_lock:
+        for path in dict.fromkeys(paths):
+            cached = _signed_url_cache.get((token_hash, bucket, path, expires_in))
+            if cached is not None and cached[1] > now:
+                urls[path] = cached[0]
+            else:
+                missing.append(path)
+
+    reuse_until = now + expires_in - min(SIGNED_URL_REFRESH_MARGIN, expires_in / 2)
+    for start in range(0, len(missing), SIGNED_URL_BATCH_SIZE):
+        chunk = missing[start:start + SIGNED_URL_BATCH_SIZE]
+        try:
+            response = supabase_client.storage.from_(bucket).create_signed_urls(chunk, expires_in)
+        except Exception as e:
+            print(f"Error generating signed URLs for {len(chunk)} images: {e}")
+            urls.update({path: None for path in chunk})
+            continue
+        created = {item.get("path"): item.get("signedURL") for item in response if not item.get("error")}
+        with _signed_url_lock:
+            for path in chunk:
+                urls[path] = created.get(path)
+                if urls[path]:
+                    _signed_url_cache[(token_hash, bucket, path, expires_in)] = (urls[path], reuse_until)
+                else:
+                    print(f"Failed to generate signed URL for {path}")
+            if len(_signed_url_cache) > SIGNED_URL_CACHE_SIZE:
+                # Drop expired URLs first, then the oldest ones
+                for key in [key for key, (_, until) in _signed_url_cache.items() if until <= now]:
+                    del _signed_url_cache[key]
+                for key in list(_signed_url_cache)[:max(0, len(_signed_url_cache) - SIGNED_URL_CACHE_SIZE)]:
+                    del _signed_url_cache[key]
+    return urls
+
 def get_building_images_with_signed_urls(
     *,
     access_token: str,
@@ -86,27 +145,14 @@ def get_building_images_with_signed_urls(
         limit=limit
     )
     
-    # Generate signed URLs for each image
+    # Signed URLs for all images at once (batched and cached, see create_signed_urls)
+    paths = [record['storage_path'] for record in image_records if record.get('storage_path')]
+    signed_urls = create_signed_urls(supabase_client, access_token, 'buildingimages1', paths, expires_in)
     for record in image_records:
         storage_path = record.get('storage_path')
         if storage_path:
-            try:
-                # Generate a signed URL for the image
-                signed_url_response = supabase_client.storage.from_('buildingimages1').create_signed_url(
-                    storage_path, 
-                    expires_in
-                )
-                
-                if signed_url_response and 'signedURL' in signed_url_response:
-                    record['signed_url'] = signed_url_response['signedURL']
-                    print(f"Generated signed URL for {storage_path}")
-                else:
-                    print(f"Failed to generate signed URL for {storage_path}")
-                    record['signed_url'] = None
-                    
-            except Exception as e:
-                print(f"Error generating signed URL for {storage_path}: {e}")
-                record['signed_url'] = None
+            record['signed_url'] = signed_urls.get(storage_path)
+    print(f"Generated signed URLs for {sum(1 for url in signed_urls.values() if url)} of {len(paths)} images")
     
     return image_records
 
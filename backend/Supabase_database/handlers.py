@@ -1,10 +1,12 @@
 import jwt
 import json
 import numpy as np
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Sequence, TypedDict
 from datetime import datetime
 
 from .client import get_user_client
+from .upsert import upsert_rows, BUILDINGS_CONFLICT_KEYS
+from . import outbox
 
 class NumpyEncoder(json.JSONEncoder):
     """ Special json encoder for numpy types """
@@ -17,23 +19,57 @@ class NumpyEncoder(json.JSONEncoder):
             return obj.tolist()
         return json.JSONEncoder.default(self, obj)
 
+# ---------------------------------------------------------------------------
+# Columns of buildings_geometry. The geometry columns hold large JSON arrays and are only read when the visualization
+# is built (GEOM_VISUALIZATION_COLUMNS); everything else should fetch the metadata only.
+# ---------------------------------------------------------------------------
+
+GEOM_METADATA_COLUMNS = ("ID_LOD2", "updated_at", "neighbour_lod2_ids", "surrounding_buildings_lod2_ids")
+GEOM_VISUALIZATION_COLUMNS = (
+    "ID_LOD2", "Wall_geometries_external", "Roof_geometries", "Ground_area_geometry", "Points_single", "Points_multi",
+    "Points_roof_extrusions", "Extrusion_tops", "Extrusion_walls", "Wall_centers", "neighbour_geometries",
+    "surrounding_buildings_geometries", "facade_N", "facade_NE", "facade_E", "facade_SE", "facade_S", "facade_SW", "facade_W", "facade_NW",
+)
+
+class GeomMetadata(TypedDict):
+    ID_LOD2: str
+    updated_at: Optional[str] # version of the geometry, see get_geom_version()
+    neighbour_lod2_ids: Optional[List[str]]
+    surrounding_buildings_lod2_ids: Optional[List[str]]
+
+def _select_row(table_name: str, ID_LOD2: str, access_token: str, columns: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+    # Row of the building in table_name with only the given columns (all if None), RLS applies. Errors are raised.
+    select = ",".join(columns) if columns else "*"
+    response = get_user_client(access_token).table(table_name).select(select).eq("ID_LOD2", ID_LOD2).limit(1).execute()
+    return response.data[0] if response.data else None
+
+def _only_columns(row: dict, columns: Optional[Sequence[str]]) -> dict:
+    return row if not columns else {column: row.get(column) for column in columns}
+
 # ---------------------------------------------------------------------------
 # User-token functions (RLS enforced)
 # ---------------------------------------------------------------------------
 
-def get_building_data(ID_LOD2: str, access_token: str):
-    """Get building data from table buildings_data by ID_LOD2 using the caller's JWT so RLS applies."""
-    user_supabase = get_user_client(access_token)
-    
+def get_building_data(ID_LOD2: str, access_token: str, columns: Optional[Sequence[str]] = None):
+    """
+    Get building data from table buildings_data by ID_LOD2 using the caller's JWT so RLS applies.
+    Only the given columns are fetched if columns is set.
+    """
+
     # We do not need to manually filter by user_id here because RLS on the database
     # will automatically filter results to only those owned by the authenticated user.
     # The 'using (user_id = auth.uid())' policy handles this securely.
     
+    # LOD2 data of this user that is still waiting in the outbox is newer than the database row
+    pending = outbox.pending_row("buildings_data", ID_LOD2, access_token)
+
     try:
-        response = user_supabase.table("buildings_data").select("*").eq("ID_LOD2", ID_LOD2).execute()
+        row = _select_row("buildings_data", ID_LOD2, access_token, columns)
         
-        if response.data and len(response.data) > 0:
-            return response.data[0]  # Return the first matching record
+        if pending is not None:
+            return _only_columns(dict(row or {}, **pending[0]), columns)
+        if row is not None:
+            return row
         else:
             # Note: This might mean the record doesn't exist OR the user doesn't have permission
             print(f"No building data found for ID_LOD2: {ID_LOD2}")
@@ -61,9 +97,6 @@ def update_building_data(LOD2_ID: str, access_token: str, data:dict):
 
 def insert_LOD2_data(LOD2_data: dict, access_token: str):
     """Insert or update cleaned LOD2 data under the privileges of the end-user."""
-    # Get user info from the JWT to set ownership
-    user_supabase = get_user_client(access_token)
-
     # Exclude everything not needed by the frontend (and therefore not accepted by the database), such as visualization data, which is uploaded to another table
     excluded_keys = {
         "coordinates",
@@ -96,6 +129,7 @@ def insert_LOD2_data(LOD2_data: dict, access_token: str):
         "Facade_area_tot",
         "Triangulated_Geometry",
         "Mesh",
+        "Repaired_Geometry",
         "neighbour_geometries",
         "surrounding_buildings_geometries",
         "surrounding_buildings_lod2_ids",
@@ -108,51 +142,77 @@ def insert_LOD2_data(LOD2_data: dict, access_token: str):
     # grab the user ID from the authenticated session (via the access_token).
     
     try:
-        # Check if record already exists for this ID_LOD2
-        response = user_supabase.table("buildings_data").select("ID_LOD2").eq("ID_LOD2", cleaned.get("ID_LOD2")).execute()
-
-        if response.data and len(response.data) > 0:
-            # Record exists, update it
-            user_supabase.table("buildings_data").update(cleaned).eq("ID_LOD2", cleaned.get("ID_LOD2")).execute()
-            print(f"LOD2 data successfully updated in database")
-        else:
-            # Record doesn't exist, insert it
-            user_supabase.table("buildings_data").insert(cleaned).execute()
-            print(f"LOD2 data successfully inserted to database")
+        if outbox.is_active():
+            # Written in the background (see outbox.py), the response does not wait for the database
+            outbox.append("buildings_data", json.loads(json.dumps(cleaned, cls=NumpyEncoder)), BUILDINGS_CONFLICT_KEYS, access_token)
+            print(f"LOD2 data queued for the database")
+            return
+        # One upsert instead of select + update/insert, the row is matched on user_id and ID_LOD2
+        upsert_rows("buildings_data", cleaned, BUILDINGS_CONFLICT_KEYS, access_token)
+        print(f"LOD2 data successfully upserted to database")
     except Exception as e:
         print(f"Error upserting LOD2 data into buildings_data: {e}")
 
 def insert_geom_data(geom_data: dict, access_token: str):
     # Insert or update geometry data - this function also turns lists and arrays into json data to be properly stored in the database
     # The input dict geom_data has to contain the ID_LOD2 of the building as a key
-    user_supabase = get_user_client(access_token)
     # Convert all numpy types (arrays, floats, ints) to native Python types 
     # by round-tripping through JSON. We use json.loads() to get back Python objects
     # (dicts, lists) so that the Supabase client deals with them as JSON objects/arrays, not as stringified JSON.
     insert_data = json.loads(json.dumps(geom_data, cls=NumpyEncoder))
 
     try:
-        # Check if record already exists for this ID_LOD2
-        response = user_supabase.table("buildings_geometry").select("ID_LOD2").eq("ID_LOD2", insert_data.get("ID_LOD2")).execute()
-
-        if response.data and len(response.data) > 0:
-            # Record exists, update it
-            user_supabase.table("buildings_geometry").update(insert_data).eq("ID_LOD2", insert_data.get("ID_LOD2")).execute()
-            print(f"Geometry data successfully updated in database")
-        else:
-            # Record doesn't exist, insert it
-            user_supabase.table("buildings_geometry").insert(insert_data).execute()
-            print(f"Geometry data successfully inserted to database")
+        if outbox.is_active():
+            outbox.append("buildings_geometry", insert_data, BUILDINGS_CONFLICT_KEYS, access_token)
+            print(f"Geometry data queued for the database")
+            return
+        upsert_rows("buildings_geometry", insert_data, BUILDINGS_CONFLICT_KEYS, access_token)
+        print(f"Geometry data successfully upserted to database")
     except Exception as e:
         print(f"Error upserting geometry data into buildings_geometry: {e}")
     
 
-def get_geom_data(ID_LOD2: str, access_token: str):
-    """Get geometry data from table buildings_geometry by ID_LOD2 using the caller's JWT so RLS applies."""
-    user_supabase = get_user_client(access_token)
+def get_geom_version(ID_LOD2: str, access_token: str):
+    """
+    Version of the geometry row of a building (its updated_at timestamp, see sql/add_buildings_geometry_updated_at.sql),
+    without loading the geometry itself. Returns None if the row or the column does not exist.
+    Geometry still waiting in the outbox has its own version, which changes again once it is written.
+    """
+    pending = outbox.pending_row("buildings_geometry", ID_LOD2, access_token)
+    if pending is not None:
+        return pending[1]
+    try:
+        row = _select_row("buildings_geometry", ID_LOD2, access_token, ["updated_at"])
+        return row.get("updated_at") if row else None
+    except Exception as e:
+        print(f"Error retrieving geometry version: {e}")
+        return None
+
+def get_geom_metadata(ID_LOD2: str, access_token: str) -> Optional[GeomMetadata]:
+    """Version and referenced building ids of the geometry row, without any of the large geometry columns. None if there is no row."""
+    pending = outbox.pending_row("buildings_geometry", ID_LOD2, access_token)
+    if pending is not None:
+        return dict(_only_columns(pending[0], GEOM_METADATA_COLUMNS), updated_at=pending[1])
+    try:
+        return _select_row("buildings_geometry", ID_LOD2, access_token, GEOM_METADATA_COLUMNS)
+    except Exception as e:
+        print(f"Error retrieving geometry metadata: {e}")
+        return None
+
+def get_geom_data(ID_LOD2: str, access_token: str, columns: Optional[Sequence[str]] = None):
+    """
+    Get geometry data from table buildings_geometry by ID_LOD2 using the caller's JWT so RLS applies.
+    Only the given columns are fetched if columns is set, e.g. GEOM_VISUALIZATION_COLUMNS.
+    """
+    # Geometry of this user that is not written yet comes from the outbox (it contains all geometry columns)
+    pending = outbox.pending_row("buildings_geometry", ID_LOD2, access_token)
+    if pending is not None:
+        return _only_columns(pending[0], columns)
     try:
-        response = user_supabase.table("buildings_geometry").select("*").eq("ID_LOD2", ID_LOD2).execute()
-        return response.data[0]
+        row = _select_row("buildings_geometry", ID_LOD2, access_token, columns)
+        if row is None:
+            print(f"No geometry data found for ID_LOD2: {ID_LOD2}")
+        return row
     except Exception as e:
         print(f"Error retrieving geometry data: {e}")
         return None
\ No newline at end of file
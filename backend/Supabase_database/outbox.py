@@ -0,0 +1,281 @@
+"""
+Write-behind outbox for writes the response does not have to wait for (buildings_data / buildings_geometry of /api/address).
+
+The request only appends the row to a local SQLite file (one fsync instead of uploading the large geometry JSON).
+A background thread (start_flusher(), started by main.py) pushes the pending rows to Supabase with upsert_rows(),
+several rows of the same table and user per request, and retries failed writes with backoff.
+Until a row is written, reads of the same user (same access token) get it from the outbox (pending_row()),
+so /api/geom-to-threejs right after /api/address already sees the new geometry.
+Pending rows are matched by the hash of the access token, not by the user id in it: the token is not verified here, and
+a self-made token with another user's id must not see that user's pending rows. After a token refresh, reads therefore
+do not see rows written with the old token until the flusher has written them (usually within OUTBOX_FLUSH_INTERVAL),
+and get the older database row in between.
+
+The file stores the users' access tokens until the rows are written. It is created with mode 0600 in a directory with
+mode 0700 (a directory owned by another user is refused), and deleted entries are overwritten (secure_delete).
+It has to be on a persistent disk if pending writes should survive a restart of the host (SUPABASE_OUTBOX_DB).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+import traceback
+
+from .upsert import upsert_rows
+
+SUPABASE_OUTBOX_DB = os.getenv("SUPABASE_OUTBOX_DB", os.path.join(tempfile.gettempdir(), f"supabase_outbox_{os.getuid()}", "outbox.sqlite3"))
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "0.5"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+# Upper limit of the JSON rows sent in one upsert request (geometry rows can be several MB each)
+OUTBOX_MAX_BATCH_BYTES = int(float(os.getenv("OUTBOX_MAX_BATCH_MB", "8")) * 1e6)
+# After this many failed attempts an entry is given up (kept for OUTBOX_KEEP_FAILED seconds to look into it)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_KEEP_FAILED = float(os.getenv("OUTBOX_KEEP_FAILED", str(7 * 24 * 3600)))
+# A claimed entry not finished within this time (flusher process died) is flushed again by another flusher
+OUTBOX_CLAIM_TIMEOUT = 120
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS supabase_outbox (
+    entry_id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name      TEXT NOT NULL,
+    row_key         TEXT NOT NULL,    -- ID_LOD2
+    token_hash      TEXT NOT NULL,    -- reads only see pending rows written with the same token
+    access_token    TEXT NOT NULL,    -- needed for RLS when flushing, removed when the entry failed for good
+    on_conflict     TEXT NOT NULL,    -- JSON list of the conflict columns
+    data            TEXT NOT NULL,    -- JSON row
+    version         INTEGER NOT NULL DEFAULT 1,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    status          TEXT NOT NULL DEFAULT 'pending', -- pending, failed
+    error           TEXT,
+    claimed_until   REAL,
+    next_attempt_at REAL NOT NULL,
+    updated_at      REAL NOT NULL,
+    UNIQUE (table_name, token_hash, row_key)
+);
+CREATE INDEX IF NOT EXISTS supabase_outbox_due ON supabase_outbox (status, next_attempt_at);
+"""
+
+_flusher = None
+_stop = threading.Event()
+_local = threading.local() # connections of the request threads, per database path
+_created = set() # database paths whose file and schema were set up by this process
+_created_lock = threading.Lock()
+
+
+def _create_private_file(db_path: str):
+    # Directory 0700 owned by this user, file 0600 (SQLite creates the -wal / -shm files with the mode of the database file)
+    directory = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"Outbox directory {directory} is not a directory owned by this user")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(directory, 0o700)
+    os.close(os.open(db_path, os.O_RDWR | os.O_CREAT, 0o600))
+    os.chmod(db_path, 0o600)
+
+
+def connect(db_path: str | None = None) -> sqlite3.Connection:
+    # Same setup as the Aufmass job queue: autocommit with explicit transactions, WAL so reads do not wait for the flusher.
+    # The file and the schema are only set up on the first connection of the process.
+    db_path = db_path or SUPABASE_OUTBOX_DB
+    with _created_lock:
+        first = db_path not in _created
+        if first:
+            _create_private_file(db_path)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA secure_delete=ON") # no access tokens left in free pages of written entries
+    if first:
+        conn.execute("PRAGMA journal_mode=WAL") # stored in the file
+        conn.executescript(_SCHEMA)
+        with _created_lock:
+            _created.add(db_path)
+    return conn
+
+
+def _connection(db_path: str | None = None) -> sqlite3.Connection:
+    # One connection per thread and database, kept open for the next calls of append() and pending_row()
+    db_path = db_path or SUPABASE_OUTBOX_DB
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = connect(db_path)
+    return conn
+
+
+def _token_hash(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+def is_active() -> bool:
+    # Writes only go through the outbox if a flusher runs in this process, otherwise they would wait for the next start
+    return _flusher is not None and _flusher.is_alive()
+
+
+def append(table_name: str, row: dict, on_conflict: list[str], access_token: str, db_path: str | None = None):
+    """
+    Queues the upsert of one row (row has to be JSON serializable and contain ID_LOD2).
+    A row of the same table, building and token that is still pending is merged with the new values instead of written twice.
+    """
+    now = time.time()
+    conn = _connection(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        key = (table_name, _token_hash(access_token), str(row["ID_LOD2"]))
+        existing = conn.execute(
+            "SELECT entry_id, data FROM supabase_outbox WHERE table_name = ? AND token_hash = ? AND row_key = ? AND status = 'pending'",
+            key).fetchone()
+        if existing is not None:
+            data = dict(json.loads(existing["data"]), **row)
+            # version + 1: a flusher sending the older data does not delete the entry afterwards
+            conn.execute(
+                "UPDATE supabase_outbox SET data = ?, access_token = ?, version = version + 1, attempts = 0, next_attempt_at = ?, updated_at = ? WHERE entry_id = ?",
+                (json.dumps(data), access_token, now, now, existing["entry_id"]))
+        else:
+            conn.execute("DELETE FROM supabase_outbox WHERE table_name = ? AND token_hash = ? AND row_key = ?", key) # old failed entry
+            conn.execute(
+                "INSERT INTO supabase_outbox (table_name, row_key, token_hash, access_token, on_conflict, data, next_attempt_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key[0], key[2], key[1], access_token, json.dumps(on_conflict), json.dumps(row), now, now))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def pending_row(table_name: str, ID_LOD2: str, access_token: str, db_path: str | None = None):
+    # (row, version) of a write of this user that is not in the database yet, or None
+    db_path = db_path or SUPABASE_OUTBOX_DB
+    if db_path not in _created and not os.path.exists(db_path):
+        return None # outbox never used on this host (e.g. SUPABASE_OUTBOX=false)
+    entry = _connection(db_path).execute(
+        "SELECT data, version, updated_at FROM supabase_outbox WHERE table_name = ? AND token_hash = ? AND row_key = ? AND status = 'pending'",
+        (table_name, _token_hash(access_token), str(ID_LOD2))).fetchone()
+    if entry is None:
+        return None
+    return json.loads(entry["data"]), f"outbox-{entry['updated_at']}-{entry['version']}"
+
+
+def _claim(conn: sqlite3.Connection, limit: int) -> list[sqlite3.Row]:
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        entries = conn.execute(
+            "SELECT * FROM supabase_outbox WHERE status = 'pending' AND next_attempt_at <= ? AND (claimed_until IS NULL OR claimed_until < ?) "
+            "ORDER BY next_attempt_at LIMIT ?", (now, now, limit)).fetchall()
+        conn.executemany("UPDATE supabase_outbox SET claimed_until = ? WHERE entry_id = ?",
+                         [(now + OUTBOX_CLAIM_TIMEOUT, entry["entry_id"]) for entry in entries])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return entries
+
+
+def _done(conn: sqlite3.Connection, entries):
+    # Only entries that were not changed while being sent are removed (with their access token), newer data stays pending
+    conn.executemany("DELETE FROM supabase_outbox WHERE entry_id = ? AND version = ?",
+                     [(entry["entry_id"], entry["version"]) for entry in entries])
+    conn.executemany("UPDATE supabase_outbox SET claimed_until = NULL WHERE entry_id = ?", [(entry["entry_id"],) for entry in entries])
+
+
+def _retry_later(conn: sqlite3.Connection, entries, error: str):
+    now = time.time()
+    for entry in entries:
+        attempts = entry["attempts"] + 1
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            print(f"Outbox: giving up writing {entry['table_name']} {entry['row_key']} after {attempts} attempts: {error}")
+            conn.execute("UPDATE supabase_outbox SET status = 'failed', access_token = '', error = ?, attempts = ?, claimed_until = NULL, updated_at = ? "
+                         "WHERE entry_id = ? AND version = ?", (error, attempts, now, entry["entry_id"], entry["version"]))
+        else:
+            # Exponential backoff: 2, 4, 8, ... seconds, at most 5 minutes
+            conn.execute("UPDATE supabase_outbox SET attempts = ?, error = ?, next_attempt_at = ? WHERE entry_id = ? AND version = ?",
+                         (attempts, error, now + min(2 ** attempts, 300), entry["entry_id"], entry["version"]))
+        conn.execute("UPDATE supabase_outbox SET claimed_until = NULL WHERE entry_id = ?", (entry["entry_id"],))
+
+
+def _split_by_size(entries):
+    # Consecutive batches of at most OUTBOX_MAX_BATCH_BYTES of JSON, a larger row is sent alone
+    batch, size = [], 0
+    for entry in entries:
+        if batch and size + len(entry["data"]) > OUTBOX_MAX_BATCH_BYTES:
+            yield batch
+            batch, size = [], 0
+        batch.append(entry)
+        size += len(entry["data"])
+    if batch:
+        yield batch
+
+
+def flush(conn: sqlite3.Connection, limit: int | None = None) -> int:
+    """
+    Sends the due entries (at most limit) to Supabase and returns how many were written.
+    Entries of the same table, user and conflict columns are sent as batched upserts of at most OUTBOX_MAX_BATCH_BYTES.
+    """
+    entries = _claim(conn, limit or OUTBOX_BATCH_SIZE)
+    groups = {}
+    for entry in entries:
+        groups.setdefault((entry["table_name"], entry["access_token"], entry["on_conflict"]), []).append(entry)
+    written = 0
+    for (table_name, access_token, on_conflict), group_entries in groups.items():
+        for batch in _split_by_size(group_entries):
+            try:
+                upsert_rows(table_name, [json.loads(entry["data"]) for entry in batch], json.loads(on_conflict), access_token)
+            except Exception as e:
+                print(f"Outbox: writing {len(batch)} row(s) to {table_name} failed: {e}")
+                _retry_later(conn, batch, f"{type(e).__name__}: {e}")
+                continue
+            _done(conn, batch)
+            written += len(batch)
+    return written
+
+
+def _remove_old_failed(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM supabase_outbox WHERE status = 'failed' AND updated_at < ?", (time.time() - OUTBOX_KEEP_FAILED,))
+
+
+def _run_flusher(db_path: str | None):
+    conn = connect(db_path)
+    _remove_old_failed(conn)
+    try:
+        while not _stop.is_set():
+            try:
+                written = flush(conn)
+                if written >= OUTBOX_BATCH_SIZE:
+                    continue # more entries are probably due
+                if written:
+                    # Written entries are gone from the database file, this also removes their old copies (with the tokens) from the WAL
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except Exception:
+                traceback.print_exc()
+            _stop.wait(OUTBOX_FLUSH_INTERVAL)
+        # Last attempt for everything that is due, the rest stays in the file for the next start
+        while flush(conn):
+            pass
+    finally:
+        conn.close()
+
+
+def start_flusher(db_path: str | None = None):
+    global _flusher
+    if is_active():
+        return
+    _stop.clear()
+    _flusher = threading.Thread(target=_run_flusher, args=(db_path,), name="supabase-outbox", daemon=True)
+    _flusher.start()
+
+
+def stop_flusher(timeout: float = 30):
+    global _flusher
+    if _flusher is None:
+        return
+    _stop.set()
+    _flusher.join(timeout)
+    _flusher = None
@@ -0,0 +1,23 @@
+-- Versionsspalte für buildings_geometry
+-- updated_at wird bei jedem Insert/Update gesetzt und dient als Version der Geometrie:
+-- /api/geom-to-threejs leitet daraus das ETag ab und beantwortet bedingte Requests (If-None-Match) mit 304,
+-- ohne die Geometrie zu laden und zu konvertieren.
+
+ALTER TABLE buildings_geometry
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION set_buildings_geometry_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = clock_timestamp(); -- nicht NOW(): mehrere Updates in einer Transaktion bekämen sonst dieselbe Version
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_buildings_geometry_updated_at ON buildings_geometry;
+CREATE TRIGGER trg_buildings_geometry_updated_at
+    BEFORE INSERT OR UPDATE ON buildings_geometry
+    FOR EACH ROW
+    EXECUTE FUNCTION set_buildings_geometry_updated_at();
+
+COMMENT ON COLUMN buildings_geometry.updated_at IS 'Zeitpunkt der letzten Änderung der Geometrie, Basis für das ETag von /api/geom-to-threejs';
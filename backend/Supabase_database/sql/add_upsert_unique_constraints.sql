@@ -0,0 +1,73 @@
+-- Eindeutige Indizes für die Upserts der Schreibschicht (Supabase_database/upsert.py)
+-- PostgREST-Upserts (on_conflict=...) brauchen einen eindeutigen Index genau auf den Konfliktspalten.
+-- user_id wird von der Datenbank gesetzt (default auth.uid()), jeder Nutzer hat also seine eigenen Zeilen pro Gebäude.
+-- Die Spalten müssen mit BUILDINGS_CONFLICT_KEYS (upsert.py) und AUFMASS_CONFLICT_KEYS (aufmass_core/database_upload_functions.py) übereinstimmen.
+--
+-- Vorher doppelt angelegte Zeilen (mögliche Race Condition des alten select + insert) werden entfernt,
+-- behalten wird jeweils die zuletzt geschriebene Zeile.
+
+-- Gebäudedaten und Geometrie
+DELETE FROM buildings_data a USING buildings_data b
+    WHERE a.ctid < b.ctid AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2";
+CREATE UNIQUE INDEX IF NOT EXISTS buildings_data_user_lod2_key ON buildings_data (user_id, "ID_LOD2");
+
+DELETE FROM buildings_geometry a USING buildings_geometry b
+    WHERE a.ctid < b.ctid AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2";
+CREATE UNIQUE INDEX IF NOT EXISTS buildings_geometry_user_lod2_key ON buildings_geometry (user_id, "ID_LOD2");
+
+-- Aufmaß-Tabellen: ID_LOD2, alle *_id-Felder und ggf. tags identifizieren ein Objekt (siehe aufmassClasses.py)
+DELETE FROM facade a USING facade b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.facade_id = b.facade_id;
+CREATE UNIQUE INDEX IF NOT EXISTS facade_upsert_key ON facade (user_id, "ID_LOD2", facade_id);
+
+DELETE FROM opening a USING opening b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.facade_id = b.facade_id AND a.opening_id = b.opening_id;
+CREATE UNIQUE INDEX IF NOT EXISTS opening_upsert_key ON opening (user_id, "ID_LOD2", facade_id, opening_id);
+
+DELETE FROM opening_accessory a USING opening_accessory b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.facade_id = b.facade_id
+      AND a.opening_id = b.opening_id AND a.accessory_id = b.accessory_id;
+CREATE UNIQUE INDEX IF NOT EXISTS opening_accessory_upsert_key ON opening_accessory (user_id, "ID_LOD2", facade_id, opening_id, accessory_id);
+
+DELETE FROM wall_section a USING wall_section b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.facade_id = b.facade_id AND a.wall_section_id = b.wall_section_id;
+CREATE UNIQUE INDEX IF NOT EXISTS wall_section_upsert_key ON wall_section (user_id, "ID_LOD2", facade_id, wall_section_id);
+
+DELETE FROM roof_overhang a USING roof_overhang b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.facade_id = b.facade_id AND a.roof_overhang_id = b.roof_overhang_id;
+CREATE UNIQUE INDEX IF NOT EXISTS roof_overhang_upsert_key ON roof_overhang (user_id, "ID_LOD2", facade_id, roof_overhang_id);
+
+DELETE FROM facade_attachment a USING facade_attachment b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.facade_id = b.facade_id
+      AND a.facade_attachment_id = b.facade_attachment_id;
+CREATE UNIQUE INDEX IF NOT EXISTS facade_attachment_upsert_key ON facade_attachment (user_id, "ID_LOD2", facade_id, facade_attachment_id);
+
+DELETE FROM facade_edge a USING facade_edge b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.facade_id = b.facade_id AND a.edge_id = b.edge_id;
+CREATE UNIQUE INDEX IF NOT EXISTS facade_edge_upsert_key ON facade_edge (user_id, "ID_LOD2", facade_id, edge_id);
+
+-- Masken und Bilder werden zusätzlich über ihre Tags unterschieden (z.B. "raw_segmentation", "rectified");
+-- der Vergleich ist exakt, nicht mehr "enthält" wie beim alten select.
+-- Pro Fassade gibt es eine Maske je Tags, die mask_id gehört nicht zum Schlüssel (Masken werden ohne vorheriges select geschrieben).
+-- Ein älterer Index mit mask_id wird ersetzt.
+DELETE FROM segmentation_mask a USING segmentation_mask b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.facade_id = b.facade_id AND a.tags = b.tags;
+DROP INDEX IF EXISTS segmentation_mask_upsert_key;
+CREATE UNIQUE INDEX segmentation_mask_upsert_key ON segmentation_mask (user_id, "ID_LOD2", facade_id, tags);
+
+DELETE FROM facade_image a USING facade_image b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.facade_id = b.facade_id AND a.tags = b.tags;
+CREATE UNIQUE INDEX IF NOT EXISTS facade_image_upsert_key ON facade_image (user_id, "ID_LOD2", facade_id, tags);
+
+DELETE FROM facade_measurement a USING facade_measurement b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.building_measurement_id = b.building_measurement_id
+      AND a.facade_id = b.facade_id AND a.facade_measurement_id = b.facade_measurement_id;
+CREATE UNIQUE INDEX IF NOT EXISTS facade_measurement_upsert_key ON facade_measurement (user_id, "ID_LOD2", building_measurement_id, facade_id, facade_measurement_id);
+
+DELETE FROM building_measurement a USING building_measurement b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.building_measurement_id = b.building_measurement_id;
+CREATE UNIQUE INDEX IF NOT EXISTS building_measurement_upsert_key ON building_measurement (user_id, "ID_LOD2", building_measurement_id);
+
+DELETE FROM offer a USING offer b
+    WHERE a.id < b.id AND a.user_id = b.user_id AND a."ID_LOD2" = b."ID_LOD2" AND a.gebaeudeaufmass_id = b.gebaeudeaufmass_id AND a.angebot_id = b.angebot_id;
+CREATE UNIQUE INDEX IF NOT EXISTS offer_upsert_key ON offer (user_id, "ID_LOD2", gebaeudeaufmass_id, angebot_id);
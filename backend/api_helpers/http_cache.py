@@ -0,0 +1,137 @@
+"""
+Helpers for large, cacheable JSON responses (e.g. /api/geom-to-threejs):
+- strong ETags derived from the version of the stored database row, so conditional requests can be answered with 304
+  before the expensive conversion runs
+- the JSON body is encoded and compressed (brotli or gzip, depending on Accept-Encoding) chunk by chunk while it is sent,
+  instead of building one giant string
+"""
+import hashlib
+import json
+import zlib
+
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import brotli # optional, without it only gzip is offered
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed, compression does not pay off for them
+MIN_COMPRESS_SIZE = 1024
+# The JSON encoder yields many tiny pieces, they are joined to chunks of about this size before compressing / sending
+CHUNK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5 # brotli is much slower with the default quality 11, 4-6 is a good tradeoff for dynamic responses
+
+# Suffix of the ETag for every content coding: a compressed body is a different representation and needs its own strong ETag
+_ENCODING_SUFFIX = {"identity": "", "gzip": "-gz", "br": "-br"}
+
+
+def make_etag(*parts) -> str:
+    # Base ETag (without quotes and encoding suffix) from everything the response depends on, e.g. row version and parameters
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32]
+
+
+def etag_matches(if_none_match: str | None, base_etag: str) -> bool:
+    """
+    True if the If-None-Match header of the request contains the ETag, in any content coding (a 304 has no body,
+    so it does not matter which encoding the client stored). Weak comparison as required for If-None-Match.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        for suffix in _ENCODING_SUFFIX.values():
+            if suffix and tag.endswith(suffix):
+                tag = tag[:-len(suffix)]
+                break
+        if tag == base_etag:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: str | None) -> str:
+    # Preferred content coding supported by the client: br before gzip, q=0 excludes an encoding
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in (["br"] if brotli is not None else []) + ["gzip"]:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def not_modified_response(base_etag: str, encoding: str = "identity") -> Response:
+    return Response(status_code=304, headers=_cache_headers(base_etag, encoding))
+
+
+def _cache_headers(base_etag: str | None, encoding: str) -> dict:
+    # private: the geometry belongs to the user (RLS), no-cache: always revalidate with the ETag
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if base_etag:
+        headers["ETag"] = f'"{base_etag}{_ENCODING_SUFFIX[encoding]}"'
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return headers
+
+
+def _json_chunks(data, encoder_cls=None):
+    # JSON encoding piece by piece (json.JSONEncoder.iterencode), joined to chunks of about CHUNK_SIZE bytes
+    encoder = (encoder_cls or json.JSONEncoder)(ensure_ascii=False)
+    buffer, size = [], 0
+    for piece in encoder.iterencode(data):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def _compressed(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            out = compressor.process(chunk)
+            if out:
+                yield out
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) # wbits 31: gzip container
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+
+
+def streaming_json_response(data, accept_encoding: str | None = None, base_etag: str | None = None, encoder_cls=None) -> StreamingResponse:
+    """
+    Streams data as JSON, compressed with the best encoding the client accepts if the body is at least MIN_COMPRESS_SIZE bytes.
+    The first chunk is encoded before the response is created, so small bodies can be detected and sent uncompressed.
+    """
+    chunks = _json_chunks(data, encoder_cls)
+    first = next(chunks, b"")
+    encoding = choose_encoding(accept_encoding) if len(first) >= MIN_COMPRESS_SIZE else "identity"
+
+    def body():
+        yield first
+        yield from chunks
+
+    content = body() if encoding == "identity" else _compressed(body(), encoding)
+    return StreamingResponse(content, media_type="application/json", headers=_cache_headers(base_etag, encoding))
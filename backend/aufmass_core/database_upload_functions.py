@@ -4,10 +4,12 @@ import jwt
 import json
 import os
 import mimetypes
+import uuid
 from dataclasses import asdict
 from typing import Any
 from Supabase_database.client import get_user_client
 from Supabase_database.handlers import NumpyEncoder
+from Supabase_database.upsert import upsert_rows
 from aufmass_core.datastructure.aufmassClasses import *
 
 def _extract_user_id_insecure(token: str) -> str:
@@ -31,40 +33,40 @@ def _extract_user_id_insecure(token: str) -> str:
         # Try environment variable as fallback
         return os.getenv('SUPABASE_USER_ID')
 
-def _insert_aufmass_object(obj: Any, access_token: str = None):
-    """
-    Required: The object to insert has to have a TABLE_NAME attribute, which is the name of the database table to insert the data into. 
-    Fits for all classes in the aufmassClasses.py file (except Gebaeude)
-    Generic insert function for aufmass dataclasses.
-    Gets the correct database table name from the object and upserts (insert or update) the data into the corresponding table.
-    Updates existing records if ID_LOD2 and all '*_id' fields match.
-    """
-    if not access_token:
-        print("WARNING: No access token provided. Operation might fail due to RLS.")
-        
+# Columns identifying a row of each aufmass table (ID_LOD2, the *_id fields and tags, see aufmassClasses.py), used as conflict target
+# of the upsert. Every table has a unique index on user_id plus these columns (sql/add_upsert_unique_constraints.sql).
+# material_id is an attribute, not part of the identifier. A facade has one mask per tags, so mask_id is not part of it either:
+# masks are upserted without looking up the mask_id of an existing mask first.
+AUFMASS_CONFLICT_KEYS = {
+    "facade": ["ID_LOD2", "facade_id"],
+    "opening": ["ID_LOD2", "facade_id", "opening_id"],
+    "opening_accessory": ["ID_LOD2", "facade_id", "opening_id", "accessory_id"],
+    "wall_section": ["ID_LOD2", "facade_id", "wall_section_id"],
+    "roof_overhang": ["ID_LOD2", "facade_id", "roof_overhang_id"],
+    "facade_attachment": ["ID_LOD2", "facade_id", "facade_attachment_id"],
+    "facade_edge": ["ID_LOD2", "facade_id", "edge_id"],
+    "segmentation_mask": ["ID_LOD2", "facade_id", "tags"],
+    "facade_image": ["ID_LOD2", "facade_id", "tags"],
+    "facade_measurement": ["ID_LOD2", "building_measurement_id", "facade_id", "facade_measurement_id"],
+    "building_measurement": ["ID_LOD2", "building_measurement_id"],
+    "offer": ["ID_LOD2", "gebaeudeaufmass_id", "angebot_id"],
+}
+
+def _segmentation_mask_id(ID_LOD2: str, facade_id: str, tags: list[str]) -> str:
+    # Same mask_id every time the mask of a facade with these tags is written, so an update keeps the id of the existing row
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"segmentation_mask/{ID_LOD2}/{facade_id}/{','.join(tags)}"))
+
+def _aufmass_row(obj: Any) -> tuple[str | None, dict]:
+    # Table name and database row of an aufmass dataclass object
     data = asdict(obj)
     # Get table name from the object (and remove it from the data dictionary before uploading)
     table_name = data.pop('TABLE_NAME', None)
-    if not table_name:
-        print(f"Error: Object {type(obj)} has no TABLE_NAME")
-        return
 
     # We do NOT set user_id manually. The database sets it via 'default auth.uid()'.
     # If the object has a 'user_id' field that is None/Empty, we explicitly remove it 
     # to let the database default take over.
     if 'user_id' in data:
         del data['user_id']
-    
-    # Identify unique identifiers for this object type. Always include ID_LOD2 and any field ending in '_id' (like facade_id, opening_id, etc.)
-    unique_keys = ['ID_LOD2']
-
-    # Include tags in unique keys if present, so different tags create new entries
-    if 'tags' in data:
-        unique_keys.append('tags')
-
-    for key in data.keys():
-        if key.endswith('_id'):
-             unique_keys.append(key)
 
     # Serialize lists/dicts to JSON strings for DB compatibility
     for key, value in data.items():
@@ -75,40 +77,56 @@ def _insert_aufmass_object(obj: Any, access_token: str = None):
                 pass
             elif isinstance(value, (dict, list)): # Only dump complex structures or dicts intended for JSONB
                 data[key] = json.dumps(value, cls=NumpyEncoder)
+    return table_name, data
 
-    client = get_user_client(access_token)
-    try:
-        # Build query to check for existing record
-        query = client.table(table_name).select("id")
-        for key in unique_keys:
-            if key in data and data[key] is not None:
-                # For tags (array field), use contains instead of eq
-                if key == 'tags':
-                    query = query.contains(key, data[key])
-                else:
-                    query = query.eq(key, data[key])
-        
-        result = query.execute()
-        
-        if result.data and len(result.data) > 0:
-            # Update existing record
-            existing_id = result.data[0]['id']
-            # We update everything provided except 'id' (which isn't in data anyway)
-            client.table(table_name).update(data).eq('id', existing_id).execute()
-            print(f"Successfully updated record in {table_name} with id {existing_id}")
-        else:
-            # Insert new record
-            client.table(table_name).insert(data).execute()
-            print(f"Successfully inserted into {table_name}")
-            
-    except Exception as e:
-        print(f"Error upserting into {table_name}: {e}")
-        raise e  # Re-raise exception to prevent silent failures in the pipeline
+def _conflict_keys(table_name: str, data: dict) -> list[str]:
+    if table_name in AUFMASS_CONFLICT_KEYS:
+        return ["user_id"] + AUFMASS_CONFLICT_KEYS[table_name]
+    # Tables not listed above: ID_LOD2, tags and every field ending in '_id' (needs a matching unique index as well)
+    keys = ["user_id", "ID_LOD2"] + (["tags"] if "tags" in data else [])
+    return keys + [key for key in data if key.endswith("_id") and key != "material_id"]
+
+def _insert_aufmass_objects(objects: list[Any], access_token: str = None):
+    """
+    Upserts (insert or update) several aufmass dataclass objects, e.g. all facades of a building or all results of a stage.
+    Objects of the same table are sent together in one request per batch (see Supabase_database/upsert.py) instead of
+    a select and an update/insert per object. Existing rows are updated if user, ID_LOD2 and all '*_id' fields (and tags) match.
+    """
+    if not access_token:
+        print("WARNING: No access token provided. Operation might fail due to RLS.")
+
+    rows_by_table = {}
+    for obj in objects:
+        table_name, data = _aufmass_row(obj)
+        if not table_name:
+            print(f"Error: Object {type(obj)} has no TABLE_NAME")
+            continue
+        rows_by_table.setdefault(table_name, []).append(data)
+
+    for table_name, rows in rows_by_table.items():
+        try:
+            requests = upsert_rows(table_name, rows, _conflict_keys(table_name, rows[0]), access_token)
+            print(f"Successfully upserted {len(rows)} record(s) into {table_name} ({requests} request(s))")
+        except Exception as e:
+            print(f"Error upserting into {table_name}: {e}")
+            raise e  # Re-raise exception to prevent silent failures in the pipeline
+
+def _insert_aufmass_object(obj: Any, access_token: str = None):
+    """
+    Required: The object to insert has to have a TABLE_NAME attribute, which is the name of the database table to insert the data into. 
+    Fits for all classes in the aufmassClasses.py file (except Gebaeude)
+    Generic insert function for aufmass dataclasses.
+    Gets the correct database table name from the object and upserts (insert or update) the data into the corresponding table.
+    Updates existing records if ID_LOD2 and all '*_id' fields match.
+    """
+    _insert_aufmass_objects([obj], access_token)
 
-def _upload_facade_image(obj: FacadeImage, file_path_or_bytes: str | bytes, access_token: str = None, content_type: str = None):
+def _upload_facade_image(obj: FacadeImage, file_path_or_bytes: str | bytes, access_token: str = None, content_type: str = None,
+                         extra_objects: list[Any] = None):
     """
     Uploads an image to the 'facade_images' bucket and creates a corresponding database entry.
     If storage_path is not set in the FacadeImage object, it will be automatically generated.
+    extra_objects (e.g. the Facade of the image) are upserted together with the image entry, after the upload succeeded.
     """
     client = get_user_client(access_token)
     
@@ -166,7 +184,7 @@ def _upload_facade_image(obj: FacadeImage, file_path_or_bytes: str | bytes, acce
         obj.public_url = public_url # Update object with real public URL
 
         # Insert DB Entry
-        _insert_aufmass_object(obj, access_token)
+        _insert_aufmass_objects([obj] + (extra_objects or []), access_token)
         
     except Exception as e:
         print(f"Error uploading image: {e}")
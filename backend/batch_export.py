@@ -0,0 +1,204 @@
+"""
+Batch export of building metrics for a whole (local) LOD2 tile.
+
+Runs the geometry part of the start_process() pipeline (building data extraction, repaired mesh, attached walls, volumes)
+for every building of a CityGML tile in worker processes and writes one row of metrics per building to a Parquet file.
+No geocoding, laser data or database access is involved.
+
+Usage:
+    python batch_export.py States_data_download/Bayern/LOD2/<tile>.gml -o metrics.parquet --workers 8
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from helpers.attachedWalls import roof_numbers, get_wall_adjacency, build_wall_adjacency
+from helpers.geomf import create_ground_surface_list, extract_building_data
+from helpers.polygon_array import PolygonArray
+from helpers.tile_cache import get_tile_cache_dir
+from helpers.volume_calc import calculate_volume
+
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+# define the namespace for the CityGML file (same as in handling.start_process)
+ns = {
+    'bldg': 'http://www.opengis.net/citygml/building/1.0',
+    'xAL' : 'urn:oasis:names:tc:ciq:xsdschema:xAL:2.0',
+    'gen' : 'http://www.opengis.net/citygml/generics/1.0',
+    'gml' : 'http://www.opengis.net/gml'
+}
+
+DIRECTIONS = ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]
+
+# Per worker process state, set once by _init_worker()
+_worker = {}
+
+
+def _peak_memory_mb():
+    # Peak resident set size of the current process in MB (None where the resource module is not available, e.g. on Windows)
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # ru_maxrss is in KB on Linux
+
+
+def _init_worker(gml_path, tile_cache_dir, verbose):
+    # Every worker parses the tile and loads its wall adjacency (written to the tile cache by the parent) once, and keeps them for all buildings it processes
+    xml_root = ET.parse(gml_path).getroot()
+    footprints = create_ground_surface_list(xml_root, ns)
+    adjacency = get_wall_adjacency(xml_root, ns, tile_cache_dir, footprints)
+    if adjacency is None: # no tile cache available
+        adjacency = build_wall_adjacency(xml_root, ns, footprints)
+    _worker["xml_root"] = xml_root
+    _worker["footprints"] = footprints
+    _worker["wall_adjacency"] = adjacency
+    _worker["tile_cache_dir"] = tile_cache_dir
+    _worker["verbose"] = verbose
+
+
+def building_metrics(building_id):
+    """
+    Runs the geometry pipeline for one building of the tile loaded by _init_worker() and returns a flat dict of metrics.
+    Errors are reported in the "error" column instead of stopping the whole export.
+    """
+    row = {"building_id": building_id, "error": None}
+    output = contextlib.nullcontext() if _worker["verbose"] else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            data = extract_building_data(_worker["xml_root"], None, building_id, ns, roof_numbers, _worker["tile_cache_dir"], _worker["footprints"],
+                                         wall_adjacency=_worker["wall_adjacency"])
+            if "Error" in data:
+                row["error"] = data["Error"]
+                return row
+            volumes = calculate_volume(data["Repaired_Geometry"], data["Roof_geometries"], data["Ground_area"], data["Height"], data["Roof_type_nr"])
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        return row
+
+    row.update({
+        "roof_type_nr": int(data["Roof_type_nr"]) if str(data["Roof_type_nr"]).isdigit() else None,
+        "roof_type_name": data["Roof_type_name"],
+        "roof_pitch_avg": float(data["Roof_pitch_avg"]),
+        "height": float(data["Height"]) if data["Height"] not in (None, "Not found") else None,
+        "eave_height": data["Eave_height"],
+        "storeys": float(data["Storeys"]) if data["Storeys"] not in (None, "Not found") else None,
+        "ground_area": data["Ground_area"],
+        "roof_area": data["Roof_area"],
+        "wall_surface_tot": float(data["Wall_surface_tot"]),
+        "bgf": data["BGF"],
+        "volume_model": float(volumes["volume_model"]),
+        "volume_basement": float(volumes["volume_basement"]),
+        "volume_attic": float(volumes["volume_attic"]),
+        "n_attached_neighbours": len(data["neighbour_lod2_ids"]),
+    })
+    for direction in DIRECTIONS:
+        row[f"facade_area_{direction}"] = float(data[f"Facade_area_{direction}"])
+    return row
+
+
+def _process_chunk(building_ids):
+    # Returns the metric rows plus the statistics of the worker that processed them
+    start = time.perf_counter()
+    rows = [building_metrics(building_id) for building_id in building_ids]
+    return rows, os.getpid(), time.perf_counter() - start, _peak_memory_mb()
+
+
+def attached_wall_metrics(adjacency):
+    """
+    Length and area of the attached walls of every building, from the overlap polygons of the per-tile wall adjacency.
+    The overlaps are vertical, so the diagonal of their XY bounding box is the horizontal length of the shared wall.
+    Returns {building_id: (length, area)}.
+    """
+    overlaps = PolygonArray(adjacency["overlap_coords"], adjacency["overlap_offsets"])
+    mins, maxs = overlaps.bounds()
+    lengths = np.nan_to_num(np.hypot(maxs[:, 0] - mins[:, 0], maxs[:, 1] - mins[:, 1]))
+    areas = overlaps.areas()
+    owner = adjacency["wall_building"][adjacency["wall_a"]]
+    n_buildings = len(adjacency["building_ids"])
+    length_sum = np.bincount(owner, weights=lengths, minlength=n_buildings)
+    area_sum = np.bincount(owner, weights=areas, minlength=n_buildings)
+    return {bid: (float(length_sum[i]), float(area_sum[i])) for i, bid in enumerate(adjacency["building_ids"].tolist())}
+
+
+def metrics_schema():
+    # Explicit column types, so failed buildings (only building_id and error) do not change the schema of the file
+    import pyarrow as pa
+    fields = [("building_id", pa.string()), ("error", pa.string()), ("roof_type_nr", pa.int64()), ("roof_type_name", pa.string())]
+    fields += [(name, pa.float64()) for name in ["roof_pitch_avg", "height", "eave_height", "storeys", "ground_area", "roof_area",
+                                                 "wall_surface_tot", "bgf", "volume_model", "volume_basement", "volume_attic"]]
+    fields += [("n_attached_neighbours", pa.int64())]
+    fields += [(f"facade_area_{direction}", pa.float64()) for direction in DIRECTIONS]
+    fields += [("attached_wall_length", pa.float64()), ("attached_wall_area", pa.float64())]
+    return pa.schema(fields)
+
+
+def export_tile(gml_path, output_path, workers=None, chunk_size=16, limit=None, verbose=False):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    # Shared per-tile data is computed once in the parent, so the workers only read it from the tile cache
+    tile_cache_dir = get_tile_cache_dir(gml_path)
+    xml_root = ET.parse(gml_path).getroot()
+    building_ids = [building.get("{http://www.opengis.net/gml}id") for building in xml_root.findall(".//bldg:Building", ns)]
+    if limit:
+        building_ids = building_ids[:limit]
+    adjacency = get_wall_adjacency(xml_root, ns, tile_cache_dir)
+    if adjacency is None: # no tile cache available
+        adjacency = build_wall_adjacency(xml_root, ns)
+    attached = attached_wall_metrics(adjacency)
+    del xml_root
+    print(f"Tile {os.path.basename(gml_path)}: {len(building_ids)} buildings, {workers} workers")
+
+    chunks = [building_ids[i:i + chunk_size] for i in range(0, len(building_ids), chunk_size)]
+    rows = []
+    worker_stats = {}
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(gml_path, tile_cache_dir, verbose)) as pool:
+        for chunk_rows, pid, busy_time, peak_memory in pool.imap_unordered(_process_chunk, chunks):
+            rows.extend(chunk_rows)
+            stats = worker_stats.setdefault(pid, {"buildings": 0, "busy_time": 0.0, "peak_memory_mb": None})
+            stats["buildings"] += len(chunk_rows)
+            stats["busy_time"] += busy_time
+            stats["peak_memory_mb"] = peak_memory
+            print(f"{len(rows)}/{len(building_ids)} buildings done", end="\r")
+    print()
+
+    # Deterministic output: same row order as the buildings in the tile
+    order = {building_id: i for i, building_id in enumerate(building_ids)}
+    rows.sort(key=lambda row: order[row["building_id"]])
+    for row in rows:
+        row["attached_wall_length"], row["attached_wall_area"] = attached.get(row["building_id"], (0.0, 0.0))
+    pq.write_table(pa.Table.from_pylist(rows, schema=metrics_schema()), output_path)
+
+    elapsed = time.perf_counter() - start
+    failed = sum(row["error"] is not None for row in rows)
+    print(f"Wrote {len(rows)} buildings ({failed} failed) to {output_path} in {elapsed:.1f} s: {len(rows) / elapsed:.1f} buildings/s")
+    for pid, stats in sorted(worker_stats.items()):
+        rate = stats["buildings"] / stats["busy_time"] if stats["busy_time"] > 0 else float("nan")
+        memory = f"{stats['peak_memory_mb']:.0f} MB" if stats["peak_memory_mb"] is not None else "n/a"
+        print(f"  worker {pid}: {stats['buildings']} buildings, {rate:.1f} buildings/s, peak memory {memory}")
+    return rows, worker_stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export building metrics of a local LOD2 tile to Parquet.")
+    parser.add_argument("gml_path", help="Path to the CityGML (LOD2) tile")
+    parser.add_argument("-o", "--output", help="Output Parquet file (default: <tile name>_metrics.parquet)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="Buildings per task sent to a worker")
+    parser.add_argument("--limit", type=int, default=None, help="Only process the first N buildings of the tile")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the output of the pipeline for every building")
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(os.path.basename(args.gml_path))[0]}_metrics.parquet"
+    export_tile(args.gml_path, output, args.workers, args.chunk_size, args.limit, args.verbose)
@@ -0,0 +1,114 @@
+"""
+Synthetic LOD2 and laser fixtures for the geometry benchmarks. Everything is generated from a fixed seed, so the benchmarks run offline
+and always see the same data.
+"""
+import numpy as np
+
+# Namespace of the CityGML files (same as in handling.start_process)
+ns = {
+    'bldg': 'http://www.opengis.net/citygml/building/1.0',
+    'xAL' : 'urn:oasis:names:tc:ciq:xsdschema:xAL:2.0',
+    'gen' : 'http://www.opengis.net/citygml/generics/1.0',
+    'gml' : 'http://www.opengis.net/gml'
+}
+
+# Somewhere in UTM zone 32, so coordinates have realistic magnitudes
+ORIGIN_E = 690000.0
+ORIGIN_N = 5330000.0
+
+
+def gable_row(x0, y0, segment_widths, depth, eave_height, ridge_height):
+    """
+    Surfaces of one building with a continuous gable roof over several segments (e.g. a long terraced house or a building complex).
+    All segments share their vertices, so the surfaces form a closed shell. The number of surfaces grows linearly with the number of segments.
+    Returns (walls, roofs, ground) as lists of [(x, y, z), ...] rings.
+    """
+    xs = np.concatenate([[x0], x0 + np.cumsum(segment_widths)]).tolist()
+    y1 = y0 + depth
+    ym = y0 + depth / 2
+    h, r = eave_height, eave_height + ridge_height
+    walls, roofs = [], []
+    for xa, xb in zip(xs[:-1], xs[1:]):
+        walls.append([(xa, y0, 0.0), (xb, y0, 0.0), (xb, y0, h), (xa, y0, h)]) # front
+        walls.append([(xb, y1, 0.0), (xa, y1, 0.0), (xa, y1, h), (xb, y1, h)]) # back
+        roofs.append([(xa, y0, h), (xb, y0, h), (xb, ym, r), (xa, ym, r)])
+        roofs.append([(xb, y1, h), (xa, y1, h), (xa, ym, r), (xb, ym, r)])
+    # gable ends
+    walls.append([(xs[-1], y0, 0.0), (xs[-1], y1, 0.0), (xs[-1], y1, h), (xs[-1], ym, r), (xs[-1], y0, h)])
+    walls.append([(xs[0], y1, 0.0), (xs[0], y0, 0.0), (xs[0], y0, h), (xs[0], ym, r), (xs[0], y1, h)])
+    # ground surface (pointing down), with all segment vertices so it shares its edges with the walls
+    ground = [[(xs[0], y0, 0.0)] + [(x, y1, 0.0) for x in xs] + [(x, y0, 0.0) for x in xs[::-1][:-1]]]
+    return walls, roofs, ground
+
+
+def building(n_segments, seed=0):
+    # One building with n_segments gable segments, as (walls, roofs, ground, ground_middle)
+    rng = np.random.default_rng(seed)
+    walls, roofs, ground = gable_row(ORIGIN_E, ORIGIN_N, rng.uniform(5, 9, n_segments), rng.uniform(9, 12), rng.uniform(5, 8), rng.uniform(2, 4))
+    ground_middle = np.mean(ground[0], axis=0)
+    return walls, roofs, ground, ground_middle
+
+
+def _pos_list(ring):
+    return " ".join(f"{c:.3f}" for p in ring for c in p)
+
+
+def _building_xml(building_id, walls, roofs, ground, eave_height, height):
+    surfaces = "".join(f"<bldg:boundedBy><bldg:WallSurface><gml:posList>{_pos_list(w)}</gml:posList></bldg:WallSurface></bldg:boundedBy>" for w in walls)
+    surfaces += "".join(f"<bldg:boundedBy><bldg:RoofSurface><gml:posList>{_pos_list(r)}</gml:posList></bldg:RoofSurface></bldg:boundedBy>" for r in roofs)
+    surfaces += "".join(f"<bldg:boundedBy><bldg:GroundSurface><gml:posList>{_pos_list(g)}</gml:posList></bldg:GroundSurface></bldg:boundedBy>" for g in ground)
+    attributes = (f'<gen:stringAttribute name="HoeheDach"><gen:value>{height}</gen:value></gen:stringAttribute>'
+                  f'<gen:stringAttribute name="HoeheGrund"><gen:value>0</gen:value></gen:stringAttribute>'
+                  f'<gen:stringAttribute name="NiedrigsteTraufeDesGebaeudes"><gen:value>{eave_height}</gen:value></gen:stringAttribute>'
+                  f'<bldg:roofType>3100</bldg:roofType><bldg:measuredHeight>{height}</bldg:measuredHeight><bldg:storeysAboveGround>2</bldg:storeysAboveGround>')
+    return f'<cityObjectMember><bldg:Building gml:id="{building_id}">{attributes}{surfaces}</bldg:Building></cityObjectMember>'
+
+
+def tile(n_buildings, houses_per_row=25, seed=0):
+    """
+    CityGML (LOD2) tile as string: rows of terraced houses, some attached to their neighbours, some with small gaps.
+    Returns (xml_string, building_ids).
+    """
+    rng = np.random.default_rng(seed)
+    members, building_ids = [], []
+    for k in range(n_buildings):
+        row, col = divmod(k, houses_per_row)
+        if col == 0:
+            x = ORIGIN_E
+        width, depth = rng.uniform(6, 10), rng.uniform(8, 12)
+        eave_height, ridge_height = rng.uniform(5, 9), rng.uniform(2, 4)
+        walls, roofs, ground = gable_row(x, ORIGIN_N + row * 25 + rng.uniform(-1, 1), [width], depth, eave_height, ridge_height)
+        building_id = f"DEBY_LOD2_{k:06d}"
+        members.append(_building_xml(building_id, walls, roofs, ground, eave_height, eave_height + ridge_height))
+        building_ids.append(building_id)
+        x += width + rng.choice([0.0, 0.0, 0.0, 0.5, 3.0])
+    header = '<CityModel xmlns="http://www.opengis.net/citygml/1.0" ' + " ".join(f'xmlns:{k}="{v}"' for k, v in ns.items()) + '>'
+    return header + "".join(members) + "</CityModel>", building_ids
+
+
+def laser_points(roofs, ground, n_points, seed=0):
+    """
+    Synthetic laser scan of a building: points on the roof planes (with noise), some roof extrusions (chimneys, dormers) above the roof
+    and points on the surrounding ground. Returns an (n_points, 3) array.
+    """
+    rng = np.random.default_rng(seed)
+    ground_xy = np.array(ground[0])[:, :2]
+    (x_min, y_min), (x_max, y_max) = ground_xy.min(axis=0), ground_xy.max(axis=0)
+    n_roof = int(n_points * 0.8)
+    n_extrusion = int(n_points * 0.05)
+    n_ground = n_points - n_roof - n_extrusion
+
+    # Roof points: sample the XY footprint and lift to the roof plane of the surface above (the roofs are gable halves)
+    roof_arrays = [np.array(r) for r in roofs]
+    xy = rng.uniform([x_min, y_min], [x_max, y_max], size=(n_roof + n_extrusion, 2))
+    z = np.zeros(len(xy))
+    for r in roof_arrays:
+        (rx0, ry0), (rx1, ry1) = r[:, :2].min(axis=0), r[:, :2].max(axis=0)
+        inside = (xy[:, 0] >= rx0) & (xy[:, 0] <= rx1) & (xy[:, 1] >= ry0) & (xy[:, 1] <= ry1)
+        a, b, c = np.linalg.lstsq(np.c_[r[:, 0], r[:, 1], np.ones(len(r))], r[:, 2], rcond=None)[0]
+        z[inside] = a * xy[inside, 0] + b * xy[inside, 1] + c
+    z += rng.normal(0, 0.03, len(z))
+    z[n_roof:] += rng.uniform(0.5, 1.5, n_extrusion) # extrusions
+
+    ground_points = np.c_[rng.uniform([x_min - 10, y_min - 10], [x_max + 10, y_max + 10], size=(n_ground, 2)), rng.normal(0, 0.05, n_ground)]
+    return np.vstack([np.c_[xy, z], ground_points])
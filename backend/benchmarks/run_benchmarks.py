@@ -0,0 +1,206 @@
+"""
+Micro-benchmarks of the hot geometry functions, on synthetic fixtures of increasing size (see fixtures.py).
+Measures the run time (median of several repeats) and the peak memory (tracemalloc, separate run) of every case.
+
+Run from the backend folder:
+    python -m benchmarks.run_benchmarks                       # run and compare against benchmarks/baseline.json (if it exists)
+    python -m benchmarks.run_benchmarks --save-baseline       # run and store the results as new baseline
+    python -m benchmarks.run_benchmarks -k repair --quick     # only cases containing "repair", fewer repeats
+
+Exits with 1 if a case got slower / uses more memory than the baseline by more than the thresholds.
+Timings depend on the machine, so the baseline has to be created on the machine (or CI runner) the comparison runs on.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from benchmarks import fixtures
+from helpers.attachedWalls import subtract_attached_walls, build_wall_adjacency, building_reference_point
+from helpers.geometry_helpers import calculate_external_wall_properties, parse_wall_surfaces
+from helpers.geomf import create_ground_surface_list, filter_roof_extrusion
+from helpers.laserf import filter_points_by_location
+from helpers.repair_geometry import repair_geometry
+from helpers.volume_calc import calculate_volume
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Sizes of the fixtures. Per-building functions scale with the number of gable segments of the building,
+# the attached wall detection with the number of buildings in the tile, the laser functions with the number of points.
+SEGMENTS = [2, 8, 32]
+TILE_SIZES = [50, 200, 800]
+POINT_COUNTS = [2_000, 10_000, 40_000]
+
+
+def _quiet(fn):
+    # The pipeline functions print a lot, which would distort the timings
+    def wrapper(*args):
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            return fn(*args)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    return wrapper
+
+
+def _tile_case(n_buildings, with_adjacency):
+    xml, building_ids = fixtures.tile(n_buildings)
+    xml_root = ET.fromstring(xml)
+    footprints = create_ground_surface_list(xml_root, fixtures.ns)
+    building_id = building_ids[len(building_ids) // 2 + 3] # somewhere in the middle of a row
+    building = next(b for b in xml_root.findall(".//bldg:Building", fixtures.ns) if b.get("{http://www.opengis.net/gml}id") == building_id)
+    walls = parse_wall_surfaces(building, fixtures.ns)
+    adjacency = build_wall_adjacency(xml_root, fixtures.ns, footprints) if with_adjacency else None
+    return (walls, xml_root, fixtures.ns, building_reference_point(building, fixtures.ns), building_id, footprints, adjacency)
+
+
+def _repaired(n_segments):
+    walls, roofs, ground, middle = fixtures.building(n_segments)
+    return _quiet(repair_geometry)(walls, roofs, ground, middle)
+
+
+def benchmark_cases():
+    """
+    Returns the list of benchmark cases: (name, setup, run). setup() builds the arguments (not measured), run(*args) is measured.
+    """
+    cases = []
+    for n in POINT_COUNTS:
+        def setup(n=n):
+            walls, roofs, ground, _ = fixtures.building(4)
+            return (fixtures.laser_points(roofs, ground, n), ground, 0.5)
+        cases.append((f"filter_points_by_location[{n}]", setup, filter_points_by_location))
+
+        def setup(n=n):
+            walls, roofs, ground, _ = fixtures.building(4)
+            return (roofs, fixtures.laser_points(roofs, ground, n), 0.18)
+        cases.append((f"filter_roof_extrusion[{n}]", setup, filter_roof_extrusion))
+
+    for n in TILE_SIZES:
+        cases.append((f"subtract_attached_walls[{n}]", lambda n=n: _tile_case(n, False), _quiet(subtract_attached_walls)))
+        cases.append((f"subtract_attached_walls_adjacency[{n}]", lambda n=n: _tile_case(n, True), _quiet(subtract_attached_walls)))
+        cases.append((f"build_wall_adjacency[{n}]", lambda n=n: (ET.fromstring(fixtures.tile(n)[0]), fixtures.ns), build_wall_adjacency))
+
+    for n in SEGMENTS:
+        cases.append((f"repair_geometry[{n}]", lambda n=n: fixtures.building(n), _quiet(repair_geometry)))
+
+        def setup(n=n):
+            repaired = _repaired(n)
+            return (repaired["wall_surface_geometries"], repaired["mesh"])
+        cases.append((f"calculate_external_wall_properties[{n}]", setup, calculate_external_wall_properties))
+
+        def setup(n=n):
+            repaired = _repaired(n)
+            surfaces = {"wall": repaired["wall_surface_geometries"], "roof": repaired["roof_surface_geometries"], "ground": repaired["ground_surface_shape"]}
+            ground_area = 0.5 * abs(np.linalg.norm(np.sum(np.cross(np.array(surfaces["ground"][0]), np.roll(np.array(surfaces["ground"][0]), -1, axis=0)), axis=0)))
+            return (surfaces, surfaces["roof"], ground_area, 10.0, "3100")
+        cases.append((f"calculate_volume[{n}]", setup, _quiet(calculate_volume)))
+    return cases
+
+
+def measure(setup, run, repeats, min_time):
+    """
+    Runs one case: the median and minimum time over at least `repeats` runs (more for fast cases, until min_time seconds are spent),
+    and the peak memory allocated during one extra run, measured with tracemalloc.
+    """
+    args = setup()
+    run(*args) # warm-up (imports, caches)
+    times = []
+    start = time.perf_counter()
+    while len(times) < repeats or (time.perf_counter() - start < min_time and len(times) < 1000):
+        gc.collect()
+        t0 = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_s": statistics.median(times), "min_s": min(times), "runs": len(times), "peak_mb": peak / 2**20}
+
+
+def compare(results, baseline, time_threshold, memory_threshold):
+    """
+    Returns the list of regressions: cases that are slower than the baseline median by more than time_threshold (relative)
+    or use more memory than the baseline by more than memory_threshold. Tiny absolute differences (noise) are ignored.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["median_s"] > base["median_s"] * (1 + time_threshold) and result["median_s"] - base["median_s"] > 0.002:
+            regressions.append(f"{name}: time {base['median_s'] * 1000:.2f} ms -> {result['median_s'] * 1000:.2f} ms")
+        if result["peak_mb"] > base["peak_mb"] * (1 + memory_threshold) and result["peak_mb"] - base["peak_mb"] > 1.0:
+            regressions.append(f"{name}: peak memory {base['peak_mb']:.1f} MB -> {result['peak_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the geometry pipeline functions.")
+    parser.add_argument("-k", "--filter", default=None, help="Only run cases whose name contains this string")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file to compare against / to write")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as new baseline instead of comparing")
+    parser.add_argument("--time-threshold", type=float, default=0.25, help="Allowed relative slowdown before failing (default 0.25 = 25%%)")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="Allowed relative increase of peak memory (default 0.25)")
+    parser.add_argument("--repeats", type=int, default=5, help="Minimum number of timed runs per case")
+    parser.add_argument("--quick", action="store_true", help="Only 2 timed runs per case")
+    parser.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    repeats = 2 if args.quick else args.repeats
+    min_time = 0.0 if args.quick else 0.5
+    results = {}
+    for name, setup, run in benchmark_cases():
+        if args.filter and args.filter not in name:
+            continue
+        result = measure(setup, run, repeats, min_time)
+        results[name] = result
+        print(f"{name:<48} {result['median_s'] * 1000:>10.2f} ms (min {result['min_s'] * 1000:.2f} ms, {result['runs']} runs) {result['peak_mb']:>8.2f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline found at {args.baseline}, create one with --save-baseline.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+    if regressions:
+        print("\nRegressions compared to the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions compared to the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Round trips and latency of the Supabase client layer, measured against a local stand-in for PostgREST / Storage
+(no Supabase project needed).
+
+Simulates handler calls the way the backend makes them: every call creates a user client with get_user_client() and
+runs one query. Compares the previous client layer (a new supabase Client, and with it a new HTTP session, per call)
+with the pooled one in Supabase_database/client.py. The stand-in counts the TCP connections it accepts, so the
+number of handshakes per call is visible next to the latency.
+
+Run from the backend folder:
+    python -m benchmarks.supabase_client --calls 500 --threads 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    # Keep-alive HTTP/1.1 server answering every PostgREST / Storage request with a small JSON body
+    protocol_version = "HTTP/1.1"
+    counts = {"connections": 0, "requests": 0}
+    lock = threading.Lock()
+    body = b'[{"ID_LOD2": "DEBY_LOD2_TEST", "geom": null}]'
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            self.counts["connections"] += 1
+
+    def _answer(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        with self.lock:
+            self.counts["requests"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    do_GET = do_POST = do_PATCH = do_HEAD = _answer
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _old_user_client(access_token):
+    # Client layer before the shared connection pool: a complete supabase Client per call
+    from supabase import create_client
+    from Supabase_database import client as client_module
+    supabase = create_client(client_module.SUPABASE_URL, client_module.SUPABASE_ANON_KEY)
+    supabase.postgrest.auth(access_token)
+    supabase.options.headers["Authorization"] = f"Bearer {access_token}"
+    return supabase
+
+
+def _measure(get_client, calls, threads):
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        get_client("benchmark-token").table("buildings").select("ID_LOD2, geom").eq("ID_LOD2", "DEBY_LOD2_TEST").execute()
+        latencies.append(time.perf_counter() - start)
+
+    before = dict(_StandIn.counts)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(one, range(calls)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "calls_s": calls / elapsed,
+        "connections": _StandIn.counts["connections"] - before["connections"],
+        "requests": _StandIn.counts["requests"] - before["requests"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supabase client layer against a local PostgREST stand-in.")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--port", type=int, default=18110)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), _StandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    from Supabase_database import client as client_module
+    client_module.SUPABASE_URL = f"http://127.0.0.1:{args.port}"
+    # create_client() only accepts JWT shaped keys
+    client_module.SUPABASE_ANON_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark"
+
+    try:
+        print(f"{args.calls} calls, {args.threads} threads")
+        print(f"{'':<34}{'p50':>10}{'p95':>10}{'calls/s':>10}{'connections':>13}{'requests':>10}")
+        for name, get_client in [("new supabase Client per call", _old_user_client), ("pooled get_user_client", client_module.get_user_client)]:
+            _measure(get_client, args.threads, args.threads) # warm-up
+            result = _measure(get_client, args.calls, args.threads)
+            print(f"{name:<34}{result['p50_ms']:>8.2f}ms{result['p95_ms']:>8.2f}ms{result['calls_s']:>10.0f}"
+                  f"{result['connections']:>13}{result['requests']:>10}")
+    finally:
+        client_module.close_http_client()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
-from helpers.addressf import get_coords, find_building_by_point, convert_utm_to_lat_long, get_utm_zone
+from helpers.addressf import get_coords, find_building_by_point, convert_utm_to_lat_long, get_utm_zone, latlon_to_utm
+from helpers.tile_cache import get_tile_cache_dir, get_tile_version
+from helpers.attachedWalls import get_wall_adjacency
+from helpers.result_cache import parsed_tiles, laser_tiles, building_results, laser_results
 from helpers.geomf import download_LOD2_file, create_ground_surface_list, extract_building_data, filter_roof_extrusion, group_extrusions, model_extrusion_footprints, extrude_footprints
 from helpers.laserf import download_laser_file, filter_points_by_location
 import laspy
@@ -6,9 +9,72 @@ import numpy as np
 import xml.etree.ElementTree as ET
 from geopy.geocoders import Nominatim
 from typing import Any
-import utm
 from helpers.volume_calc import calculate_volume
 
+
+def parse_tile(gml_path, ns):
+    # Parsed LOD2 tile with the footprints of all buildings, the cache directory of this tile version and the wall adjacency of the tile
+    print(gml_path)
+    xml_root = ET.parse(gml_path).getroot()
+    footprints = create_ground_surface_list(xml_root, ns)
+    tile_cache_dir = get_tile_cache_dir(gml_path)
+    return xml_root, footprints, tile_cache_dir, get_wall_adjacency(xml_root, ns, tile_cache_dir, footprints)
+
+
+def read_laser_building_points(laser_path, classification):
+    # Points of the laser tile classified as building: xyz, return number and number of returns
+    las = laspy.read(laser_path, laz_backend=laspy.LazBackend.Laszip)
+    #print(f"Laserscan classifications in dataset: {np.unique(las.classification)}")
+    building_points_mask = np.asarray(las.classification) == classification # Building data points are often classified differently for each state
+    return las.xyz[building_points_mask], np.asarray(las.return_number)[building_points_mask], np.asarray(las.number_of_returns)[building_points_mask]
+
+
+def building_stage(xml_root, street, nr, bldg_id, ns, roof_numbers, tile_cache_dir, footprints, tile_version, gml_path=None, wall_adjacency=None):
+    # Building data and volumes of the selected building(s), only depends on the tile and the selection
+    building_properties = extract_building_data(xml_root, f"{street} {nr}", bldg_id, ns, roof_numbers, tile_cache_dir, footprints, tile_version, gml_path, wall_adjacency)
+
+    # Calculate the volume of the building: Volume of the 3D Model (With Attic, without basement), only the basement volume and the attic volume.
+    volumes = calculate_volume(
+        building_properties["Repaired_Geometry"], building_properties["Roof_geometries"], 
+        building_properties["Ground_area"], building_properties["Height"], building_properties["Roof_type_nr"])
+    
+    building_properties = dict(building_properties) # may be the cached dict of a single building part, don't modify it
+    building_properties["volume_model"] = volumes["volume_model"]
+    building_properties["volume_basement"] = volumes["volume_basement"]
+    building_properties["volume_attic"] = volumes["volume_attic"]
+    return building_properties
+
+
+def laser_stage(building_xyz, return_numbers, num_returns, building_properties):
+    # Laser points and roof extrusions of the selected building(s)
+    # Filter by points that are inside the ground surface (within a certain tolerance)
+    in_groundsurface_mask = filter_points_by_location(building_xyz, building_properties["Ground_area_geometry"], 0.5)
+    filtered_points_xyz = building_xyz[in_groundsurface_mask]
+
+    # Separate single and multi returns ---
+    return_numbers = return_numbers[in_groundsurface_mask]
+    num_returns = num_returns[in_groundsurface_mask]
+
+    single_returns_mask = (return_numbers == 1) & (num_returns == 1)
+    multi_returns_mask = (num_returns > 1)
+
+    Points_single = filtered_points_xyz[single_returns_mask]
+    Points_multi = filtered_points_xyz[multi_returns_mask]
+
+    Points_roof_extrusions = filter_roof_extrusion(building_properties["Roof_geometries"], Points_single, 0.18)
+    Points_roof_extrusions_grouped = group_extrusions(Points_roof_extrusions, 0.45)
+    roof_Extrusion_tops = model_extrusion_footprints(Points_roof_extrusions_grouped, 1.0, True)
+    roof_extrusions = extrude_footprints(roof_Extrusion_tops, building_properties["Roof_geometries"])
+
+    return {
+        "Points_single": Points_single,
+        "Points_multi": Points_multi,
+        "Points_roof_extrusions": Points_roof_extrusions_grouped,
+        "Extrusion_tops": roof_Extrusion_tops,
+        "Extrusion_walls": roof_extrusions,
+    }
+
+
 def start_process(coordinates: list[float], street: str, nr: str, city: str, state: str, country: str, get_laser_data:bool, ID_LOD2_list: list[str] | None = None):
     print(f"Starting process for address: {street} {nr}, {city}, {state}, {country} at coordinates: {coordinates}")
     # Kicks off the Building model extraction & processing pipeline. 
@@ -64,7 +130,7 @@ def start_process(coordinates: list[float], street: str, nr: str, city: str, sta
     
     # Get coordinates in UTM format and download the CityGML file
     zone_nr = get_utm_zone(state)
-    coords = utm.from_latlon(coordinates[1], coordinates[0], force_zone_number=zone_nr, force_zone_letter='N')
+    coords = latlon_to_utm(coordinates[1], coordinates[0], zone_nr)
     e, n, *_ = coords
 
     gml_path = download_LOD2_file(state, e, n)
@@ -80,12 +146,11 @@ def start_process(coordinates: list[float], street: str, nr: str, city: str, sta
     else:
         laser_path = None
     
-    print(gml_path)
-    tree = ET.parse(gml_path)
-    xml_root = tree.getroot()
+    # Parse the tile once per tile version, repeated requests (e.g. a changed selection) reuse it
+    tile_version = get_tile_version(gml_path)
+    xml_root, footprints, tile_cache_dir, wall_adjacency = parsed_tiles.get_or_compute((gml_path, tile_version), lambda: parse_tile(gml_path, ns))
 
     # Find the building by the coordinates
-    footprints = create_ground_surface_list(xml_root, ns)
     print("List of LOD2 ids found: ", ID_LOD2_list)
     if ID_LOD2_list:
         bldg_id = ID_LOD2_list
@@ -97,25 +162,19 @@ def start_process(coordinates: list[float], street: str, nr: str, city: str, sta
         return
 
     # Extract the building data from the CityGML file (LOD2 File) - also works for multiple buildings
-    building_properties: dict[str, Any] = extract_building_data(xml_root, f"{street} {nr}", bldg_id, ns, roof_numbers)
+    # Cached per tile version and selection, the data of the single buildings is cached separately (see extract_building_data)
+    selection = tuple(bldg_id) if isinstance(bldg_id, list) else (bldg_id,)
+    building_properties: dict[str, Any] = building_results.get_or_compute((tile_version, selection), lambda: building_stage(
+        xml_root, street, nr, bldg_id, ns, roof_numbers, tile_cache_dir, footprints, tile_version, gml_path, wall_adjacency))
     # If bldg_id is a list, now continue only with the first element - makes assigning results in the database easier
     if isinstance(bldg_id, list):
         bldg_id = bldg_id[0]
 
-    # Calculate the volume of the building: Volume of the 3D Model (With Attic, without basement), only the basement volume and the attic volume.
-    volumes = calculate_volume(
-        building_properties["Triangulated_Geometry"], building_properties["Mesh"], building_properties["Roof_geometries"], 
-        building_properties["Ground_area"], building_properties["Height"], building_properties["Roof_type_nr"])
-    
-    building_properties["volume_model"] = volumes["volume_model"]
-    building_properties["volume_basement"] = volumes["volume_basement"]
-    building_properties["volume_attic"] = volumes["volume_attic"]
-
     # Format results string to display in the GUI, exclude information that is not relevant for the user right now.
-    excluded_keys = {"Wall_centers", "Ground_area_middle", "Address", "Wall_geometries", "Roof_geometries", "Ground_area_geometry", "coordinates", "facade_N", "facade_NE", "facade_E", "facade_SE", "facade_S", "facade_SW", "facade_W", "facade_NW"}
+    excluded_keys = {"Wall_centers", "Ground_area_middle", "Address", "Wall_geometries", "Roof_geometries", "Ground_area_geometry", "Repaired_Geometry", "coordinates", "facade_N", "facade_NE", "facade_E", "facade_SE", "facade_S", "facade_SW", "facade_W", "facade_NW"}
     lines = [f"{k}: {v}" for k, v in building_properties.items() if k not in excluded_keys]
     display_text = f"Adresse: {street} {nr}, {city}, {state}, {country}\nMaßeinheit: Meter\n\n" + "\n".join(lines)
-    result_dict = building_properties
+    result_dict = dict(building_properties) # the cached building properties stay unchanged
     result_dict["Street"] = street
     result_dict["House_number"] = nr
     result_dict["City"] = city
@@ -123,51 +182,24 @@ def start_process(coordinates: list[float], street: str, nr: str, city: str, sta
     result_dict["Country"] = country
     result_dict["Display_text"] = display_text
     zone_nr = get_utm_zone(state)
-    result_dict["coordinates"] = convert_utm_to_lat_long(coords)
+    lon_lat = convert_utm_to_lat_long(coords)
+    result_dict["coordinates"] = lon_lat
     result_dict["ID_LOD2"] = bldg_id
-    result_dict["Coordinates_N"] = convert_utm_to_lat_long(coords)[1]
-    result_dict["Coordinates_E"] = convert_utm_to_lat_long(coords)[0]
+    result_dict["Coordinates_N"] = lon_lat[1]
+    result_dict["Coordinates_E"] = lon_lat[0]
 
     # Get the laser scan points of type building in the correct area
     if laser_path and get_laser_data == True and laser_exists[state]==True:
-        las = laspy.read(laser_path, laz_backend=laspy.LazBackend.Laszip)
-        #print(f"Laserscan classifications in dataset: {np.unique(las.classification)}")
-        all_points = las.xyz
-        building_points_mask = las.classification == laser_building_classification[state] # Building data points are often classified differently for each state
-        building_points = las.points[building_points_mask]
-        building_xyz = all_points[building_points_mask]
-
-        # Filter by points that are inside the ground surface (within a certain tolerance)
-        in_groundsurface_mask = filter_points_by_location(building_xyz, building_properties["Ground_area_geometry"], 0.5)
-        filtered_points_xyz = building_xyz[in_groundsurface_mask]
-        filtered_points = building_points[in_groundsurface_mask]
-
-        # Separate single and multi returns ---
-        return_numbers = filtered_points['return_number']
-        num_returns = filtered_points['number_of_returns']
-
-        single_returns_mask = (np.asarray(return_numbers) == 1) & (np.asarray(num_returns) == 1)
-        multi_returns_mask = (np.asarray(num_returns) > 1)
-
-        Points_single = filtered_points_xyz[single_returns_mask]
-        Points_multi = filtered_points_xyz[multi_returns_mask]
-
-        Points_roof_extrusions = filter_roof_extrusion(building_properties["Roof_geometries"], Points_single, 0.18)
-        Points_roof_extrusions_grouped = group_extrusions(Points_roof_extrusions, 0.45)
-        roof_Extrusion_tops = model_extrusion_footprints(Points_roof_extrusions_grouped, 1.0, True)
-        roof_extrusions = extrude_footprints(roof_Extrusion_tops, building_properties["Roof_geometries"])
-
-        result_dict["Points_single"] = Points_single
-        result_dict["Points_multi"] = Points_multi
-        result_dict["Points_roof_extrusions"] = Points_roof_extrusions_grouped
-        result_dict["Extrusion_tops"] = roof_Extrusion_tops
-        result_dict["Extrusion_walls"] = roof_extrusions
+        # Only this stage runs again when the laser data is switched on for an already processed building
+        laser_version = get_tile_version(laser_path)
+        classification = laser_building_classification[state]
+        laser_data = laser_results.get_or_compute((tile_version, laser_version, selection), lambda: laser_stage(
+            *laser_tiles.get_or_compute((laser_path, laser_version, classification), lambda: read_laser_building_points(laser_path, classification)),
+            building_properties))
+        result_dict.update(laser_data)
 
     else:
         "No laser scan file found"
-        Points_single = None
-        Points_multi = None
-
         result_dict["Points_single"] = None
         result_dict["Points_multi"] = None
         result_dict["Points_roof_extrusions"] = None
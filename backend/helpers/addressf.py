@@ -1,10 +1,13 @@
+from functools import lru_cache
 from geopy.geocoders import Nominatim
 from shapely.geometry import Point
-import utm
+import numpy as np
 from .states_utm_zones import get_utm_zone
 import pyproj
 from .geometry_helpers import polygon_area_3d
 
+WGS84_EPSG = 4326
+
 # Initialize the geocoder
 loc = Nominatim(user_agent="my_app")
 
@@ -23,7 +26,7 @@ def get_coords(state, address):
             print("Longitude =", getLoc.longitude)
             # Convert the latitude and longitude to UTM
             zone_nr = get_utm_zone(state)
-            utm_coords = utm.from_latlon(getLoc.latitude, getLoc.longitude, force_zone_number=zone_nr, force_zone_letter='N')
+            utm_coords = latlon_to_utm(getLoc.latitude, getLoc.longitude, zone_nr)
             
             utm_easting, utm_northing, utm_zone_number, utm_zone_letter = utm_coords
 
@@ -39,13 +42,38 @@ def get_coords(state, address):
         print(f"Error geocoding address: {e}")
         return None
 
+def utm_epsg(zone_nr):
+    # EPSG code of the northern WGS84 / UTM zone, e.g. 32632 for zone 32
+    return 32600 + int(zone_nr)
+
+@lru_cache(maxsize=None)
+def get_transformer(src_epsg, dst_epsg):
+    # Building a pyproj Transformer is expensive, so there is only one per (source EPSG, target EPSG), always in (x, y) = (easting/lon, northing/lat) order
+    return pyproj.Transformer.from_crs(src_epsg, dst_epsg, always_xy=True)
+
+def latlon_to_utm(lat, lon, zone_nr):
+    # Same result format as utm.from_latlon(..., force_zone_number=zone_nr, force_zone_letter='N'): (easting, northing, zone number, zone letter)
+    easting, northing = get_transformer(WGS84_EPSG, utm_epsg(zone_nr)).transform(lon, lat)
+    return easting, northing, int(zone_nr), 'N'
+
 def convert_utm_to_lat_long(utm_coords):
-    utm_zone = utm_coords[2]
-    utm_crs = pyproj.CRS(f"+proj=utm +zone={utm_zone} +datum=WGS84 +units=m +no_defs +type=crs")
-    wgs84_crs = pyproj.CRS("EPSG:4326")
-    transformer = pyproj.Transformer.from_crs(utm_crs, wgs84_crs, always_xy=True)
-    lat, lon = transformer.transform(utm_coords[0], utm_coords[1])
-    return lat, lon
+    # utm_coords: (easting, northing, zone number, ...). Returns (lon, lat).
+    lon, lat = utm_to_wgs84([utm_coords[0], utm_coords[1]], utm_coords[2])
+    return float(lon), float(lat)
+
+def utm_to_wgs84(points, zone_nr):
+    """
+    Transforms a whole array of UTM coordinates (footprints, point clouds, ...) to WGS84 in one vectorized call.
+    points: array-like of shape (..., 2) or (..., 3), the first two columns are easting and northing. Further columns (height) are kept as they are.
+    Returns an array of the same shape with lon, lat in the first two columns.
+    """
+    points = np.array(points, dtype=float)
+    if points.size == 0:
+        return points
+    lon, lat = get_transformer(utm_epsg(zone_nr), WGS84_EPSG).transform(points[..., 0], points[..., 1])
+    points[..., 0] = lon
+    points[..., 1] = lat
+    return points
 
 def find_building_by_point(x, y, bldg_footprints):
     point = Point(x, y)
@@ -1,10 +1,13 @@
 from typing import List, Dict, Set, Tuple, Optional
 import numpy as np
 import xml.etree.ElementTree as ET
+import shapely
+from shapely import STRtree
 from shapely.geometry import Point
-from helpers.geometry_helpers import polygon_area_3d, extract_neighbour_geom, compute_wall_angle
-import copy
+from helpers.geometry_helpers import extract_neighbour_geom, parse_wall_surfaces
 from shapely.geometry import Polygon as ShapelyPolygon
+from helpers.polygon_array import PolygonArray, as_polygon_array
+from helpers.tile_cache import load_tile_arrays, save_tile_arrays
 
 roof_types = {
     "Flachdach": 1000,
@@ -27,6 +30,11 @@ roof_types = {
 # Reverse mapping: Number → Roof type
 roof_numbers = {v: k for k, v in roof_types.items()}
 
+# parameters for the identification of attached walls
+BUILDING_SEARCH_RADIUS = 30 # in meters
+ANGLE_TOLERANCE = 3 # tolerance for the angle difference between attached walls in degrees
+DISTANCE_TOLERANCE = 1.5 # tolerance for the distance between attached walls in meters
+
 def find_neighbouring_buildings(x, y, bldg_footprints, id_lod2, building_search_radius):
     point = Point(x, y)
     
@@ -40,6 +48,133 @@ def find_neighbouring_buildings(x, y, bldg_footprints, id_lod2, building_search_
 
     return building_ids
 
+def _first_three_points(walls) -> np.ndarray:
+    # First three points of every wall, shape (n, 3, 3). Walls with fewer than 3 vertices have no plane and get NaN.
+    walls = as_polygon_array(walls)
+    points = np.full((len(walls), 3, 3), np.nan)
+    enough = walls.lengths >= 3
+    if enough.any():
+        points[enough] = walls.select(enough).first_points(3)
+    return points
+
+def compute_wall_angles(walls) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized version of the angle computation in compute_wall_angle() for a list of walls (or a PolygonArray).
+    Uses the first three points of each wall, the normals are projected onto the XY plane (walls are assumed to be vertical).
+    Returns the angles to north in degrees, shape (n,), and the normalized normals, shape (n, 3). Degenerate walls get NaN.
+    """
+    walls = as_polygon_array(walls)
+    if len(walls) == 0:
+        return np.empty(0), np.empty((0, 3))
+    first_points = _first_three_points(walls) # (n, 3, 3)
+    normals = np.cross(first_points[:, 1] - first_points[:, 0], first_points[:, 2] - first_points[:, 0])
+    normals[:, 2] = 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+    # The angle to the north vector (0, 1, 0) only depends on the y component of the normalized normal
+    angles = np.degrees(np.arccos(np.clip(normals[:, 1], -1.0, 1.0)))
+    return angles, normals
+
+def _plane_bases(walls) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Local 2D coordinate systems in the planes of the given walls (list or PolygonArray), all at once.
+    The origin is the first point, u points from the first to the second point, v = normal x u.
+    Returns origins (n, 3), bases (n, 2, 3) with the rows u and v, and a boolean mask of walls with a valid plane.
+    """
+    first_points = _first_three_points(walls) # (n, 3, 3)
+    origins = first_points[:, 0]
+    v1 = first_points[:, 1] - origins
+    normals = np.cross(v1, first_points[:, 2] - origins)
+    normal_len = np.linalg.norm(normals, axis=1)
+    v1_len = np.linalg.norm(v1, axis=1)
+    valid = (normal_len > 0) & (v1_len > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normals = normals / normal_len[:, None]
+        u = v1 / v1_len[:, None]
+    v = np.cross(normals, u)
+    return origins, np.stack([u, v], axis=1), valid
+
+def boolean_difference_batch(walls: List[List[Tuple[float, float, float]]], cutters_per_wall: List[List[List[Tuple[float, float, float]]]]) -> List[List[List[Tuple[float, float, float]]]]:
+    """
+    Subtracts a list of cutting polygons from each wall, for all walls at once.
+    Every cutter is projected onto the plane of its wall (one array operation for all points of all walls and cutters),
+    the differences are computed with the vectorized shapely functions and the remaining fragments are lifted back to 3D with one matrix multiply.
+    Returns one list of fragments per wall (empty if the wall is covered completely). Holes in the fragments are ignored, as in boolean_difference().
+    """
+    results = [[wall] for wall in walls]
+    usable = [i for i, wall in enumerate(walls) if len(wall) >= 3 and cutters_per_wall[i]]
+    if not usable:
+        return results
+
+    origins, bases, valid_plane = _plane_bases([walls[i] for i in usable])
+    usable = [i for i, valid in zip(usable, valid_plane) if valid] # Invalid wall geometry stays as it is
+    origins, bases = origins[valid_plane], bases[valid_plane]
+    if not usable:
+        return results
+
+    # 1. Project the vertices of all walls and cutters onto the planes of their walls in one go
+    rings = [walls[i] for i in usable]
+    ring_owner = list(range(len(usable)))
+    cutter_step = [-1] * len(usable) # -1: the wall itself, t: the t-th cutter of the wall
+    for w, i in enumerate(usable):
+        for t, cutter in enumerate(cutters_per_wall[i]):
+            rings.append(cutter)
+            ring_owner.append(w)
+            cutter_step.append(t)
+    ring_owner = np.array(ring_owner)
+    cutter_step = np.array(cutter_step)
+    ring_array = PolygonArray.from_polygons(rings)
+    ring_lengths = ring_array.lengths
+    points_3d = ring_array.coords
+    point_owner = ring_owner[ring_array.ring_index]
+    points_2d = np.einsum("ij,ikj->ik", points_3d - origins[point_owner], bases[point_owner])
+
+    # 2. Build all 2D polygons at once and repair invalid ones
+    try:
+        polygons_2d = shapely.polygons(shapely.linearrings(points_2d, indices=np.repeat(np.arange(len(rings)), ring_lengths)))
+        invalid = ~shapely.is_valid(polygons_2d)
+        polygons_2d[invalid] = shapely.buffer(polygons_2d[invalid], 0)
+    except Exception:
+        # Fall back to the pairwise version if any of the rings can not be turned into a polygon
+        for i in usable:
+            fragments = [walls[i]]
+            for cutter in cutters_per_wall[i]:
+                fragments = [piece for fragment in fragments for piece in boolean_difference(fragment, cutter)]
+            results[i] = fragments
+        return results
+
+    # 3. Subtract the t-th cutter of every wall in step t (vectorized over all walls)
+    remaining = polygons_2d[:len(usable)].copy()
+    for t in range(cutter_step.max() + 1):
+        step = cutter_step == t
+        owners = ring_owner[step]
+        remaining[owners] = shapely.difference(remaining[owners], polygons_2d[step])
+
+    # 4. Lift the exteriors of all resulting polygons back to 3D with one matrix multiply
+    parts, part_owner = shapely.get_parts(remaining, return_index=True)
+    is_polygon = shapely.get_type_id(parts) == 3
+    parts, part_owner = parts[is_polygon], part_owner[is_polygon]
+    coords_2d, coord_part = shapely.get_coordinates(shapely.get_exterior_ring(parts), return_index=True)
+    # Shapely rings have a repeated last point, which is dropped
+    is_last = np.r_[coord_part[1:] != coord_part[:-1], True] if len(coord_part) else np.zeros(0, dtype=bool)
+    coords_2d, coord_part = coords_2d[~is_last], coord_part[~is_last]
+    coord_owner = part_owner[coord_part]
+    coords_3d = origins[coord_owner] + np.einsum("ik,ikj->ij", coords_2d, bases[coord_owner])
+
+    # The walls run counter-clockwise in their own 2D basis, fragments that come out clockwise are reversed to keep the winding of the wall
+    split_at = np.flatnonzero(np.diff(coord_part)) + 1
+    next_coords = np.concatenate([np.roll(part, -1, axis=0) for part in np.split(coords_2d, split_at)]) if len(coords_2d) else coords_2d
+    cross = coords_2d[:, 0] * next_coords[:, 1] - next_coords[:, 0] * coords_2d[:, 1]
+    signed_areas = np.add.reduceat(cross, np.r_[0, split_at]) if len(cross) else cross
+
+    for w, i in enumerate(usable):
+        results[i] = []
+    for part_coords, owner, signed_area in zip(np.split(coords_3d, split_at), part_owner[np.unique(coord_part)], signed_areas):
+        if signed_area < 0:
+            part_coords = part_coords[::-1]
+        results[usable[owner]].append([tuple(float(c) for c in point) for point in part_coords])
+    return results
+
 def boolean_difference(wall_1: List[Tuple[float, float, float]], wall_2: List[Tuple[float, float, float]]) -> List[List[Tuple[float, float, float]]]:
     """
     Compute the boolean difference of two wall geometries.
@@ -68,8 +203,7 @@ def boolean_difference(wall_1: List[Tuple[float, float, float]], wall_2: List[Tu
 
     # 3. Project vertices of both polygons to the 2D system
     def project_to_2d(points_3d):
-        projected_points = np.array([p - np.dot(p - origin, normal) * normal for p in points_3d])
-        return np.array([[np.dot(p - origin, u), np.dot(p - origin, v)] for p in projected_points])
+        return (points_3d - origin) @ np.vstack([u, v]).T
 
     wall_1_2d = project_to_2d(wall_1_np)
     wall_2_2d = project_to_2d(wall_2_np)
@@ -115,6 +249,225 @@ def boolean_difference(wall_1: List[Tuple[float, float, float]], wall_2: List[Tu
 
     return convert_to_python_floats(result_3d_polygons)
 
+def match_attached_walls(wall_array: PolygonArray, neighbour_array: PolygonArray, angle_tolerance=ANGLE_TOLERANCE, distance_tolerance=DISTANCE_TOLERANCE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds all pairs (i, n) of a wall i in wall_array and a wall n in neighbour_array that are attached to each other:
+    (almost) parallel (angle difference below angle_tolerance) and with two vertices closer than distance_tolerance.
+    Returns the index arrays (current_idx, neighbour_idx), sorted by neighbour wall first and current wall second.
+    """
+    wall_angles, _ = compute_wall_angles(wall_array)
+    neighbours_wall_angles, _ = compute_wall_angles(neighbour_array)
+
+    # Candidate pruning: two walls can only have vertices closer than distance_tolerance if their bounding boxes (grown by the tolerance) overlap.
+    # The XY part is answered by a spatial index over the neighbour walls, the Z part is checked on the arrays.
+    wall_mins, wall_maxs = wall_array.bounds()
+    neighbour_mins, neighbour_maxs = neighbour_array.bounds()
+    if len(wall_array) > 0 and len(neighbour_array) > 0:
+        neighbour_tree = STRtree(shapely.box(neighbour_mins[:, 0], neighbour_mins[:, 1], neighbour_maxs[:, 0], neighbour_maxs[:, 1]))
+        query_boxes = shapely.box(wall_mins[:, 0] - distance_tolerance, wall_mins[:, 1] - distance_tolerance,
+                                  wall_maxs[:, 0] + distance_tolerance, wall_maxs[:, 1] + distance_tolerance)
+        current_idx, neighbour_idx = neighbour_tree.query(query_boxes, predicate="intersects")
+    else:
+        current_idx, neighbour_idx = np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    z_overlap = (wall_mins[current_idx, 2] - distance_tolerance <= neighbour_maxs[neighbour_idx, 2]) & \
+                (neighbour_mins[neighbour_idx, 2] <= wall_maxs[current_idx, 2] + distance_tolerance)
+
+    # 1. Angle check for all candidate pairs at once
+    current_angle = wall_angles[current_idx]
+    neighbour_angle = neighbours_wall_angles[neighbour_idx]
+    delta = np.minimum.reduce([np.abs(current_angle - neighbour_angle), np.abs(current_angle + 180 - neighbour_angle), np.abs(current_angle - 180 + neighbour_angle)])
+    angular_distance = np.minimum(delta, 180 - delta) # May seem odd, but as the max. angle is 180 degrees, we must use this instead of 360.
+    candidates = z_overlap & (angular_distance < angle_tolerance)
+    current_idx, neighbour_idx = current_idx[candidates], neighbour_idx[candidates]
+
+    # Keep the order of the original nested loops (neighbour walls outside, current walls inside), so the walls are subtracted in the same order
+    order = np.lexsort((current_idx, neighbour_idx))
+    current_idx, neighbour_idx = current_idx[order], neighbour_idx[order]
+
+    # 2. Distance Check - minimum distance between any two vertices of the two walls, via broadcasting (n_vertices_1, n_vertices_2)
+    attached = np.zeros(len(current_idx), dtype=bool)
+    for k, (i, n) in enumerate(zip(current_idx, neighbour_idx)):
+        wall_vertices = wall_array.coords[wall_array.offsets[i]:wall_array.offsets[i + 1]]
+        neighbour_vertices = neighbour_array.coords[neighbour_array.offsets[n]:neighbour_array.offsets[n + 1]]
+        diff = wall_vertices[:, None, :] - neighbour_vertices[None, :, :]
+        attached[k] = np.min(np.einsum("ijk,ijk->ij", diff, diff)) <= distance_tolerance ** 2
+    return current_idx[attached], neighbour_idx[attached]
+
+def overlap_polygons(walls: PolygonArray, others: PolygonArray) -> PolygonArray:
+    """
+    The overlapping part of the pairs (walls[k], others[k]), all pairs at once: others[k] is projected onto the plane of walls[k]
+    and intersected with it there, the (largest) resulting polygon is lifted back to 3D. Pairs without an areal overlap get an empty ring.
+    """
+    n = len(walls)
+    origins, bases, valid = _plane_bases(walls) if n else (np.empty((0, 3)), np.empty((0, 2, 3)), np.zeros(0, dtype=bool))
+    empty = PolygonArray(np.empty((0, 3)), np.zeros(n + 1, dtype=np.int64))
+    if not valid.any():
+        return empty
+
+    def project(rings):
+        owner = rings.ring_index
+        points_2d = np.einsum("ij,ikj->ik", rings.coords - origins[owner], bases[owner])
+        polygons = shapely.polygons(shapely.linearrings(points_2d, indices=owner))
+        invalid = ~shapely.is_valid(polygons)
+        polygons[invalid] = shapely.buffer(polygons[invalid], 0)
+        return polygons
+
+    pairs = np.flatnonzero(valid & (walls.lengths >= 3) & (others.lengths >= 3))
+    origins, bases = origins[pairs], bases[pairs]
+    try:
+        overlaps = shapely.intersection(project(walls.select(pairs)), project(others.select(pairs))) if len(pairs) else np.empty(0, dtype=object)
+    except Exception:
+        return empty
+
+    # Keep the largest polygon of every overlap
+    parts, part_owner = shapely.get_parts(overlaps, return_index=True)
+    is_polygon = shapely.get_type_id(parts) == 3
+    parts, part_owner = parts[is_polygon], part_owner[is_polygon]
+    order = np.lexsort((-shapely.area(parts), part_owner))
+    first = np.r_[True, part_owner[order][1:] != part_owner[order][:-1]] if len(order) else np.zeros(0, dtype=bool)
+    parts, part_owner = parts[order][first], part_owner[order][first]
+
+    coords_2d, coord_part = shapely.get_coordinates(shapely.get_exterior_ring(parts), return_index=True)
+    is_last = np.r_[coord_part[1:] != coord_part[:-1], True] if len(coord_part) else np.zeros(0, dtype=bool)
+    coords_2d, coord_part = coords_2d[~is_last], coord_part[~is_last]
+    coord_owner = part_owner[coord_part]
+    coords_3d = origins[coord_owner] + np.einsum("ik,ikj->ij", coords_2d, bases[coord_owner])
+
+    # coord_owner is sorted (parts are ordered by their pair), so the rings can be assembled with offsets
+    lengths = np.zeros(n, dtype=np.int64)
+    np.add.at(lengths, pairs[coord_owner], 1)
+    return PolygonArray(coords_3d, np.concatenate([[0], np.cumsum(lengths)]), walls.surface_type)
+
+def building_reference_point(building: ET.Element, ns: Dict[str, str]) -> Optional[Tuple[float, float]]:
+    # The point get_building_data() searches the neighbours around: first vertex of the last roof surface, or of the last ground surface without roof
+    for surface_type in ("RoofSurface", "GroundSurface"):
+        for pos_list in reversed(building.findall(f".//bldg:{surface_type}//gml:posList", ns)):
+            try:
+                values = [float(v) for v in pos_list.text.split()[:2]]
+            except (AttributeError, ValueError):
+                continue
+            if len(values) == 2:
+                return values[0], values[1]
+    return None
+
+def build_wall_adjacency(xml_root: ET.Element, ns: Dict[str, str], footprints: Optional[Dict[str, ShapelyPolygon]] = None) -> Dict[str, np.ndarray]:
+    """
+    Computes, once for a whole LOD2 tile, which wall of which building is attached to which wall of another building,
+    with the same criteria as match_attached_walls(), the overlap polygon of each pair and the surrounding buildings of every building.
+    Returns flat arrays:
+        building_ids, building_order (argsort of building_ids, to look up a building by id)
+        wall_building / wall_index: building and index within the building of every wall of the tile
+        wall_a, wall_b: the directed adjacency rows wall_a -> wall_b (global wall indices), sorted by wall_a and wall_b,
+                        the rows of building k are row_offsets[k]:row_offsets[k+1]
+        overlap_coords, overlap_offsets: overlap polygon of every row (in the plane of wall_a)
+        surrounding, surrounding_offsets: indices of the buildings whose footprint lies within BUILDING_SEARCH_RADIUS
+                        of the reference point of building k (as find_neighbouring_buildings()), in tile order
+    """
+    if footprints is None:
+        from helpers.geomf import create_ground_surface_list # geomf imports this module
+        footprints = create_ground_surface_list(xml_root, ns)
+
+    building_ids, all_walls, wall_building, wall_index, reference_points = [], [], [], [], []
+    for building in xml_root.findall(".//bldg:Building", ns):
+        reference_points.append(building_reference_point(building, ns))
+        walls = parse_wall_surfaces(building, ns)
+        wall_building.extend([len(building_ids)] * len(walls))
+        wall_index.extend(range(len(walls)))
+        all_walls.extend(walls)
+        building_ids.append(building.get("{http://www.opengis.net/gml}id"))
+    n_buildings = len(building_ids)
+    wall_building = np.array(wall_building, dtype=np.int64)
+    wall_array = PolygonArray.from_polygons(all_walls)
+
+    # One self-join over all walls of the tile, walls of the same building are not attached walls
+    wall_a, wall_b = match_attached_walls(wall_array, wall_array)
+    other_building = wall_building[wall_a] != wall_building[wall_b]
+    wall_a, wall_b = wall_a[other_building], wall_b[other_building]
+    order = np.lexsort((wall_b, wall_a))
+    wall_a, wall_b = wall_a[order], wall_b[order]
+    overlaps = overlap_polygons(wall_array.select(wall_a), wall_array.select(wall_b))
+    row_counts = np.bincount(wall_building[wall_a], minlength=n_buildings)
+
+    # Surrounding buildings: one spatial query for all buildings of the tile
+    position = {bid: k for k, bid in enumerate(building_ids)}
+    footprint_building = np.array([position[bid] for bid in footprints], dtype=np.int64)
+    polygons = np.array(list(footprints.values()), dtype=object)
+    point_building = np.array([k for k, point in enumerate(reference_points) if point is not None], dtype=np.int64)
+    if len(polygons) and len(point_building):
+        points = shapely.points([reference_points[k] for k in point_building])
+        point_idx, polygon_idx = STRtree(polygons).query(points, predicate="dwithin", distance=BUILDING_SEARCH_RADIUS)
+    else:
+        point_idx, polygon_idx = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    owner, surrounding = point_building[point_idx], footprint_building[polygon_idx]
+    keep = owner != surrounding
+    owner, surrounding = owner[keep], surrounding[keep]
+    order = np.lexsort((surrounding, owner))
+    owner, surrounding = owner[order], surrounding[order]
+
+    return {
+        "building_ids": np.array(building_ids, dtype=str),
+        "building_order": np.argsort(np.array(building_ids, dtype=str), kind="stable").astype(np.int64),
+        "wall_building": wall_building,
+        "wall_index": np.array(wall_index, dtype=np.int64),
+        "wall_a": wall_a.astype(np.int64),
+        "wall_b": wall_b.astype(np.int64),
+        "row_offsets": np.concatenate([[0], np.cumsum(row_counts)]).astype(np.int64),
+        "overlap_coords": overlaps.coords,
+        "overlap_offsets": overlaps.offsets,
+        "surrounding": surrounding.astype(np.int64),
+        "surrounding_offsets": np.concatenate([[0], np.cumsum(np.bincount(owner, minlength=n_buildings))]).astype(np.int64),
+    }
+
+def get_wall_adjacency(xml_root: ET.Element, ns: Dict[str, str], tile_cache_dir: Optional[str], footprints: Optional[Dict[str, ShapelyPolygon]] = None) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Loads the wall adjacency of the tile from the tile cache, computing (and storing) it on first use.
+    Meant to be called once per tile version (e.g. when the tile is parsed) and passed on to every subtract_attached_walls() call.
+    """
+    if tile_cache_dir is None:
+        return None
+    adjacency = load_tile_arrays(tile_cache_dir, "wall_adjacency")
+    if adjacency is None:
+        adjacency = build_wall_adjacency(xml_root, ns, footprints)
+        save_tile_arrays(tile_cache_dir, "wall_adjacency", adjacency)
+    return adjacency
+
+def _building_index(adjacency, building_id) -> Optional[int]:
+    # Index of the building in the adjacency arrays (binary search on the sorted ids), None if it is not part of the tile
+    building_ids, order = adjacency["building_ids"], adjacency["building_order"]
+    pos = np.searchsorted(building_ids[order], building_id)
+    if pos >= len(order) or building_ids[order[pos]] != building_id:
+        return None
+    return int(order[pos])
+
+def _attached_from_adjacency(adjacency, building_id, n_walls):
+    """
+    Reads the adjacency rows of one building: the overlap polygons to subtract from every wall (in the order of the neighbour walls),
+    the ids of the attached buildings and of the other surrounding buildings.
+    Returns None if the building (or its number of walls) does not match the cached tile.
+    """
+    k = _building_index(adjacency, building_id)
+    if k is None or "row_offsets" not in adjacency:
+        return None
+    wall_start, wall_end = np.searchsorted(adjacency["wall_building"], [k, k + 1])
+    if wall_end - wall_start != n_walls:
+        return None
+
+    rows = slice(adjacency["row_offsets"][k], adjacency["row_offsets"][k + 1])
+    wall_a, wall_b = adjacency["wall_a"][rows], adjacency["wall_b"][rows]
+    coords, offsets = adjacency["overlap_coords"], adjacency["overlap_offsets"][rows.start:rows.stop + 1]
+    overlaps_by_wall = [[] for _ in range(n_walls)]
+    for row, i in enumerate(adjacency["wall_index"][wall_a]):
+        ring = coords[offsets[row]:offsets[row + 1]]
+        if len(ring) >= 3: # pairs without an areal overlap leave the wall unchanged
+            overlaps_by_wall[i].append([tuple(point) for point in ring.tolist()])
+
+    building_ids = adjacency["building_ids"]
+    attached = np.unique(adjacency["wall_building"][wall_b])
+    surrounding = adjacency["surrounding"][adjacency["surrounding_offsets"][k]:adjacency["surrounding_offsets"][k + 1]]
+    surrounding = surrounding[~np.isin(surrounding, attached)]
+    return overlaps_by_wall, building_ids[attached].tolist(), building_ids[surrounding].tolist()
+
 def subtract_attached_walls(
     wall_geometries: List[List[Tuple[float, float, float]]], # Walls of the current building
     xml_root: ET.Element, # LOD2 file
@@ -122,11 +475,13 @@ def subtract_attached_walls(
     utm_coords: List[float], # UTM coordinates of the current building
     building_id, # LOD2 ID(s) of the current building - can be string or list
     footprints: Dict[str, any], # Contains the footprints of all buildings in the same LOD2 file
+    adjacency: Optional[Dict[str, np.ndarray]] = None, # Wall adjacency of the tile (get_wall_adjacency()), if available
 ):
     """
     Substract any walls of neighbouring buildings that intersect with the walls of the building_id(s).
-    Only check in the same LOD2 File xml_root. Check for neighbouring buildings in the same LOD2 file first, get their walls.
-    Find intersections.
+    Only check in the same LOD2 File xml_root.
+    With the per-tile adjacency, the attached and surrounding buildings and the overlap polygons to subtract are read from the rows of the building.
+    Otherwise, check for neighbouring buildings in the same LOD2 file first, get their walls and match them on the fly.
     Return the remaining walls.
     """
     # Normalize building_id to a list for consistent processing
@@ -135,97 +490,58 @@ def subtract_attached_walls(
     else:
         building_ids = [building_id]
 
-    # parameters for the identification of attached walls
-    building_search_radius = 30 # in meters
-    angle_tolerance = 3 # tolerance for the angle difference between attached walls in degrees
-    distance_tolerance = 1.5 # tolerance for the distance between attached walls in meters
-
-    # Find neighbours for all building IDs, excluding any of the target buildings from being considered neighbours
-    neighbours_lod2_ids = find_neighbouring_buildings(utm_coords[0], utm_coords[1], footprints, building_ids[0], building_search_radius)
-    # Remove any of the target buildings from the neighbours list
-    neighbours_lod2_ids = [nid for nid in neighbours_lod2_ids if nid not in building_ids]
-
-    # get all wall geometries of the neighbouring buildings
-    neighbours_wall_geometries = []
-    neighbours_geometries = []
-    for neighbour_id in neighbours_lod2_ids:
-        walls, neighbour_geom = extract_neighbour_geom(xml_root, target_building_id=neighbour_id, ns=ns)
-        neighbours_wall_geometries.append(walls)
-        neighbours_geometries.append(neighbour_geom)
-    # Compute wall angles and normals for all walls of the current building
-    wall_angles = []
-    wall_normals = []
-    for wall in wall_geometries:
-        wall_area = polygon_area_3d(wall)
-        wall_data = compute_wall_angle(wall, utm_coords, wall_area)
-        wall_angles.append(wall_data["Angle"])
-        wall_normals.append(wall_data["Normal"])
-    
-    # Compute wall angles for all walls of the neighbouring buildings
-    neighbours_wall_angles = []
-    for walls in neighbours_wall_geometries:
-        current_wall_angles = []
-        for wall in walls:
-            wall_area = polygon_area_3d(wall)
-            current_wall_angles.append(compute_wall_angle(wall, utm_coords, wall_area)["Angle"])
-        neighbours_wall_angles.append(current_wall_angles)
-
-
-
-    # Final filtering: replace neighbour walls that are attached (fulfill angle and distance constraint) with None.
-    final_neighbour_geometries = copy.deepcopy(neighbours_wall_geometries)
-    intersect_walls = [None for _ in wall_geometries]
-    # turn every entry of intersect_walls into a list
-    intersect_walls = [[] for _ in wall_geometries]
-
-    for j, neighbour_walls_group in enumerate(neighbours_wall_geometries):
-        for k, neighbour_wall in enumerate(neighbour_walls_group):
-            if neighbour_wall is None:
-                continue
+    attached = None
+    if adjacency is not None and len(building_ids) == 1:
+        attached = _attached_from_adjacency(adjacency, building_ids[0], len(wall_geometries))
 
-            # Check if this neighbour wall is adjacent to any of the current building's walls. If not, remove it from the list - it's not relevant
-            should_keep_wall = False
-            for i, current_wall in enumerate(wall_geometries):
-                current_angle = wall_angles[i]
-                neighbour_angle = neighbours_wall_angles[j][k]
-                
-                if neighbour_angle is None: continue
-
-                delta = min(abs(current_angle - neighbour_angle), abs(current_angle + 180 - neighbour_angle), abs(current_angle - 180 + neighbour_angle))
-                angular_distance = min(delta, 180 - delta) # May seem odd, but as the max. angle is 180 degrees, we must use this instead of 360.
-
-                if angular_distance < angle_tolerance:
-                    # 2. Distance Check - find minimum distance between any two vertices between the two walls
-                    min_distance = float('inf')
-                    for curr_point in current_wall:
-                        for neigh_point in neighbour_wall:
-                            curr_np = np.array(curr_point)
-                            neigh_np = np.array(neigh_point)
-                            distance = np.linalg.norm(curr_np - neigh_np)
-                            if distance < min_distance:
-                                min_distance = distance
-
-                    if min_distance <= distance_tolerance:
-                        should_keep_wall = True
-                        intersect_walls[i].append(neighbour_wall)
-            
-            if not should_keep_wall:
-                final_neighbour_geometries[j][k] = None
-
-
-    # Filter the LOD2 ids of buildings that actually have adjacent walls
-    actual_neighbour_ids = []
-    actual_neighbour_geometries = []
-    surrounding_buildings_ids = []
-    surrounding_buildings_geometries = []
-    for i, neighbour_geometry in enumerate(final_neighbour_geometries):
-        if any(wall is not None for wall in neighbour_geometry):
-            actual_neighbour_ids.append(neighbours_lod2_ids[i])
-            actual_neighbour_geometries.append(neighbours_geometries[i])
-        else:
-            # All buildings with no "true" adjacent walls are treated only as surrounding buildings.
-            surrounding_buildings_geometries.append(neighbours_geometries[i])
-            surrounding_buildings_ids.append(neighbours_lod2_ids[i])
+    if attached is not None:
+        intersect_walls, actual_neighbour_ids, surrounding_buildings_ids = attached
+        surrounding_buildings_ids = [nid for nid in surrounding_buildings_ids if nid not in building_ids]
+        actual_neighbour_geometries = [extract_neighbour_geom(xml_root, target_building_id=nid, ns=ns)[1] for nid in actual_neighbour_ids]
+        surrounding_buildings_geometries = [extract_neighbour_geom(xml_root, target_building_id=nid, ns=ns)[1] for nid in surrounding_buildings_ids]
+    else:
+        building_search_radius = BUILDING_SEARCH_RADIUS
+
+        # Find neighbours for all building IDs, excluding any of the target buildings from being considered neighbours
+        neighbours_lod2_ids = find_neighbouring_buildings(utm_coords[0], utm_coords[1], footprints, building_ids[0], building_search_radius)
+        # Remove any of the target buildings from the neighbours list
+        neighbours_lod2_ids = [nid for nid in neighbours_lod2_ids if nid not in building_ids]
+
+        # get all wall geometries of the neighbouring buildings
+        neighbours_wall_geometries = []
+        neighbours_geometries = []
+        for neighbour_id in neighbours_lod2_ids:
+            walls, neighbour_geom = extract_neighbour_geom(xml_root, target_building_id=neighbour_id, ns=ns)
+            neighbours_wall_geometries.append(walls)
+            neighbours_geometries.append(neighbour_geom)
+        # Walls of the current building and of the neighbouring buildings (flattened, the building of every neighbour wall is kept as index array)
+        flat_neighbour_walls = [wall for walls in neighbours_wall_geometries for wall in walls]
+        flat_neighbour_building = np.array([j for j, walls in enumerate(neighbours_wall_geometries) for _ in walls], dtype=int)
+
+        current_idx, neighbour_idx = match_attached_walls(PolygonArray.from_polygons(wall_geometries), PolygonArray.from_polygons(flat_neighbour_walls))
+
+        intersect_walls = [[] for _ in wall_geometries]
+        has_attached_wall = np.zeros(len(neighbours_lod2_ids), dtype=bool)
+        for i, n in zip(current_idx, neighbour_idx):
+            intersect_walls[i].append(flat_neighbour_walls[n])
+            has_attached_wall[flat_neighbour_building[n]] = True
+
+        # Filter the LOD2 ids of buildings that actually have adjacent walls
+        actual_neighbour_ids = []
+        actual_neighbour_geometries = []
+        surrounding_buildings_ids = []
+        surrounding_buildings_geometries = []
+        for i in range(len(neighbours_lod2_ids)):
+            if has_attached_wall[i]:
+                actual_neighbour_ids.append(neighbours_lod2_ids[i])
+                actual_neighbour_geometries.append(neighbours_geometries[i])
+            else:
+                # All buildings with no "true" adjacent walls are treated only as surrounding buildings.
+                surrounding_buildings_geometries.append(neighbours_geometries[i])
+                surrounding_buildings_ids.append(neighbours_lod2_ids[i])
+
+    # Subtract the attached walls from all affected walls in one batch
+    fragments_by_wall = boolean_difference_batch(wall_geometries, intersect_walls)
 
     # final_wall_geometries will be a flat list of final wall polygons (or fragments)
     final_wall_geometries = []
@@ -236,15 +552,8 @@ def subtract_attached_walls(
             # If there are no intersections, add the original wall
             final_wall_geometries.append(original_wall)
         else:
-            # If there are intersections, calculate the remaining fragments
-            fragments = [original_wall]
-            for intersect_wall in intersecting_walls:
-                next_fragments = []
-                for fragment in fragments:
-                    next_fragments.extend(boolean_difference(fragment, intersect_wall))
-                fragments = next_fragments
-            
-            final_wall_geometries.extend(fragments)
+            # If there are intersections, add the remaining fragments (computed for all walls at once above)
+            final_wall_geometries.extend(fragments_by_wall[i])
     return {
         "Wall_geometries_external": final_wall_geometries, # new geometries with attached walls subtracted
         "neighbour_lod2_ids": actual_neighbour_ids, # LOD2 ids of buildings that actually have adjacent walls. Maybe use later for visualization.
@@ -1,19 +1,31 @@
+import threading
+import weakref
 import numpy as np
-from itertools import combinations
+from helpers.polygon_array import PolygonArray
 
 import xml.etree.ElementTree as ET
 
-def extract_neighbour_geom(xml_root, target_building_id, ns):
+# Building elements of a parsed tile by gml:id, built once per tile and dropped together with the parsed tile
+_building_elements = weakref.WeakKeyDictionary()
+_building_elements_lock = threading.Lock()
+
+def get_building_element(xml_root, building_id, ns):
     """
-    Extracts only the walls of a building from a CityGML file by building ID. Used for getting walls of neighbouring buildings and then substracting them in attachedWalls.py
+    Returns the bldg:Building element with the given gml:id (None if the tile has no such building).
+    Looks it up in an index of the tile instead of scanning all buildings for every id.
+    """
+    with _building_elements_lock:
+        elements = _building_elements.get(xml_root)
+        if elements is None:
+            elements = {building.get("{http://www.opengis.net/gml}id"): building for building in xml_root.findall(".//bldg:Building", ns)}
+            _building_elements[xml_root] = elements
+    return elements.get(building_id)
+
+def parse_wall_surfaces(building, ns):
+    """
+    Parses the geometries of all WallSurface elements of a building element, as list of [(x, y, z), ...] polygons.
+    Same parsing (and wall order) as in extract_building_data(), so wall indices can be shared, e.g. by the per-tile wall adjacency.
     """
-    # Iterate through all WallSurface elements in the building
-
-    for building in xml_root.findall(".//bldg:Building", ns):
-        building_id = building.get("{http://www.opengis.net/gml}id")
-        if building_id == target_building_id:
-            break
-
     wall_surface_geometries = []
 
     for wall_surface in building.findall(".//bldg:WallSurface", ns):
@@ -34,6 +46,18 @@ def extract_neighbour_geom(xml_root, target_building_id, ns):
 
         wall_surface_geometries.append(geom)
 
+    return wall_surface_geometries
+
+def extract_neighbour_geom(xml_root, target_building_id, ns):
+    """
+    Extracts only the walls of a building from a CityGML file by building ID. Used for getting walls of neighbouring buildings and then substracting them in attachedWalls.py
+    """
+    building = get_building_element(xml_root, target_building_id, ns)
+    if building is None:
+        return [], []
+
+    wall_surface_geometries = parse_wall_surfaces(building, ns)
+
     roof_surface_geometries = []
     # Iterate through all RoofSurface elements in the building
     for roof_surface in building.findall(".//bldg:RoofSurface", ns):
@@ -76,9 +100,26 @@ def polygon_area_3d(coords):
     cross_sum = np.cross(P, P_next).sum(axis=0)
     return 0.5 * np.linalg.norm(cross_sum)
 
+def newell_vectors(polygons):
+    """
+    Newell vectors (sum of the cross products of consecutive vertices) of many 3D polygons at once.
+    The vector points along the polygon normal (orientation given by the winding) and its length is twice the polygon area,
+    so polygon_area_3d(p) == 0.5 * |newell_vectors([p])[0]|.
+
+    Args:
+        polygons (list): A list of polygons, where each polygon is a list of 3D vertex coordinates (at least one vertex each).
+
+    Returns:
+        np.ndarray: Array of shape (n, 3).
+    """
+    if len(polygons) == 0:
+        return np.empty((0, 3))
+    return PolygonArray.from_polygons(polygons).newell()
+
 def calculate_external_wall_properties(wall_geometries, reference_mesh):
     """
     Calculates face areas and normals for external wall geometries, oriented with respect to a reference mesh.
+    Normals are computed with Newell's method for all walls at once, and all probe points are tested against the mesh in one batched call.
 
     Args:
         wall_geometries (list): A list of polygons, where each polygon is a list of 3D vertex coordinates.
@@ -88,73 +129,52 @@ def calculate_external_wall_properties(wall_geometries, reference_mesh):
         tuple: A tuple containing:
             - face_areas (np.ndarray): An array of areas for each wall polygon.
             - face_normals (np.ndarray): An array of correctly oriented normal vectors for each wall polygon.
+            - total_area (float): The summed area of all walls.
     """
-    face_areas = []
-    face_normals = []
-
     if not wall_geometries:
-        return np.array([]), np.array([])
-    total_area = 0
-    for wall_polygon in wall_geometries:
-        # Ensure polygon has at least 3 vertices to form a plane
-        if len(wall_polygon) < 3:
-            continue
-            
-        # 1. Calculate area
-        area = polygon_area_3d(wall_polygon)
-        if area < 1e-6: # Skip degenerate polygons
-            continue
-        face_areas.append(area)
-
-        # 2. Calculate normal: try only valid vertex triplets; avoid z-dominant or tiny normals
-        vertices = [np.array(p) for p in wall_polygon if p is not None]
-
-        def try_compute_normal(a, b, c):
-            v1_local = b - a
-            v2_local = c - a
-            n_local = np.cross(v1_local, v2_local)
-            mag_local = np.linalg.norm(n_local)
-            if mag_local <= 1e-6:
-                return None
-            n_local = n_local / mag_local
-            # Valid wall normals should primarily lie in the XY-plane
-            if abs(n_local[2]) >= 0.5:
-                return None
-            return n_local
-
-        normal = None
-        if len(vertices) >= 3:
-            # Iterate over all unique triplets and pick the first valid normal
-            for i, j, k in combinations(range(len(vertices)), 3):
-                candidate = try_compute_normal(vertices[i], vertices[j], vertices[k])
-                if candidate is not None:
-                    normal = candidate
-                    break
-
-        # Fallback: derive a replacement normal from mesh centroid to polygon average (XY only)
-        if normal is None:
-            centroid = np.mean(np.array(vertices), axis=0)
-            mesh_centroid = getattr(reference_mesh, "centroid", None)
-            if mesh_centroid is None:
-                mesh_centroid = getattr(reference_mesh, "center_mass", None)
-            if mesh_centroid is None:
-                mesh_centroid = np.mean(np.array(reference_mesh.vertices), axis=0)
-            replacement = centroid - mesh_centroid
-            replacement[2] = 0.0
-            rep_mag = np.linalg.norm(replacement)
-            if rep_mag <= 1e-12:
-                normal = np.array([1.0, 0.0, 0.0])
-            else:
-                normal = replacement / rep_mag
-
-        # 3. Orient the normal using the reference mesh. If the test point is inside the (closed) reference mesh, the normal is flipped.
-        centroid = np.mean(np.array(vertices), axis=0)
-        test_point = centroid + 0.1 * normal
-        if reference_mesh.contains([test_point])[0]:
-            normal = -normal
-        face_normals.append(normal)
-        total_area = total_area + area
-    return np.array(face_areas), np.array(face_normals), total_area
+        return np.array([]), np.array([]), 0
+
+    # Ensure polygon has at least 3 vertices to form a plane
+    polygons = [[p for p in wall_polygon if p is not None] for wall_polygon in wall_geometries if len(wall_polygon) >= 3]
+    polygons = [polygon for polygon in polygons if len(polygon) >= 3]
+    if not polygons:
+        return np.array([]), np.array([]), 0
+
+    # 1. Calculate areas and normals (Newell's method)
+    polygon_array = PolygonArray.from_polygons(polygons)
+    newell = polygon_array.newell()
+    magnitudes = np.linalg.norm(newell, axis=1)
+    areas = 0.5 * magnitudes
+    keep = areas >= 1e-6 # Skip degenerate polygons
+    if not keep.any():
+        return np.array([]), np.array([]), 0
+    areas = areas[keep]
+    normals = newell[keep] / magnitudes[keep, None]
+    centroids = polygon_array.centroids()[keep]
+
+    # 2. Valid wall normals should primarily lie in the XY-plane.
+    # Fallback: derive a replacement normal from mesh centroid to polygon average (XY only)
+    invalid = np.abs(normals[:, 2]) >= 0.5
+    if invalid.any():
+        mesh_centroid = getattr(reference_mesh, "centroid", None)
+        if mesh_centroid is None:
+            mesh_centroid = getattr(reference_mesh, "center_mass", None)
+        if mesh_centroid is None:
+            mesh_centroid = np.mean(np.array(reference_mesh.vertices), axis=0)
+        replacement = centroids[invalid] - mesh_centroid
+        replacement[:, 2] = 0.0
+        rep_mag = np.linalg.norm(replacement, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            replacement = np.where(rep_mag[:, None] <= 1e-12, np.array([1.0, 0.0, 0.0]), replacement / rep_mag[:, None])
+        normals[invalid] = replacement
+
+    # 3. Orient the normals using the reference mesh. If the test point is inside the (closed) reference mesh, the normal is flipped.
+    test_points = centroids + 0.1 * normals
+    inside = np.asarray(reference_mesh.contains(test_points), dtype=bool)
+    normals[inside] = -normals[inside]
+
+    total_area = float(np.sum(areas))
+    return areas, normals, total_area
 
 def compute_wall_angle(geometry, refpoint, area):
 
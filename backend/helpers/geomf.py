@@ -1,15 +1,25 @@
 import importlib
+import multiprocessing
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import shapely
+from shapely import STRtree
 from shapely.geometry import Polygon
 import numpy as np
-from sklearn.cluster import DBSCAN
-from scipy.spatial import ConvexHull
+from scipy.spatial import ConvexHull, cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from shapely.geometry import Point
 import cv2
 import os
 import sys
 from helpers.repair_geometry import repair_geometry, facade_areas_by_direction, get_middle_points
 from helpers.geometry_helpers import polygon_area_3d, calculate_external_wall_properties
-from helpers.attachedWalls import subtract_attached_walls	
+from helpers.attachedWalls import subtract_attached_walls, get_wall_adjacency	
+from helpers.tile_cache import load_building_mesh, save_building_mesh, get_tile_cache_dir
+from helpers.result_cache import building_parts
 
 # Add the backend directory to Python path for imports
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -38,17 +48,24 @@ def compute_roof_pitch(geometry, area):
 
 def group_extrusions(points, threshold=0.3):
     # groups the input points (shape (N,3) - in out usecase: Laserscan points of roof extrusions into groups
-    # group separation is defined by threshold
+    # group separation is defined by threshold: points closer than threshold end up in the same group (same as DBSCAN with min_samples=1)
 
     if len(points) == 0:
         return []
-    
-    # DBSCAN clustering in 3D space
-    clustering = DBSCAN(eps=threshold, min_samples=1).fit(points)
-    # Group points by their cluster labels
-    labels = clustering.labels_
-    unique_labels = np.unique(labels)
-    clusters = [points[labels == label] for label in unique_labels]
+    points = np.asarray(points)
+
+    # 1. Link all pairs of points closer than threshold (exact distances, the KD-tree only visits nearby points)
+    pairs = cKDTree(points).query_pairs(r=threshold, output_type='ndarray')
+
+    # 2. Connected components of this graph are the groups
+    n_points = len(points)
+    adjacency = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(n_points, n_points))
+    _, labels = connected_components(adjacency, directed=False)
+
+    # 3. Split the points into groups (stable sort keeps the original point order)
+    order = np.argsort(labels, kind='stable')
+    split_indices = np.cumsum(np.bincount(labels))[:-1]
+    clusters = np.split(points[order], split_indices)
 
     return clusters
 
@@ -101,14 +118,15 @@ def approximate_surface_as_rectangle(surface_points):
     v2 = vh[1]
 
     # Step 3: Project points onto 2D plane coordinates
-    projected_2d = np.array([[np.dot(p - centroid, v1), np.dot(p - centroid, v2)] for p in pts]).astype(np.float32)
+    basis = np.vstack([v1, v2])
+    projected_2d = (centered @ basis.T).astype(np.float32)
 
     # Step 4: Use OpenCV to find the min-area rectangle
     rect = cv2.minAreaRect(projected_2d)
     box_2d = cv2.boxPoints(rect)
 
     # Step 5: Map 2D box corners back to 3D
-    rectangle_3d = [tuple(centroid + pt[0] * v1 + pt[1] * v2) for pt in box_2d] # type: ignore  
+    rectangle_3d = [tuple(corner) for corner in centroid + box_2d.astype(float) @ basis]
     rectangle_3d.append(rectangle_3d[0])  # close polygon
 
     return rectangle_3d
@@ -116,6 +134,7 @@ def approximate_surface_as_rectangle(surface_points):
 def model_extrusion_footprints(point_groups, size_threshold_m2, model_as_rectangle = False):
 
     # Takes min and max x,y and z value of each point group to define the rectangular surface that fits the group the best. Represents the roof/top of a roof extension (Dachgaube) in the use case.
+    # Every group is fitted exactly once, so the runtime grows linearly with the number of groups and points.
     # Returns a List of rectangular surfaces as closed polygon [(x1, y1, z), ..., (x1, y1, z)]
 
     surfaces = []
@@ -125,8 +144,9 @@ def model_extrusion_footprints(point_groups, size_threshold_m2, model_as_rectang
             continue  # Can't form a polygon
 
         # Compute axis-aligned bounding box in XY
-        min_x, min_y = np.min(cluster[:, :2], axis=0)
-        max_x, max_y = np.max(cluster[:, :2], axis=0)
+        cluster_xy = cluster[:, :2]
+        min_x, min_y = np.min(cluster_xy, axis=0)
+        max_x, max_y = np.max(cluster_xy, axis=0)
 
         # Define bounding box corner positions (XY only)
         corners_xy = np.array([
@@ -136,70 +156,77 @@ def model_extrusion_footprints(point_groups, size_threshold_m2, model_as_rectang
             [min_x, max_y]
         ])
 
-        # Find the closest actual point in the cluster for each corner to get Z values
-        surface = []
-        for cx, cy in corners_xy:
-            distances = np.linalg.norm(cluster[:, :2] - np.array([cx, cy]), axis=1)
-            nearest_index = np.argmin(distances)
-            nearest_point = cluster[nearest_index]
-            surface.append((float(nearest_point[0]), float(nearest_point[1]), float(nearest_point[2])))
+        # Find the closest actual point in the cluster for all corners at once to get Z values, distances have shape (4, N)
+        sq_distances = np.sum((cluster_xy[None, :, :] - corners_xy[:, None, :]) ** 2, axis=2)
+        nearest_points = cluster[np.argmin(sq_distances, axis=1)]
+        surface = [(float(x), float(y), float(z)) for x, y, z in nearest_points]
 
         # Close the polygon
         surface.append(surface[0])
-        # Figuring out the area of the top plane, first: only use x,y coordinates (determining the area from a "top view", ignoring z-coordinates, is good enough)
-        xy_points = [(x, y) for x, y, z in surface]
-        # Create polygon and compute area
-        polygon = Polygon(xy_points)
-        area = polygon.area
+        # Figuring out the area of the top plane: only use x,y coordinates (determining the area from a "top view", ignoring z-coordinates, is good enough)
+        x, y = nearest_points[:, 0], nearest_points[:, 1]
+        area = 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
 
-        if area > size_threshold_m2: # filter roof extrusions that are smaller than the threshold, because they like are either artifacts, chimneys or satellite dishes and therfore not relevant
-            surfaces.append(surface)
+        if area <= size_threshold_m2: # filter roof extrusions that are smaller than the threshold, because they like are either artifacts, chimneys or satellite dishes and therfore not relevant
+            continue
 
         # Approximate modeled surfaces as the most closely matching rectangle, if condition = True. May help to give a more realistic shape to the sometimes uneven models obtained from laser data.
-        if model_as_rectangle == True: 
-            for i in range(0, len(surfaces)):
-                surfaces[i] = approximate_surface_as_rectangle(surfaces[i])
+        if model_as_rectangle == True:
+            surface = approximate_surface_as_rectangle(surface)
+        surfaces.append(surface)
 
     return surfaces
 
+def build_roof_index(roof_surfaces):
+    # Builds the XY footprints of all roof surfaces once (prepared for fast point-in-polygon tests) and puts them behind a spatial index.
+    # Returns a dict with the STRtree of the footprints and the lowest Z value of every roof surface.
+    footprints = [Polygon([(vx, vy) for vx, vy, _ in surface]) for surface in roof_surfaces]
+    shapely.prepare(footprints)
+    min_zs = np.array([min(vz for _, _, vz in surface) for surface in roof_surfaces], dtype=float)
+    return {"tree": STRtree(footprints), "min_z": min_zs}
+
+def find_roof_z_below_batch(points, roof_index):
+    # Finds the highest roof Z directly below each of the given (x, y, z) points in one query against the roof index (see build_roof_index()).
+    # Returns an array with one Z value per point, NaN where no surface was found below.
+    pts = np.asarray(points, dtype=float).reshape(-1, 3)
+    base_zs = np.full(len(pts), np.nan)
+    if len(pts) == 0 or len(roof_index["min_z"]) == 0:
+        return base_zs
+
+    # All (point, roof) pairs where the point lies inside the roof footprint
+    point_idx, roof_idx = roof_index["tree"].query(shapely.points(pts[:, :2]), predicate="within")
+    candidate_zs = roof_index["min_z"][roof_idx]
+    below = candidate_zs < pts[point_idx, 2] # only surfaces *below* the point
+    np.fmax.at(base_zs, point_idx[below], candidate_zs[below]) # Use highest roof below
+    return base_zs
+
 def find_roof_z_below(point, roof_surfaces):
     # Finds the highest Z (roof) directly below the given (x, y).
     # Returns the Z value or None if no surface found below.
-
-    x, y, z_top = point
-    candidate_zs = []
-
-    for surface in roof_surfaces:
-        # Extract horizontal polygon and Zs
-        poly_xy = [(vx, vy) for vx, vy, _ in surface]
-        poly_z = [vz for _, _, vz in surface]
-        # Simple point-in-polygon test
-        if Polygon(poly_xy).contains(Point(x, y)):
-            min_z = np.min(poly_z)
-            if min_z < z_top:  # only surfaces *below* the point
-                candidate_zs.append(min_z)
-                print("Z: ", candidate_zs)
-
-    if candidate_zs:
-        return max(candidate_zs)  # Use highest roof below
-    else:
-        return None
+    base_z = find_roof_z_below_batch([point], build_roof_index(roof_surfaces))[0]
+    return None if np.isnan(base_z) else float(base_z)
 
 def extrude_footprints(extrusion_tops, roof_surfaces):
     # For each edge in each extrusion top surface, create a vertical wall extending downward until it intersects with any of the roof surfaces.
+    # The roof below every corner of all extrusion tops is resolved in one batched query.
     # extrusion_walls (list of list of (x, y, z)): List of wall surfaces as closed polygons
+    roof_index = build_roof_index(roof_surfaces)
+    all_corners = [p for top_surface in extrusion_tops for p in top_surface]
+    base_zs = find_roof_z_below_batch(all_corners, roof_index)
+
     extrusion_walls = []
+    offset = 0
     for top_surface in extrusion_tops:
         extrusion_walls_element = []
         for i in range(len(top_surface) - 1):  # Iterate over edges
             p1 = top_surface[i]
             p2 = top_surface[i + 1]
 
-            # Use the lowest roof Z directly below each point
-            base_z1 = find_roof_z_below(p1, roof_surfaces)
-            base_z2 = find_roof_z_below(p2, roof_surfaces)
+            # Use the highest roof Z directly below each point
+            base_z1 = base_zs[offset + i]
+            base_z2 = base_zs[offset + i + 1]
 
-            if base_z1 is None or base_z2 is None:
+            if np.isnan(base_z1) or np.isnan(base_z2):
                 print("BASE COULD NOT BE DETERMINED")
                 continue  # Skip wall if we couldn't determine base
 
@@ -207,12 +234,13 @@ def extrude_footprints(extrusion_tops, roof_surfaces):
             wall = [
                 (p1[0], p1[1], p1[2]),
                 (p2[0], p2[1], p2[2]),
-                (p2[0], p2[1], base_z2),
-                (p1[0], p1[1], base_z1),
+                (p2[0], p2[1], float(base_z2)),
+                (p1[0], p1[1], float(base_z1)),
                 (p1[0], p1[1], p1[2])  # close polygon
             ]
             extrusion_walls_element.append(wall)
         extrusion_walls.append(extrusion_walls_element)
+        offset += len(top_surface)
     return extrusion_walls
 
 def download_LOD2_file(state, utm_easting, utm_northing):
@@ -244,12 +272,371 @@ def create_ground_surface_list(xml_root, ns):
             footprints[bid] = Polygon(pts)
     return footprints
 
-def extract_building_data(xml_root, target_address=None, target_building_id=None, ns=None, roof_numbers=None):
+def get_building_data(building, search_value, search_type, roof_numbers, xml_root, ns, footprints, tile_cache_dir=None, wall_adjacency=None):
+    """
+    Extracts relevant building data from a given building element.
+    xml_root, footprints and wall_adjacency describe the whole tile and are needed for the detection of attached walls.
+    """
+    height_roof_elem = building.find(".//gen:stringAttribute[@name='HoeheDach']/gen:value", ns)
+    height_ground_elem = building.find(".//gen:stringAttribute[@name='HoeheGrund']/gen:value", ns)
+    height_roof_lowerend_elem = building.find(".//gen:stringAttribute[@name='NiedrigsteTraufeDesGebaeudes']/gen:value", ns)
+    if height_roof_lowerend_elem is None:
+        height_roof_lowerend_elem = building.find(".//gen:stringAttribute[@name='MittlereTraufHoehe']/gen:value", ns)
+    roof_type_elem = building.find(".//bldg:roofType", ns)
+    measured_height_elem = building.find(".//bldg:measuredHeight", ns)
+    storeys_elem = building.find(".//bldg:storeysAboveGround", ns)
+    groundsurface_elem = building.find(".//bldg:GroundSurface/gen:stringAttribute[@name='Flaeche']/gen:value", ns)
+
+    # Initialize variables for ground and wall surfaces
+    total_wall_surface_area = 0.0
+    wall_surface_count = 0
+    total_ground_surface_area = 0.0 
+    ground_surface_count = 0 # There is most likely only 1 ground surface per building defined, but we want to be prepared for exceptions
+    ground_surface_middle = []
+    total_roof_surface_area = 0.0
+    roof_surface_count = 0
+
+    total_ground_surface_area = 0.0
+    ground_surface_count = 0
+    ground_surface_shape = []
+
+    roof_surface_pitches = []
+    # Iterate through all ground surface elements in the building (there should be just one, but to be sure)
+    for ground_surface in building.findall(".//bldg:GroundSurface", ns):
+        pos_list = ground_surface.find(".//gml:posList", ns)
+        if pos_list is None:
+            # no geometry, skip but still count?
+            ground_surface_count += 1
+            continue
+
+        try:
+            vals = [float(v) for v in pos_list.text.split()]
+            geom = [(vals[i], vals[i+1], vals[i+2]) for i in range(0, len(vals), 3)]
+        except (ValueError, IndexError) as e:
+            wid = ground_surface.get("{gml:id}", "unknown")
+            print(f"Warning: bad coords on ground surface {wid}: {e}")
+            ground_surface_count += 1
+            continue
+
+        # compute area from geom
+        area = round(polygon_area_3d(geom), 2)
+        total_ground_surface_area += area
+        ground_surface_count += 1
+
+        # Extract coordinates from gml:posList
+        pos_list_elem = ground_surface.find(".//gml:posList", ns)
+        if pos_list_elem is not None:
+            try:
+                coords = [float(value) for value in pos_list_elem.text.split()]
+                if len(coords) % 3 == 0:  # Ensure we have (x, y, z) triples
+                    ground_surface_shape.append([(coords[i], coords[i+1], coords[i+2]) for i in range(0, len(coords), 3)])
+                    # Compute centroid (mean of x, y, z)
+                    centroid = np.mean(ground_surface_shape[0], axis=0)
+                    ground_surface_middle.append(centroid)
+            except (ValueError, IndexError) as e:
+                print(f"Warning: Error processing ground surface coordinates: {e}")
+
+    ground_surface_middle = ground_surface_middle[0] # Only one ground surface middle makes sense, there should usually only be one ground surface anyway
+
+    # Iterate through all WallSurface elements in the building
+    wall_surface_geometries = []
+
+    for wall_surface in building.findall(".//bldg:WallSurface", ns):
+        # 1) Geometry: parse posList
+        pos_list_elem = wall_surface.find(".//gml:posList", ns)
+        if pos_list_elem is None:
+            continue
+
+        # build list of (x,y,z)
+        try:
+            vals = [float(v) for v in pos_list_elem.text.split()]
+            geom = [(vals[i], vals[i+1], vals[i+2]) 
+                    for i in range(0, len(vals), 3)]
+        except (ValueError, IndexError) as e:
+            wid = wall_surface.get("{gml:id}", "unknown")
+            print(f"Warning: bad coords on wall {wid}: {e}")
+            continue
+
+        wall_surface_geometries.append(geom)
+    
+
+    roof_surface_geometries = []
+    # Iterate through all RoofSurface elements in the building
+    for roof_surface in building.findall(".//bldg:RoofSurface", ns):
+        # 1) find the posList
+        pos_list = roof_surface.find(".//gml:posList", ns)
+        if pos_list is None:
+            # no geometry to measure, but still count it
+            roof_surface_count += 1
+            continue
+
+        # 2) parse into [(x,y,z), …]
+        try:
+            vals = [float(v) for v in pos_list.text.split()]
+            geom = [(vals[i], vals[i+1], vals[i+2]) for i in range(0, len(vals), 3)]
+        except (ValueError, IndexError) as e:
+            wid = roof_surface.get("{gml:id}", "unknown")
+            print(f"Warning: bad coords on roof surface {wid}: {e}")
+            roof_surface_count += 1
+            continue
+
+        # 3) compute area & accumulate
+        area = round(polygon_area_3d(geom), 2)
+        total_roof_surface_area += area
+        roof_surface_count      += 1
+        # Find the posList inside the LinearRing
+        pos_list_elem = roof_surface.find(".//gml:posList", ns)
+        if pos_list_elem is not None:
+            try:
+                # Convert text to a list of floats, handling potential errors
+                coords = [float(value) for value in pos_list_elem.text.split()]
+                # Convert to a list of (x, y, z) tuples
+                geometry = [(coords[i], coords[i+1], coords[i+2]) for i in range(0, len(coords), 3)]
+                roof_surface_geometries.append(geometry)
+            except (ValueError, IndexError) as e:
+                print(f"Warning: Error processing coordinates for wall surface {roof_surface.get('{gml:id}', 'unknown')}: {e}")
+        # Compute pitch of the roof surface and add it to the list
+        roof_surface_pitches.append(compute_roof_pitch(geometry, area))
+
+    totalRP = 0
+    for i in range(len(roof_surface_pitches)):
+        totalRP += roof_surface_pitches[i][0] * roof_surface_pitches[i][1]
+
+    avg_roof_pitch = totalRP / total_roof_surface_area
+    
+    # Get values if they exist
+    height_roof = height_roof_elem.text if height_roof_elem is not None else "Not found"
+    height_ground = height_ground_elem.text if height_ground_elem is not None else "Not found"
+    height_roof_lowerend = height_roof_lowerend_elem.text if height_roof_lowerend_elem is not None else "Not found"
+    roof_type = roof_type_elem.text if roof_type_elem is not None else "Not found"
+    measured_height = measured_height_elem.text if measured_height_elem is not None else "Not found"
+    storeys = int(storeys_elem.text) if storeys_elem is not None else "Not found"
+
+    # Convert numerical values safely
+    try:
+        height_roof = float(height_roof) if height_roof != "Not found" else None
+        height_ground = float(height_ground) if height_ground != "Not found" else None
+        height_roof_lowerend = float(height_roof_lowerend) if height_roof_lowerend != "Not found" else None
+        calculated_height = height_roof - height_ground if height_roof is not None and height_ground is not None else "Not calculated"
+        total_wall_surface_area = round(float(total_wall_surface_area),2) if total_wall_surface_area != 0.0 else None
+        total_ground_surface_area = round(float(total_ground_surface_area),2) if total_ground_surface_area != 0.0 else None
+        total_roof_surface_area = round(float(total_roof_surface_area),2) if total_roof_surface_area != 0.0 else None
+    except ValueError:
+        calculated_height = "Not calculated"
+
+    # Calculate Bruttogrundflaeche (BGF)
+    if storeys == "Not found":
+        bgf = round(int(float(measured_height)/3.5) * total_ground_surface_area, 2) if total_ground_surface_area is not None else None
+        storeys = float(measured_height)/3.5
+        hint = "BGF und Stockwerkanzahl geschätzt, keine Angabe zur Stockwerkanzahl verfügbar"
+    else:
+        bgf = round(total_ground_surface_area*storeys, 2) if total_ground_surface_area is not None else None
+        hint = "-"
+
+    # Get roof type name
+    roof_type_name = roof_numbers.get(int(roof_type), "Unknown") if roof_type.isdigit() else "Unknown"
+
+    # Handle exceptions if data is missing - may be the case for some states or buildings
+    if height_ground is None:
+        height_ground = 0
+
+    current_building_id = building.get("{http://www.opengis.net/gml}id")
+    # "Repair" the geometry, in case it is not watertight. Welding + triangulation only depend on the tile, so the result is cached per tile version.
+    repaired_geom = load_building_mesh(tile_cache_dir, current_building_id)
+    if repaired_geom is None:
+        repaired_geom = repair_geometry(wall_surface_geometries, roof_surface_geometries, ground_surface_shape, ground_surface_middle)
+        save_building_mesh(tile_cache_dir, current_building_id, repaired_geom)
+                # --- Calculate facade areas by cardinal direction ---
+
+    # Repaired Geometry lead to more issues than it solves, so it is not being used right now (except for triangulating the geometry)
+    # wall_surface_geometries = repaired_geom["wall_surface_geometries"]
+    # roof_surface_geometries = repaired_geom["roof_surface_geometries"]
+    # ground_surface_shape = repaired_geom["ground_surface_shape"]
+    triangulated_geom = repaired_geom["triangulation"]
+    mesh = repaired_geom["mesh"]
+    # Welded surfaces (the same ones that were triangulated), used for the volume calculation
+    repaired_surfaces = {
+        "wall": repaired_geom["wall_surface_geometries"],
+        "roof": repaired_geom["roof_surface_geometries"],
+        "ground": repaired_geom["ground_surface_shape"],
+    }
+
+    # Detection of attached houses
+    # Pass the original target_building_id (could be single or list)
+    subtracted_walls_result = subtract_attached_walls(wall_surface_geometries, xml_root, ns, coords, current_building_id, footprints, wall_adjacency)
+    wall_geometries_external = subtracted_walls_result["Wall_geometries_external"]
+    neighbour_lod2_ids = subtracted_walls_result["neighbour_lod2_ids"] # add neighbouring LOD2 ids, later we may want to visualize these
+    neighbour_geometries = subtracted_walls_result["neighbour_geometries"]
+    surrounding_buildings_lod2_ids = subtracted_walls_result["surrounding_buildings_lod2_ids"]
+    surrounding_buildings_geometries = subtracted_walls_result["surrounding_buildings_geometries"]
+
+    # Calculate facade area for each of the 8 cardinal directions (N, NE, E, SE, S, SW, W, NW)
+    if len(mesh.faces) > 0:
+        # Calculate face areas and normals for the external walls - as they might not enclose a volume (attached wallls substracted), use the complete mesh as reference volume.
+        face_areas, face_normals, total_facade_area = calculate_external_wall_properties(wall_geometries_external, mesh)
+        if face_areas.size > 0:
+            facade_areas_by_dir, avg_normal_by_direction, geometries_by_direction = facade_areas_by_direction(face_normals, face_areas, wall_geometries_external)
+            facade_refpoints = get_middle_points(avg_normal_by_direction, facade_areas_by_dir, ground_surface_middle, mesh.vertices) # reference points for photo markers
+        else:
+            # Handle case with no external walls
+            facade_areas_by_dir = {d: 0.0 for d in ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]}
+            avg_normal_by_direction = {d: np.array([0,0,0]) for d in ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]}
+            geometries_by_direction = {d: [] for d in ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]}
+            facade_refpoints = {}
+            print("WARNING: No external wall geometries found or processed.")
+
+    # Return all the results. More results can be enabled again by uncommenting if needed.
+    # But take care when enabling more results - names have to match the database or have to be excluded from being uploaded to the database.
+    return {
+        search_type: search_value,
+        "Height_NN": height_ground,
+        "coordinates": coords,
+        #"Hoehe Dach": height_roof,
+        "Eave_height": height_roof_lowerend-height_ground if height_roof_lowerend is not None and height_ground is not None else None, # return 0 if eave height not available
+        #"Berechnete Hoehe Gebaeude": calculated_height,
+        "Roof_type_nr": roof_type,
+        "Roof_type_name": roof_type_name,
+        "Roof_pitch_avg": avg_roof_pitch,
+        "Height": measured_height,
+        "Storeys": storeys,
+        "Ground_area": total_ground_surface_area,
+        #"Gefundene Grundflächen": ground_surface_count,
+        "Ground_area_geometry": ground_surface_shape,
+        "Ground_area_middle": ground_surface_middle,
+        "Wall_surface_tot": total_facade_area,
+        "Roof_area": total_roof_surface_area,
+        "Amount_roof_surfaces": roof_surface_count,
+        "Roof_geometries": roof_surface_geometries,
+        "Wall_geometries": wall_surface_geometries,
+        "Wall_geometries_external": wall_geometries_external,
+        "Wall_centers": facade_refpoints,
+        "Facade_area_N": facade_areas_by_dir["N"],
+        "Facade_area_NE": facade_areas_by_dir["NE"],
+        "Facade_area_E": facade_areas_by_dir["E"],
+        "Facade_area_SE": facade_areas_by_dir["SE"],
+        "Facade_area_S": facade_areas_by_dir["S"],
+        "Facade_area_SW": facade_areas_by_dir["SW"],
+        "Facade_area_W": facade_areas_by_dir["W"],
+        "Facade_area_NW": facade_areas_by_dir["NW"],
+        "facade_N": geometries_by_direction["N"],
+        "facade_NE": geometries_by_direction["NE"],
+        "facade_E": geometries_by_direction["E"],
+        "facade_SE": geometries_by_direction["SE"],
+        "facade_S": geometries_by_direction["S"],
+        "facade_SW": geometries_by_direction["SW"],
+        "facade_W": geometries_by_direction["W"],
+        "facade_NW": geometries_by_direction["NW"],
+        "BGF": bgf,
+        "Hint": hint,
+        "Triangulated_Geometry": triangulated_geom, 
+        "Mesh": mesh,
+        "Repaired_Geometry": repaired_surfaces,
+        "neighbour_lod2_ids": neighbour_lod2_ids,
+        "neighbour_geometries": neighbour_geometries,
+        "surrounding_buildings_lod2_ids": surrounding_buildings_lod2_ids,
+        "surrounding_buildings_geometries": surrounding_buildings_geometries
+    }
+
+# Buildings that consist of at least this many LOD2 parts are processed in a process pool, smaller ones stay in-process
+PARALLEL_PARTS_MIN = int(os.getenv("PARALLEL_PARTS_MIN", "4"))
+PARALLEL_PARTS_MAX_WORKERS = int(os.getenv("PARALLEL_PARTS_MAX_WORKERS", str(os.cpu_count() or 1)))
+
+# One pool per API process, started once with "spawn": the API process runs threads (thread pool, outbox flusher),
+# forking it could copy locks held by them into the workers. The workers load the tile themselves from its file.
+_parts_executor = None
+_parts_executor_lock = threading.Lock()
+# Tile loaded in a worker process: (gml_path, tile_version) -> (buildings by gml:id, tile_args)
+_worker_tile = {}
+
+def _get_parts_executor():
+    global _parts_executor
+    with _parts_executor_lock:
+        if _parts_executor is None:
+            _parts_executor = ProcessPoolExecutor(PARALLEL_PARTS_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _parts_executor
+
+def _reset_parts_executor(executor):
+    global _parts_executor
+    with _parts_executor_lock:
+        if _parts_executor is executor:
+            _parts_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _load_worker_tile(gml_path, tile_version, ns):
+    # Runs in the worker: parses the tile once per version, the attached walls come from the tile cache written by the API process
+    key = (gml_path, tile_version)
+    if key not in _worker_tile:
+        _worker_tile.clear() # keep only the current tile in memory
+        xml_root = ET.parse(gml_path).getroot()
+        tile_cache_dir = get_tile_cache_dir(gml_path)
+        buildings = {building.get("{http://www.opengis.net/gml}id"): building for building in xml_root.findall(".//bldg:Building", ns)}
+        footprints = create_ground_surface_list(xml_root, ns)
+        tile_args = (xml_root, ns, footprints, tile_cache_dir, get_wall_adjacency(xml_root, ns, tile_cache_dir, footprints))
+        _worker_tile[key] = (buildings, tile_args)
+    return _worker_tile[key]
+
+def _process_building_parts_in_worker(gml_path, tile_version, ns, part_specs):
+    buildings, tile_args = _load_worker_tile(gml_path, tile_version, ns)
+    return [get_building_data(buildings[gml_id], search_value, search_type, roof_numbers, *tile_args)
+            for gml_id, search_value, search_type, roof_numbers in part_specs]
+
+def process_building_parts(parts, tile_args, gml_path=None, tile_version=None):
+    """
+    Runs get_building_data() for several parts of a building (list of argument tuples (building, search_value, search_type, roof_numbers)).
+    From PARALLEL_PARTS_MIN parts on, and if the tile file (gml_path) is known, the parts are split among the worker processes
+    of the shared pool, which only receive the gml:ids of the parts. Otherwise, or if the pool fails, they are processed in-process.
+    Returns the results in the order of the parts, so the aggregation does not depend on which worker finishes first.
+    """
+    workers = min(len(parts), PARALLEL_PARTS_MAX_WORKERS)
+    if len(parts) < PARALLEL_PARTS_MIN or workers < 2 or gml_path is None:
+        return [get_building_data(*part, *tile_args) for part in parts]
+
+    ns = tile_args[1]
+    specs = [(building.get("{http://www.opengis.net/gml}id"), search_value, search_type, roof_numbers)
+             for building, search_value, search_type, roof_numbers in parts]
+    chunks = [specs[i::workers] for i in range(workers)] # round robin, chunk i holds the parts i, i + workers, ...
+    executor = _get_parts_executor()
+    try:
+        futures = [executor.submit(_process_building_parts_in_worker, gml_path, tile_version, ns, chunk) for chunk in chunks]
+        chunk_results = [future.result() for future in futures]
+    except BrokenProcessPool as e:
+        print(f"Warning: Parallel processing of the building parts failed ({e}), processing them sequentially.")
+        _reset_parts_executor(executor)
+        return [get_building_data(*part, *tile_args) for part in parts]
+    results = [None] * len(parts)
+    for i, chunk_result in enumerate(chunk_results):
+        results[i::workers] = chunk_result
+    return results
+
+def get_building_parts_cached(parts, tile_args, tile_version=None, gml_path=None):
+    """
+    Like process_building_parts(), but the data of every part is kept in the in-process cache (helpers.result_cache.building_parts),
+    so a changed selection of buildings only processes the newly selected parts. Without tile_version nothing is cached.
+    The returned dicts are shared with the cache and must not be modified.
+    """
+    if tile_version is None:
+        return process_building_parts(parts, tile_args, gml_path)
+    keys = [(tile_version, building.get("{http://www.opengis.net/gml}id"), search_value, search_type) for building, search_value, search_type, _ in parts]
+    results = [building_parts.get(key) for key in keys]
+    missing = [idx for idx, data in enumerate(results) if data is None]
+    if len(missing) < len(parts):
+        print(f"{len(parts) - len(missing)} of {len(parts)} building part(s) taken from the cache")
+    if missing:
+        for idx, data in zip(missing, process_building_parts([parts[idx] for idx in missing], tile_args, gml_path, tile_version)):
+            results[idx] = data
+            building_parts.put(keys[idx], data)
+    return results
+
+def extract_building_data(xml_root, target_address=None, target_building_id=None, ns=None, roof_numbers=None, tile_cache_dir=None, footprints=None, tile_version=None, gml_path=None, wall_adjacency=None):
     """
     Extracts building data from a CityGML file by either address or building ID.
     
     :param target_address: The address to search for.
     :param target_building_id: The building ID (string) or list of building IDs to search for.
+    :param tile_cache_dir: Cache directory of the current tile version (see helpers.tile_cache). If given, repaired meshes are loaded from / stored there.
+    :param footprints: Footprints of all buildings of the tile (create_ground_surface_list()), parsed here if not given.
+    :param tile_version: Version of the tile (helpers.tile_cache.get_tile_version()). If given, the data of every building is kept in the in-process cache.
+    :param wall_adjacency: Wall adjacency of the tile (get_wall_adjacency()), loaded once per tile version by the caller. Loaded here if not given.
     :return: Dictionary with building information.
     """
     # Normalize target_building_id to a list
@@ -268,258 +655,12 @@ def extract_building_data(xml_root, target_address=None, target_building_id=None
     else:
         building_ids = None
     
-    def get_building_data(building, search_value, search_type, roof_numbers):
-        #Extracts relevant building data from a given building element.
-        height_roof_elem = building.find(".//gen:stringAttribute[@name='HoeheDach']/gen:value", ns)
-        height_ground_elem = building.find(".//gen:stringAttribute[@name='HoeheGrund']/gen:value", ns)
-        height_roof_lowerend_elem = building.find(".//gen:stringAttribute[@name='NiedrigsteTraufeDesGebaeudes']/gen:value", ns)
-        if height_roof_lowerend_elem is None:
-            height_roof_lowerend_elem = building.find(".//gen:stringAttribute[@name='MittlereTraufHoehe']/gen:value", ns)
-        roof_type_elem = building.find(".//bldg:roofType", ns)
-        measured_height_elem = building.find(".//bldg:measuredHeight", ns)
-        storeys_elem = building.find(".//bldg:storeysAboveGround", ns)
-        groundsurface_elem = building.find(".//bldg:GroundSurface/gen:stringAttribute[@name='Flaeche']/gen:value", ns)
-
-        # Initialize variables for ground and wall surfaces
-        total_wall_surface_area = 0.0
-        wall_surface_count = 0
-        total_ground_surface_area = 0.0 
-        ground_surface_count = 0 # There is most likely only 1 ground surface per building defined, but we want to be prepared for exceptions
-        ground_surface_middle = []
-        total_roof_surface_area = 0.0
-        roof_surface_count = 0
-
-        total_ground_surface_area = 0.0
-        ground_surface_count = 0
-        ground_surface_shape = []
-
-        roof_surface_pitches = []
-        # Iterate through all ground surface elements in the building (there should be just one, but to be sure)
-        for ground_surface in building.findall(".//bldg:GroundSurface", ns):
-            pos_list = ground_surface.find(".//gml:posList", ns)
-            if pos_list is None:
-                # no geometry, skip but still count?
-                ground_surface_count += 1
-                continue
-
-            try:
-                vals = [float(v) for v in pos_list.text.split()]
-                geom = [(vals[i], vals[i+1], vals[i+2]) for i in range(0, len(vals), 3)]
-            except (ValueError, IndexError) as e:
-                wid = ground_surface.get("{gml:id}", "unknown")
-                print(f"Warning: bad coords on ground surface {wid}: {e}")
-                ground_surface_count += 1
-                continue
-
-            # compute area from geom
-            area = round(polygon_area_3d(geom), 2)
-            total_ground_surface_area += area
-            ground_surface_count += 1
-
-            # Extract coordinates from gml:posList
-            pos_list_elem = ground_surface.find(".//gml:posList", ns)
-            if pos_list_elem is not None:
-                try:
-                    coords = [float(value) for value in pos_list_elem.text.split()]
-                    if len(coords) % 3 == 0:  # Ensure we have (x, y, z) triples
-                        ground_surface_shape.append([(coords[i], coords[i+1], coords[i+2]) for i in range(0, len(coords), 3)])
-                        # Compute centroid (mean of x, y, z)
-                        centroid = np.mean(ground_surface_shape[0], axis=0)
-                        ground_surface_middle.append(centroid)
-                except (ValueError, IndexError) as e:
-                    print(f"Warning: Error processing ground surface coordinates: {e}")
-
-        ground_surface_middle = ground_surface_middle[0] # Only one ground surface middle makes sense, there should usually only be one ground surface anyway
-
-        # Iterate through all WallSurface elements in the building
-        wall_surface_geometries = []
-
-        for wall_surface in building.findall(".//bldg:WallSurface", ns):
-            # 1) Geometry: parse posList
-            pos_list_elem = wall_surface.find(".//gml:posList", ns)
-            if pos_list_elem is None:
-                continue
-
-            # build list of (x,y,z)
-            try:
-                vals = [float(v) for v in pos_list_elem.text.split()]
-                geom = [(vals[i], vals[i+1], vals[i+2]) 
-                        for i in range(0, len(vals), 3)]
-            except (ValueError, IndexError) as e:
-                wid = wall_surface.get("{gml:id}", "unknown")
-                print(f"Warning: bad coords on wall {wid}: {e}")
-                continue
-
-            wall_surface_geometries.append(geom)
-        
-
-        roof_surface_geometries = []
-        # Iterate through all RoofSurface elements in the building
-        for roof_surface in building.findall(".//bldg:RoofSurface", ns):
-            # 1) find the posList
-            pos_list = roof_surface.find(".//gml:posList", ns)
-            if pos_list is None:
-                # no geometry to measure, but still count it
-                roof_surface_count += 1
-                continue
-
-            # 2) parse into [(x,y,z), …]
-            try:
-                vals = [float(v) for v in pos_list.text.split()]
-                geom = [(vals[i], vals[i+1], vals[i+2]) for i in range(0, len(vals), 3)]
-            except (ValueError, IndexError) as e:
-                wid = roof_surface.get("{gml:id}", "unknown")
-                print(f"Warning: bad coords on roof surface {wid}: {e}")
-                roof_surface_count += 1
-                continue
-
-            # 3) compute area & accumulate
-            area = round(polygon_area_3d(geom), 2)
-            total_roof_surface_area += area
-            roof_surface_count      += 1
-            # Find the posList inside the LinearRing
-            pos_list_elem = roof_surface.find(".//gml:posList", ns)
-            if pos_list_elem is not None:
-                try:
-                    # Convert text to a list of floats, handling potential errors
-                    coords = [float(value) for value in pos_list_elem.text.split()]
-                    # Convert to a list of (x, y, z) tuples
-                    geometry = [(coords[i], coords[i+1], coords[i+2]) for i in range(0, len(coords), 3)]
-                    roof_surface_geometries.append(geometry)
-                except (ValueError, IndexError) as e:
-                    print(f"Warning: Error processing coordinates for wall surface {roof_surface.get('{gml:id}', 'unknown')}: {e}")
-            # Compute pitch of the roof surface and add it to the list
-            roof_surface_pitches.append(compute_roof_pitch(geometry, area))
-
-        totalRP = 0
-        for i in range(len(roof_surface_pitches)):
-            totalRP += roof_surface_pitches[i][0] * roof_surface_pitches[i][1]
-
-        avg_roof_pitch = totalRP / total_roof_surface_area
-        
-        # Get values if they exist
-        height_roof = height_roof_elem.text if height_roof_elem is not None else "Not found"
-        height_ground = height_ground_elem.text if height_ground_elem is not None else "Not found"
-        height_roof_lowerend = height_roof_lowerend_elem.text if height_roof_lowerend_elem is not None else "Not found"
-        roof_type = roof_type_elem.text if roof_type_elem is not None else "Not found"
-        measured_height = measured_height_elem.text if measured_height_elem is not None else "Not found"
-        storeys = int(storeys_elem.text) if storeys_elem is not None else "Not found"
-
-        # Convert numerical values safely
-        try:
-            height_roof = float(height_roof) if height_roof != "Not found" else None
-            height_ground = float(height_ground) if height_ground != "Not found" else None
-            height_roof_lowerend = float(height_roof_lowerend) if height_roof_lowerend != "Not found" else None
-            calculated_height = height_roof - height_ground if height_roof is not None and height_ground is not None else "Not calculated"
-            total_wall_surface_area = round(float(total_wall_surface_area),2) if total_wall_surface_area != 0.0 else None
-            total_ground_surface_area = round(float(total_ground_surface_area),2) if total_ground_surface_area != 0.0 else None
-            total_roof_surface_area = round(float(total_roof_surface_area),2) if total_roof_surface_area != 0.0 else None
-        except ValueError:
-            calculated_height = "Not calculated"
-
-        # Calculate Bruttogrundflaeche (BGF)
-        if storeys == "Not found":
-            bgf = round(int(float(measured_height)/3.5) * total_ground_surface_area, 2) if total_ground_surface_area is not None else None
-            storeys = float(measured_height)/3.5
-            hint = "BGF und Stockwerkanzahl geschätzt, keine Angabe zur Stockwerkanzahl verfügbar"
-        else:
-            bgf = round(total_ground_surface_area*storeys, 2) if total_ground_surface_area is not None else None
-            hint = "-"
-
-        # Get roof type name
-        roof_type_name = roof_numbers.get(int(roof_type), "Unknown") if roof_type.isdigit() else "Unknown"
-
-        # Handle exceptions if data is missing - may be the case for some states or buildings
-        if height_ground is None:
-            height_ground = 0
-
-        # "Repair" the geometry, in case it is not watertight. Not yet optimized, also repairs neighbouring buildings when checking for attached walls.
-        repaired_geom = repair_geometry(wall_surface_geometries, roof_surface_geometries, ground_surface_shape, ground_surface_middle)
-                    # --- Calculate facade areas by cardinal direction ---
-
-        # Repaired Geometry lead to more issues than it solves, so it is not being used right now (except for triangulating the geometry)
-        # wall_surface_geometries = repaired_geom["wall_surface_geometries"]
-        # roof_surface_geometries = repaired_geom["roof_surface_geometries"]
-        # ground_surface_shape = repaired_geom["ground_surface_shape"]
-        triangulated_geom = repaired_geom["triangulation"]
-        mesh = repaired_geom["mesh"]
-
-        # Detection of attached houses
+    # Footprints of all buildings, needed to find the neighbours for the detection of attached houses
+    if footprints is None:
         footprints = create_ground_surface_list(xml_root, ns)
-        # Pass the original target_building_id (could be single or list)
-        current_building_id = building.get("{http://www.opengis.net/gml}id")
-        subtracted_walls_result = subtract_attached_walls(wall_surface_geometries, xml_root, ns, coords, current_building_id, footprints)
-        wall_geometries_external = subtracted_walls_result["Wall_geometries_external"]
-        neighbour_lod2_ids = subtracted_walls_result["neighbour_lod2_ids"] # add neighbouring LOD2 ids, later we may want to visualize these
-        neighbour_geometries = subtracted_walls_result["neighbour_geometries"]
-        surrounding_buildings_lod2_ids = subtracted_walls_result["surrounding_buildings_lod2_ids"]
-        surrounding_buildings_geometries = subtracted_walls_result["surrounding_buildings_geometries"]
-
-        # Calculate facade area for each of the 8 cardinal directions (N, NE, E, SE, S, SW, W, NW)
-        if len(mesh.faces) > 0:
-            # Calculate face areas and normals for the external walls - as they might not enclose a volume (attached wallls substracted), use the complete mesh as reference volume.
-            face_areas, face_normals, total_facade_area = calculate_external_wall_properties(wall_geometries_external, mesh)
-            if face_areas.size > 0:
-                facade_areas_by_dir, avg_normal_by_direction, geometries_by_direction = facade_areas_by_direction(face_normals, face_areas, wall_geometries_external)
-                facade_refpoints = get_middle_points(avg_normal_by_direction, facade_areas_by_dir, ground_surface_middle, mesh.vertices) # reference points for photo markers
-            else:
-                # Handle case with no external walls
-                facade_areas_by_dir = {d: 0.0 for d in ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]}
-                avg_normal_by_direction = {d: np.array([0,0,0]) for d in ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]}
-                geometries_by_direction = {d: [] for d in ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]}
-                facade_refpoints = {}
-                print("WARNING: No external wall geometries found or processed.")
-
-        # Return all the results. More results can be enabled again by uncommenting if needed.
-        # But take care when enabling more results - names have to match the database or have to be excluded from being uploaded to the database.
-        return {
-            search_type: search_value,
-            "Height_NN": height_ground,
-            "coordinates": coords,
-            #"Hoehe Dach": height_roof,
-            "Eave_height": height_roof_lowerend-height_ground if height_roof_lowerend is not None and height_ground is not None else None, # return 0 if eave height not available
-            #"Berechnete Hoehe Gebaeude": calculated_height,
-            "Roof_type_nr": roof_type,
-            "Roof_type_name": roof_type_name,
-            "Roof_pitch_avg": avg_roof_pitch,
-            "Height": measured_height,
-            "Storeys": storeys,
-            "Ground_area": total_ground_surface_area,
-            #"Gefundene Grundflächen": ground_surface_count,
-            "Ground_area_geometry": ground_surface_shape,
-            "Ground_area_middle": ground_surface_middle,
-            "Wall_surface_tot": total_facade_area,
-            "Roof_area": total_roof_surface_area,
-            "Amount_roof_surfaces": roof_surface_count,
-            "Roof_geometries": roof_surface_geometries,
-            "Wall_geometries": wall_surface_geometries,
-            "Wall_geometries_external": wall_geometries_external,
-            "Wall_centers": facade_refpoints,
-            "Facade_area_N": facade_areas_by_dir["N"],
-            "Facade_area_NE": facade_areas_by_dir["NE"],
-            "Facade_area_E": facade_areas_by_dir["E"],
-            "Facade_area_SE": facade_areas_by_dir["SE"],
-            "Facade_area_S": facade_areas_by_dir["S"],
-            "Facade_area_SW": facade_areas_by_dir["SW"],
-            "Facade_area_W": facade_areas_by_dir["W"],
-            "Facade_area_NW": facade_areas_by_dir["NW"],
-            "facade_N": geometries_by_direction["N"],
-            "facade_NE": geometries_by_direction["NE"],
-            "facade_E": geometries_by_direction["E"],
-            "facade_SE": geometries_by_direction["SE"],
-            "facade_S": geometries_by_direction["S"],
-            "facade_SW": geometries_by_direction["SW"],
-            "facade_W": geometries_by_direction["W"],
-            "facade_NW": geometries_by_direction["NW"],
-            "BGF": bgf,
-            "Hint": hint,
-            "Triangulated_Geometry": triangulated_geom, 
-            "Mesh": mesh,
-            "neighbour_lod2_ids": neighbour_lod2_ids,
-            "neighbour_geometries": neighbour_geometries,
-            "surrounding_buildings_lod2_ids": surrounding_buildings_lod2_ids,
-            "surrounding_buildings_geometries": surrounding_buildings_geometries
-        }
+    # Attached walls of all buildings of the tile, computed once per tile version (None without tile cache)
+    if wall_adjacency is None:
+        wall_adjacency = get_wall_adjacency(xml_root, ns, tile_cache_dir, footprints)
 
     # First, try searching by building ID(s)
     if building_ids:
@@ -533,18 +674,19 @@ def extract_building_data(xml_root, target_address=None, target_building_id=None
         if not matched_buildings:
             return {"Error": "Building(s) not found by ID"}
         
+        tile_args = (xml_root, ns, footprints, tile_cache_dir, wall_adjacency)
+        parts = [(building, building_ids[idx], "Building ID", roof_numbers) for idx, building in enumerate(matched_buildings)]
         # If single building, return as before
         if len(matched_buildings) == 1:
-            return get_building_data(matched_buildings[0], building_ids[0], "Building ID", roof_numbers)
+            return get_building_parts_cached(parts, tile_args, tile_version, gml_path)[0]
         
-        # Multiple buildings: aggregate data
+        # Multiple buildings: process the parts (in parallel for large complexes), then aggregate the data in the original order
         aggregated_data = None
-        for idx, building in enumerate(matched_buildings):
-            building_data = get_building_data(building, building_ids[idx], "Building ID", roof_numbers)
+        for building_data in get_building_parts_cached(parts, tile_args, tile_version, gml_path):
             
             if aggregated_data is None:
-                # First building: initialize with its data
-                aggregated_data = building_data.copy()
+                # First building: initialize with its data (copy the lists, they are extended below and may be shared with the cache)
+                aggregated_data = {key: list(value) if isinstance(value, list) else value for key, value in building_data.items()}
                 # Convert single values to lists where appropriate for aggregation
             else:
                 # Aggregate geometries (append to lists)
@@ -584,7 +726,7 @@ def extract_building_data(xml_root, target_address=None, target_building_id=None
             address_elem = building.find(".//xAL:ThoroughfareName", ns)
             if address_elem is not None and address_elem.text == target_address:
                 print("No building ID identified, found by address")
-                return get_building_data(building, target_address, "Address", roof_numbers)
+                return get_building_data(building, target_address, "Address", roof_numbers, xml_root, ns, footprints, tile_cache_dir, wall_adjacency)
 
     # If neither is found, return an error message
     return {"Error": "Building not found by Address or ID"}
\ No newline at end of file
@@ -31,4 +31,28 @@ def filter_points_by_location(points_xyz, shape_coords, tolerance = 1.0):
     # Check containment
     mask = np.array([prepared_poly.contains(Point(xy)) for xy in points_xyz[:, :2]])
 
-    return mask
\ No newline at end of file
+    return mask
+
+def voxel_downsample(points_xyz, voxel_size):
+    """
+    Downsamples a point cloud onto a regular voxel grid, every occupied voxel is represented by the centroid of its points.
+    Parameters:
+    - points_xyz: np.ndarray of shape (N, 3), input points.
+    - voxel_size: float, edge length of a voxel in metres.
+
+    Returns:
+    - centroids: np.ndarray of shape (M, 3), one point per occupied voxel.
+    - voxel_index: np.ndarray of shape (N,), index into centroids for every input point.
+    """
+    points_xyz = np.asarray(points_xyz, dtype=float)
+    if len(points_xyz) == 0:
+        return np.empty((0, 3), dtype=float), np.empty(0, dtype=np.int64)
+
+    keys = np.floor((points_xyz - points_xyz.min(axis=0)) / voxel_size).astype(np.int64)
+    _, voxel_index, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    voxel_index = voxel_index.reshape(-1)
+
+    centroids = np.column_stack([
+        np.bincount(voxel_index, weights=points_xyz[:, dim], minlength=len(counts)) for dim in range(3)
+    ]) / counts[:, None]
+    return centroids, voxel_index
@@ -0,0 +1,166 @@
+import numpy as np
+
+# Surface type codes used in PolygonArray.surface_type (and in the tile cache)
+SURFACE_TYPES = ["wall", "roof", "ground"]
+
+
+class PolygonArray:
+    """
+    Columnar container for many 3D polygons (rings), e.g. all wall, roof and ground surfaces of a building.
+    Instead of nested lists of point tuples, the polygons are stored as
+        coords:       flat float64 coordinate buffer, shape (N, 3)
+        offsets:      ring i is coords[offsets[i]:offsets[i+1]], shape (n+1,)
+        surface_type: index into SURFACE_TYPES for every ring, shape (n,)
+    The kernels (areas, normals, centroids, bounds, ...) work on all rings at once.
+    Convert from / to lists only at the edges (parsing, database, JSON) with from_polygons() and to_polygons().
+    """
+
+    def __init__(self, coords, offsets, surface_type=None):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if surface_type is None:
+            surface_type = np.zeros(len(self.offsets) - 1, dtype=np.int8)
+        self.surface_type = np.asarray(surface_type, dtype=np.int8)
+
+    @classmethod
+    def from_polygons(cls, polygons, surface_type="wall"):
+        # polygons: list of rings, each a list of (x, y, z) points
+        lengths = np.array([len(p) for p in polygons], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        if offsets[-1] == 0:
+            coords = np.empty((0, 3))
+        else:
+            coords = np.array([pt for p in polygons for pt in p], dtype=np.float64).reshape(-1, 3)
+        types = np.full(len(lengths), SURFACE_TYPES.index(surface_type), dtype=np.int8)
+        return cls(coords, offsets, types)
+
+    @classmethod
+    def from_surfaces(cls, surfaces):
+        # surfaces: dict surface type -> list of rings, e.g. {"wall": [...], "roof": [...], "ground": [...]}
+        parts = [cls.from_polygons(surfaces[t], t) for t in SURFACE_TYPES if t in surfaces]
+        return cls.concatenate(parts)
+
+    @classmethod
+    def concatenate(cls, arrays):
+        if not arrays:
+            return cls(np.empty((0, 3)), np.zeros(1, dtype=np.int64))
+        coords = np.concatenate([a.coords for a in arrays])
+        starts = np.cumsum([0] + [len(a.coords) for a in arrays[:-1]])
+        offsets = np.concatenate([[0]] + [a.offsets[1:] + s for a, s in zip(arrays, starts)])
+        types = np.concatenate([a.surface_type for a in arrays])
+        return cls(coords, offsets, types)
+
+    def to_polygons(self):
+        # Back to a list of rings, each a list of (x, y, z) tuples of Python floats
+        coords = self.coords.tolist()
+        return [[tuple(pt) for pt in coords[self.offsets[i]:self.offsets[i + 1]]] for i in range(len(self))]
+
+    def to_surfaces(self):
+        # Inverse of from_surfaces()
+        return {t: self.of_type(t).to_polygons() for t in SURFACE_TYPES}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def ring_index(self):
+        # Index of the ring of every vertex, shape (N,)
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    @property
+    def next_index(self):
+        # Index of the next vertex of every vertex, wrapping around within its own ring
+        next_idx = np.arange(len(self.coords)) + 1
+        nonempty = self.lengths > 0
+        next_idx[self.offsets[1:][nonempty] - 1] = self.offsets[:-1][nonempty]
+        return next_idx
+
+    def select(self, idx):
+        # Subset of the rings, idx is a boolean mask or an index array
+        idx = np.arange(len(self))[idx]
+        lengths = self.lengths[idx]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        vertex_idx = np.repeat(self.offsets[:-1][idx] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return PolygonArray(self.coords[vertex_idx], offsets, self.surface_type[idx])
+
+    def of_type(self, surface_type):
+        return self.select(self.surface_type == SURFACE_TYPES.index(surface_type))
+
+    def dedup(self):
+        # Remove consecutive duplicate vertices and the closing vertex (equal to the first one) of every ring
+        if len(self.coords) == 0:
+            return self
+        ring = self.ring_index
+        same_as_prev = np.r_[False, np.all(self.coords[1:] == self.coords[:-1], axis=1) & (ring[1:] == ring[:-1])]
+        keep = ~same_as_prev
+        lengths = np.bincount(ring[keep], minlength=len(self))
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        coords = self.coords[keep]
+        # Closing vertex: last kept vertex equal to the first one of the same ring (only for rings with more than one vertex)
+        candidates = np.flatnonzero(lengths > 1)
+        closed = candidates[np.all(coords[offsets[candidates + 1] - 1] == coords[offsets[candidates]], axis=1)]
+        if len(closed):
+            keep = np.ones(len(coords), dtype=bool)
+            keep[offsets[closed + 1] - 1] = False
+            coords = coords[keep]
+            lengths[closed] -= 1
+            offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        return PolygonArray(coords, offsets, self.surface_type)
+
+    def translated(self, origin):
+        # Same rings, shifted by -origin (UTM coordinates cost precision in the products below)
+        return PolygonArray(self.coords - np.asarray(origin, dtype=np.float64), self.offsets, self.surface_type)
+
+    def _ring_sum(self, values):
+        # Sum of per-vertex values (N, k) per ring, works for empty rings as well
+        ring = self.ring_index
+        return np.stack([np.bincount(ring, weights=values[:, k], minlength=len(self)) for k in range(values.shape[1])], axis=1)
+
+    def newell(self):
+        """
+        Newell vectors (sum of the cross products of consecutive vertices) of all rings, shape (n, 3).
+        The vector points along the polygon normal (orientation given by the winding), its length is twice the polygon area.
+        """
+        if len(self.coords) == 0:
+            return np.zeros((len(self), 3))
+        return self._ring_sum(np.cross(self.coords, self.coords[self.next_index]))
+
+    def areas(self):
+        return 0.5 * np.linalg.norm(self.newell(), axis=1)
+
+    def normals(self):
+        # Unit normals, NaN for degenerate rings
+        newell = self.newell()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return newell / np.linalg.norm(newell, axis=1, keepdims=True)
+
+    def centroids(self):
+        # Vertex mean of every ring (NaN for empty rings)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._ring_sum(self.coords) / self.lengths[:, None]
+
+    def bounds(self):
+        # Axis-aligned bounding boxes, returns (mins, maxs) with shape (n, 3) each (NaN for empty rings)
+        mins = np.full((len(self), 3), np.nan)
+        maxs = np.full((len(self), 3), np.nan)
+        nonempty = self.lengths > 0
+        if nonempty.any():
+            starts = self.offsets[:-1][nonempty]
+            mins[nonempty] = np.minimum.reduceat(self.coords, starts, axis=0)
+            maxs[nonempty] = np.maximum.reduceat(self.coords, starts, axis=0)
+        return mins, maxs
+
+    def first_points(self, k=3):
+        # The first k vertices of every ring, shape (n, k, 3). All rings need at least k vertices.
+        return self.coords[self.offsets[:-1, None] + np.arange(k)]
+
+
+def as_polygon_array(polygons, surface_type="wall"):
+    # Accepts a PolygonArray or a list of rings, so helpers can be called with either
+    if isinstance(polygons, PolygonArray):
+        return polygons
+    return PolygonArray.from_polygons(polygons, surface_type)
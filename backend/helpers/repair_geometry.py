@@ -101,26 +101,29 @@ def _triangulate_polygon_3d(ring3d, *, engine='earcut', force_vertices=False):
 def _triangulate_surface_list(surface_polygons, **kw):
     """
     Triangulate a list of 3D polygons.
-    Returns a single packed (vertices, faces) by concatenating results.
+    Returns a single packed (vertices, faces) by concatenating results,
+    plus the index of the source polygon for every face (face-to-surface id).
     """
     all_vertices = []
     all_faces = []
+    all_surface_ids = []
     v_offset = 0
 
-    for ring in surface_polygons:
+    for surface_id, ring in enumerate(surface_polygons):
         V, F = _triangulate_polygon_3d(ring, **kw)
         if len(V) == 0 or len(F) == 0:
             continue
         all_vertices.append(V)
         all_faces.append(F + v_offset)
+        all_surface_ids.append(np.full(len(F), surface_id, dtype=int))
         v_offset += len(V)
 
     if len(all_vertices) == 0:
-        return np.empty((0,3), float), np.empty((0,3), int)
+        return np.empty((0,3), float), np.empty((0,3), int), np.empty(0, int)
 
     Vcat = np.vstack(all_vertices)
     Fcat = np.vstack(all_faces)
-    return Vcat, Fcat
+    return Vcat, Fcat, np.concatenate(all_surface_ids)
 
 def _create_combined_mesh(tri_wall_V, tri_wall_F, tri_roof_V, tri_roof_F, tri_ground_V, tri_ground_F):
     """Creates a single trimesh object from separate triangulated surface components."""
@@ -350,9 +353,9 @@ def repair_geometry(wall_surface_geometries, roof_surface_geometries, ground_sur
             # ---------- Triangulation ----------
             # force_vertices=True is critical to prevent the triangulation from creating new vertices and thus altering the global orientation of the geometry.
             # This ensures the original coordinate system is preserved.
-            tri_wall_V, tri_wall_F     = _triangulate_surface_list(repaired_wall,  engine='earcut', force_vertices=True)
-            tri_roof_V, tri_roof_F     = _triangulate_surface_list(repaired_roof,  engine='earcut', force_vertices=True)
-            tri_ground_V, tri_ground_F = _triangulate_surface_list(repaired_ground,engine='earcut', force_vertices=True)
+            tri_wall_V, tri_wall_F, tri_wall_ids       = _triangulate_surface_list(repaired_wall,  engine='earcut', force_vertices=True)
+            tri_roof_V, tri_roof_F, tri_roof_ids       = _triangulate_surface_list(repaired_roof,  engine='earcut', force_vertices=True)
+            tri_ground_V, tri_ground_F, tri_ground_ids = _triangulate_surface_list(repaired_ground,engine='earcut', force_vertices=True)
 
             # Check: Calculate the total area of the triangulated surfaces
             # --- triangulated surfaces (vectorized) ---
@@ -369,9 +372,9 @@ def repair_geometry(wall_surface_geometries, roof_surface_geometries, ground_sur
                 "roof_surface_geometries": repaired_roof,
                 "ground_surface_shape": repaired_ground,
                 "triangulation": {
-                    "wall":   {"vertices": tri_wall_V,   "faces": tri_wall_F},
-                    "roof":   {"vertices": tri_roof_V,   "faces": tri_roof_F},
-                    "ground": {"vertices": tri_ground_V, "faces": tri_ground_F},
+                    "wall":   {"vertices": tri_wall_V,   "faces": tri_wall_F,   "surface_ids": tri_wall_ids},
+                    "roof":   {"vertices": tri_roof_V,   "faces": tri_roof_F,   "surface_ids": tri_roof_ids},
+                    "ground": {"vertices": tri_ground_V, "faces": tri_ground_F, "surface_ids": tri_ground_ids},
                 },
                 "mesh": repaired_mesh,
                 "total_facade_area": total_facade_area,
@@ -382,9 +385,9 @@ def repair_geometry(wall_surface_geometries, roof_surface_geometries, ground_sur
     print("Geometry could not be repaired! Trying to triangulate & calculate facade areas by cardinal direction anyways.")
     # Still try to triangulate inputs (best effort), so downstream can proceed
     # Also apply force_vertices=True here to maintain consistency.
-    tri_wall_V, tri_wall_F     = _triangulate_surface_list(wall_surface_geometries,  engine='earcut', force_vertices=True)
-    tri_roof_V, tri_roof_F     = _triangulate_surface_list(roof_surface_geometries,  engine='earcut', force_vertices=True)
-    tri_ground_V, tri_ground_F = _triangulate_surface_list(ground_surface_shape,     engine='earcut', force_vertices=True)
+    tri_wall_V, tri_wall_F, tri_wall_ids       = _triangulate_surface_list(wall_surface_geometries,  engine='earcut', force_vertices=True)
+    tri_roof_V, tri_roof_F, tri_roof_ids       = _triangulate_surface_list(roof_surface_geometries,  engine='earcut', force_vertices=True)
+    tri_ground_V, tri_ground_F, tri_ground_ids = _triangulate_surface_list(ground_surface_shape,     engine='earcut', force_vertices=True)
 
     total_facade_area = 0.0
     if len(tri_wall_F):
@@ -400,9 +403,9 @@ def repair_geometry(wall_surface_geometries, roof_surface_geometries, ground_sur
         "roof_surface_geometries": roof_surface_geometries,
         "ground_surface_shape": ground_surface_shape,
         "triangulation": {
-            "wall":   {"vertices": tri_wall_V,   "faces": tri_wall_F},
-            "roof":   {"vertices": tri_roof_V,   "faces": tri_roof_F},
-            "ground": {"vertices": tri_ground_V, "faces": tri_ground_F},
+            "wall":   {"vertices": tri_wall_V,   "faces": tri_wall_F,   "surface_ids": tri_wall_ids},
+            "roof":   {"vertices": tri_roof_V,   "faces": tri_roof_F,   "surface_ids": tri_roof_ids},
+            "ground": {"vertices": tri_ground_V, "faces": tri_ground_F, "surface_ids": tri_ground_ids},
         },
         "mesh": repaired_mesh,
         "total_facade_area": total_facade_area,
@@ -0,0 +1,129 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# In-process caches of the start_process() pipeline stages. Repeated requests for the same building (e.g. only the selection or
+# useLaserData changed) then only recompute the stages that depend on the changed option.
+# The keys always contain the version of the tile(s) the result was computed from (helpers.tile_cache.get_tile_version),
+# so re-downloaded tiles are never served from the cache. Sizes can be set with environment variables, 0 disables a cache.
+PARSED_TILE_CACHE_SIZE = int(os.getenv("PARSED_TILE_CACHE_SIZE", "2"))
+LASER_TILE_CACHE_SIZE = int(os.getenv("LASER_TILE_CACHE_SIZE", "1"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "32"))
+# Upper limit of the (estimated) memory of the entries of each result cache, meshes and laser points can be several MB per building
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "256"))
+
+
+def estimate_size(value, _seen=None) -> int:
+    """
+    Rough size of a cached value in bytes: numpy arrays (also the vertices / faces of trimesh meshes) with their buffer size,
+    dicts, lists and tuples with their items, everything else with sys.getsizeof. Objects referenced twice are counted once.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, "vertices") and hasattr(value, "faces"): # trimesh.Trimesh, without importing trimesh here
+        return estimate_size(np.asarray(value.vertices), _seen) + estimate_size(np.asarray(value.faces), _seen)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(item, _seen) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Small thread-safe least-recently-used cache. Values are shared between requests and must not be modified by the caller
+    (copy the dict / list first if it has to be changed).
+    With maxbytes the least recently used entries are also removed as long as the estimated size of all entries is larger,
+    a single value larger than maxbytes is not cached.
+    """
+
+    def __init__(self, name, maxsize, maxbytes=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        size = 0
+        if self.maxbytes is not None:
+            # Estimated outside of the lock, it walks through the whole value
+            size = estimate_size(value)
+            if size > self.maxbytes:
+                print(f"Not caching {self.name}: {size / 1e6:.1f} MB is larger than the cache")
+                return
+        with self._lock:
+            self.nbytes += size - self._sizes.get(key, 0)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                old_key, _ = self._data.popitem(last=False)
+                self.nbytes -= self._sizes.pop(old_key)
+
+    def get_or_compute(self, key, compute):
+        # compute() runs outside of the lock, exceptions are not cached
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            print(f"Cache hit ({self.name})")
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+# (gml_path, tile version) -> (xml_root, footprints, tile_cache_dir, wall adjacency of the tile)
+parsed_tiles = LRUCache("parsed LOD2 tile", PARSED_TILE_CACHE_SIZE)
+# (laser_path, laser tile version, classification) -> building points of the laser tile (xyz, return numbers, number of returns)
+laser_tiles = LRUCache("parsed laser tile", LASER_TILE_CACHE_SIZE)
+# (tile version, building id) -> get_building_data() of one building (surfaces, repaired geometry, neighbours), independent of the selection
+building_parts = LRUCache("building part", RESULT_CACHE_SIZE, RESULT_CACHE_MAX_MB * 1e6)
+# (tile version, selected building ids) -> building properties incl. volumes
+building_results = LRUCache("building data", RESULT_CACHE_SIZE, RESULT_CACHE_MAX_MB * 1e6)
+# (tile version, laser tile version, selected building ids) -> laser points and roof extrusions of the selection
+laser_results = LRUCache("laser data", RESULT_CACHE_SIZE, RESULT_CACHE_MAX_MB * 1e6)
+
+ALL_CACHES = [parsed_tiles, laser_tiles, building_parts, building_results, laser_results]
+
+
+def cache_stats():
+    # Entries, hits and misses per cache, e.g. for logging
+    return {cache.name: {"entries": len(cache), "bytes": cache.nbytes, "hits": cache.hits, "misses": cache.misses} for cache in ALL_CACHES}
+
+
+def clear_caches():
+    for cache in ALL_CACHES:
+        cache.clear()
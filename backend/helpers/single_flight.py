@@ -0,0 +1,183 @@
+"""
+Single-flight execution of identical requests: if the same building is requested several times at once (double click,
+several browser tabs), only the first request runs start_process(), the others wait for and share its result.
+
+- Within one worker process, the waiting requests share a Future.
+- Across the uvicorn workers of one host, a lock file per request key makes the other workers wait. The result is passed on
+  through a pickle file next to the lock file, but only to requests that arrived while it was computed (it is not a cache).
+  Pickles are only loaded from a directory with mode 0700 owned by the user of this process, otherwise requests are only
+  coalesced within one process.
+"""
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import fcntl # Unix only, without it requests are only coalesced within one process
+except ImportError:
+    fcntl = None
+
+SINGLE_FLIGHT_DIR = os.getenv("SINGLE_FLIGHT_DIR", os.path.join(tempfile.gettempdir(), "lod2_single_flight"))
+# Shared result files (and unused lock files) older than this are removed
+SHARED_RESULT_TTL = float(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "120"))
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_missing = object()
+
+
+def request_key(*parts):
+    # Stable key of the request parameters, also used as file name
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+def run_single_flight(key, compute):
+    """
+    Returns compute(), but runs it only once for concurrent calls with the same key (in this process and in other processes on this host).
+    The result is shared between the callers and must not be modified. Exceptions are raised in all waiting callers.
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _in_flight[key] = future
+    if not leader:
+        print("Identical request already running in this worker, waiting for its result")
+        return future.result()
+
+    try:
+        result = _run_across_workers(key, compute)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+
+def _check_shared_dir():
+    """
+    Creates SINGLE_FLIGHT_DIR with mode 0700. Raises OSError if the directory can be written by another user
+    (owned by someone else or a symlink), because the pickle files in it are loaded.
+    """
+    os.makedirs(SINGLE_FLIGHT_DIR, mode=0o700, exist_ok=True)
+    info = os.lstat(SINGLE_FLIGHT_DIR)
+    if not stat.S_ISDIR(info.st_mode):
+        raise OSError(f"{SINGLE_FLIGHT_DIR} is not a directory")
+    if info.st_uid != os.getuid():
+        raise OSError(f"{SINGLE_FLIGHT_DIR} is owned by another user (uid {info.st_uid})")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        # Our own directory, e.g. created by an older version or with a umask: close it for other users
+        os.chmod(SINGLE_FLIGHT_DIR, 0o700)
+
+
+def _lock(lock_path):
+    """
+    Opens and locks the lock file, blocking while another worker holds it. Returns the open file.
+    _remove_old_files() may unlink the file between open() and flock(), so the lock only counts if the locked file
+    is still the one at lock_path; otherwise the new file is opened and locked. The mtime is refreshed after locking,
+    so a lock file in use never looks old.
+    """
+    while True:
+        lock_file = open(lock_path, "a+b")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                current = os.stat(lock_path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(lock_file.fileno()).st_ino:
+                os.utime(lock_file.fileno())
+                return lock_file
+        except BaseException:
+            lock_file.close()
+            raise
+        lock_file.close() # removed meanwhile, lock the new file
+
+
+def _run_across_workers(key, compute):
+    if fcntl is None:
+        return compute()
+    try:
+        _check_shared_dir()
+        requested_at = time.time()
+        # Blocks while another worker computes the same request
+        lock_file = _lock(os.path.join(SINGLE_FLIGHT_DIR, f"{key}.lock"))
+    except OSError as e:
+        print(f"Warning: Single-flight lock not available ({e}), running the request without it")
+        return compute()
+
+    result_path = os.path.join(SINGLE_FLIGHT_DIR, f"{key}.pkl")
+    with lock_file:
+        try:
+            result = _load_shared_result(result_path, requested_at)
+            if result is not _missing:
+                print("Identical request was processed by another worker, using its result")
+                return result
+            result = compute()
+            _store_shared_result(result_path, result)
+            return result
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            _remove_old_files()
+
+
+def _load_shared_result(result_path, requested_at):
+    # Only results finished after this request arrived, i.e. computed while it was waiting for the lock
+    try:
+        if os.path.getmtime(result_path) < requested_at:
+            return _missing
+        with open(result_path, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return _missing
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        print(f"Warning: Could not read the result of the other worker ({e}), processing the request again")
+        return _missing
+
+
+def _store_shared_result(result_path, result):
+    tmp_path = f"{result_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, result_path)
+    except Exception as e:
+        # Not picklable or disk full: waiting workers then compute the result themselves
+        print(f"Warning: Could not share the result with other workers: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _remove_old_files():
+    now = time.time()
+    try:
+        entries = os.listdir(SINGLE_FLIGHT_DIR)
+    except OSError:
+        return
+    for entry in entries:
+        path = os.path.join(SINGLE_FLIGHT_DIR, entry)
+        try:
+            if now - os.path.getmtime(path) < SHARED_RESULT_TTL:
+                continue
+            if entry.endswith(".lock"):
+                # Only remove lock files nobody holds right now
+                with open(path, "a+b") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.remove(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+
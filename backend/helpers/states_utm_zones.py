@@ -1,11 +1,16 @@
 import json
 import os
+from functools import lru_cache
 
-def get_utm_zone(state: str) -> int:
-    """Get the UTM zone number for a given German state."""
+@lru_cache(maxsize=1)
+def _load_utm_zones() -> dict:
     json_path = os.path.join(os.path.dirname(__file__), 'states_UTM_zones.json')
     with open(json_path, 'r', encoding='utf-8') as f:
-        utm_zones = json.load(f)
+        return json.load(f)
+
+def get_utm_zone(state: str) -> int:
+    """Get the UTM zone number for a given German state."""
+    utm_zones = _load_utm_zones()
     
     if state not in utm_zones:
         raise ValueError(f"Unknown state: {state}. Valid states are: {', '.join(utm_zones.keys())}")
@@ -0,0 +1,178 @@
+import os
+import re
+import shutil
+import numpy as np
+import trimesh
+from helpers.polygon_array import PolygonArray, SURFACE_TYPES
+
+# Derived per-tile data (repaired building meshes, wall adjacency, ...) is cached on disk next to the LOD2 tile it was computed from.
+# Can be redirected with TILE_CACHE_DIR, e.g. to a mounted volume in production.
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR")
+# Bump when the layout of the cached arrays changes, so old caches are not read anymore
+CACHE_FORMAT_VERSION = 3
+
+
+def get_tile_version(gml_path):
+    """
+    Returns a version string for a LOD2 tile. Tiles are replaced on disk when they are re-downloaded,
+    so file size and modification time are enough to detect a changed tile.
+    """
+    stat = os.stat(gml_path)
+    return f"v{CACHE_FORMAT_VERSION}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def get_tile_cache_dir(gml_path):
+    """
+    Returns the cache directory for the current version of a LOD2 tile and removes caches of older versions of the same tile.
+    Returns None if the cache directory can not be created (the pipeline then just runs without cache).
+    """
+    try:
+        tile_name = os.path.splitext(os.path.basename(gml_path))[0]
+        base_dir = TILE_CACHE_DIR or os.path.join(os.path.dirname(os.path.abspath(gml_path)), ".cache")
+        tile_dir = os.path.join(base_dir, tile_name)
+        version = get_tile_version(gml_path)
+        if os.path.isdir(tile_dir):
+            # Invalidate: the tile changed since these entries were written
+            for entry in os.listdir(tile_dir):
+                if entry != version:
+                    shutil.rmtree(os.path.join(tile_dir, entry), ignore_errors=True)
+        cache_dir = os.path.join(tile_dir, version)
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
+    except OSError as e:
+        print(f"Warning: Tile cache not available for {gml_path}: {e}")
+        return None
+
+
+def _cache_file(tile_cache_dir, subdir, key, ext):
+    # gml:ids are file-name safe in practice, but be defensive
+    safe_key = re.sub(r"[^A-Za-z0-9_.-]", "_", str(key))
+    return os.path.join(tile_cache_dir, subdir, f"{safe_key}.{ext}")
+
+
+def _write_npz_atomic(path, arrays):
+    # Write to a temporary file first so concurrent readers never see a half-written cache entry
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def save_tile_arrays(tile_cache_dir, name, arrays):
+    # Stores a dict of numpy arrays computed for the whole tile (e.g. the wall adjacency) in the tile cache
+    if tile_cache_dir is None:
+        return
+    try:
+        _write_npz_atomic(os.path.join(tile_cache_dir, f"{name}.npz"), arrays)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not cache {name} of the tile: {e}")
+
+
+def load_tile_arrays(tile_cache_dir, name):
+    # Returns the dict of arrays stored with save_tile_arrays(), or None if not cached yet
+    if tile_cache_dir is None:
+        return None
+    path = os.path.join(tile_cache_dir, f"{name}.npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable cache entry {path}: {e}")
+        return None
+
+
+def save_building_mesh(tile_cache_dir, building_id, repaired_geom):
+    """
+    Stores the result of repair_geometry() for one building as compact arrays:
+    the combined vertices and faces, the surface type and surface id (index into the repaired surface list) of every face,
+    and the repaired (welded) surface polygons as a PolygonArray (coordinates, offsets, surface types).
+    """
+    if tile_cache_dir is None:
+        return
+    try:
+        triangulation = repaired_geom["triangulation"]
+        vertices, faces, face_types, face_surface_ids, vertex_counts = [], [], [], [], []
+        v_offset = 0
+        for type_idx, surface_type in enumerate(SURFACE_TYPES):
+            V = np.asarray(triangulation[surface_type]["vertices"], dtype=float).reshape(-1, 3)
+            F = np.asarray(triangulation[surface_type]["faces"], dtype=np.int64).reshape(-1, 3)
+            vertices.append(V)
+            faces.append(F + v_offset)
+            face_types.append(np.full(len(F), type_idx, dtype=np.int8))
+            face_surface_ids.append(np.asarray(triangulation[surface_type]["surface_ids"], dtype=np.int32))
+            vertex_counts.append(len(V))
+            v_offset += len(V)
+
+        arrays = {
+            "vertices": np.vstack(vertices),
+            "faces": np.vstack(faces).astype(np.int32),
+            "face_types": np.concatenate(face_types),
+            "face_surface_ids": np.concatenate(face_surface_ids),
+            "vertex_counts": np.array(vertex_counts, dtype=np.int64),
+            "total_facade_area": np.float64(repaired_geom["total_facade_area"]),
+        }
+        surfaces = PolygonArray.from_surfaces({
+            "wall": repaired_geom["wall_surface_geometries"],
+            "roof": repaired_geom["roof_surface_geometries"],
+            "ground": repaired_geom["ground_surface_shape"],
+        })
+        arrays["surface_coords"] = surfaces.coords
+        arrays["surface_offsets"] = surfaces.offsets
+        arrays["surface_types"] = surfaces.surface_type
+
+        _write_npz_atomic(_cache_file(tile_cache_dir, "meshes", building_id, "npz"), arrays)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Warning: Could not cache repaired mesh of building {building_id}: {e}")
+
+
+def load_building_mesh(tile_cache_dir, building_id):
+    """
+    Loads a repaired mesh stored with save_building_mesh(). Returns the same dictionary as repair_geometry()
+    (without re-triangulating), or None if the building is not cached yet.
+    """
+    if tile_cache_dir is None:
+        return None
+    path = _cache_file(tile_cache_dir, "meshes", building_id, "npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            vertices = data["vertices"]
+            faces = data["faces"].astype(np.int64)
+            face_types = data["face_types"]
+            face_surface_ids = data["face_surface_ids"].astype(np.int64)
+            vertex_counts = data["vertex_counts"]
+            total_facade_area = float(data["total_facade_area"])
+            surfaces = PolygonArray(data["surface_coords"], data["surface_offsets"], data["surface_types"])
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable mesh cache entry for building {building_id}: {e}")
+        return None
+
+    # Split the combined arrays back into the per-surface-type triangulation
+    triangulation = {}
+    v_start = 0
+    for type_idx, surface_type in enumerate(SURFACE_TYPES):
+        v_end = v_start + int(vertex_counts[type_idx])
+        mask = face_types == type_idx
+        triangulation[surface_type] = {
+            "vertices": vertices[v_start:v_end],
+            "faces": faces[mask] - v_start,
+            "surface_ids": face_surface_ids[mask],
+        }
+        v_start = v_end
+
+    mesh = trimesh.Trimesh(vertices=vertices, faces=faces) if len(faces) else trimesh.Trimesh()
+    # repair_geometry() returns every welded ring as a tuple of point tuples
+    surfaces = {t: [tuple(ring) for ring in rings] for t, rings in surfaces.to_surfaces().items()}
+
+    return {
+        "wall_surface_geometries": surfaces["wall"],
+        "roof_surface_geometries": surfaces["roof"],
+        "ground_surface_shape": surfaces["ground"],
+        "triangulation": triangulation,
+        "mesh": mesh,
+        "total_facade_area": total_facade_area,
+    }
@@ -1,158 +1,111 @@
 import numpy as np
-from collections import defaultdict
-import trimesh
 
-import numpy as np
-from scipy.spatial import cKDTree
-
-from helpers.roof_repair import split_courtyard_roofs
-
-
-import numpy as np
-from scipy.spatial import cKDTree
-from shapely.geometry import Polygon
-import trimesh
-
-
-def triangulate_polygon(polygon):
-    """Triangulate a single polygon into vertices and faces"""
-    if len(polygon) < 3:
-        return [], []
-
-    # Handle closed polygons (first and last points are the same)
-    if len(polygon) > 1 and polygon[0] == polygon[-1]:
-        vertices = list(polygon[:-1])  # Remove the duplicate closing point
-    else:
-        vertices = list(polygon)
-
-    if len(vertices) < 3:
-        return [], []
+from helpers.polygon_array import PolygonArray, as_polygon_array
 
-    faces = []
-
-    # Use ear clipping or fan triangulation for simple polygons
-    if len(vertices) == 3:
-        # Already a triangle
-        faces.append([0, 1, 2])
-    elif len(vertices) == 4:
-        # Quadrilateral - split into two triangles
-        faces.append([0, 1, 2])
-        faces.append([0, 2, 3])
-    else:
-        # For polygons with > 4 vertices, use fan triangulation
-        # This assumes the polygon is convex and points are in order
-        for i in range(1, len(vertices) - 1):
-            faces.append([0, i, i + 1])
 
-    return vertices, faces
+def polyhedron_volume(surface_polygons):
+    """
+    Volume enclosed by a closed surface made of planar polygons, using the divergence theorem:
+    V = 1/3 * sum over all faces of (point on face . area vector of face). The area vector is half the Newell vector.
+    The sign follows the winding of the polygons (positive for outward pointing normals), nothing is triangulated.
+    Coordinates are shifted to a local origin first, UTM coordinates would otherwise cost precision.
+    Accepts a list of polygons or a PolygonArray.
+    """
+    polygons = as_polygon_array(surface_polygons).dedup()
+    polygons = polygons.select(polygons.lengths >= 3)
+    if len(polygons) == 0:
+        return 0.0
+    polygons = polygons.translated(polygons.coords[0])
+    area_vectors = 0.5 * polygons.newell()
+    return float(np.einsum("ij,ij->", polygons.centroids(), area_vectors) / 3.0)
+
+def is_closed_surface(surface_polygons, decimals=6):
+    # A closed (watertight) surface uses every edge exactly twice, compared on coordinates rounded to the given decimals
+    polygons = as_polygon_array(surface_polygons).dedup()
+    if len(polygons.coords) == 0:
+        return False
+    _, vertex_ids = np.unique(np.round(polygons.coords, decimals), axis=0, return_inverse=True)
+    vertex_ids = vertex_ids.ravel()
+    edges = np.sort(np.stack([vertex_ids, vertex_ids[polygons.next_index]], axis=1), axis=1)
+    _, edge_counts = np.unique(edges, axis=0, return_counts=True)
+    return bool(np.all(edge_counts == 2))
 
 def calculate_attic_volume(roof_surface_geometries):
     '''
     Calculates the volume of the attic using the roof surface geometries. Only used for non-flat roof cases.
     It works by taking the roof surfaces, and for every surface, create a "baseline" surface on the height of its lowest point.
-    Then, project the roof surface onto the baseline surface, and calculate the volume of the resulting mesh. Add up all volume calculated this way.
+    The volume between the roof surface and its baseline is a vertical prism with a planar top, so it equals
+    the area of the surface projected onto the XY plane times the height of the roof plane above the baseline at the centroid of that projection.
+    Add up all volume calculated this way, for all roof surfaces at once. No meshes are created.
     TODO (not urgent): Handle "Round" roofs better that have several segments. Right now, every segment is treated as a seperate roof surface. Leads to too small volumes.
     '''
-    total_attic_volume = 0.0
-
-    for k, roof_poly in enumerate(roof_surface_geometries, start=1):
-
-        roof_vertices, top_faces = triangulate_polygon(roof_poly)
-        if not roof_vertices or len(roof_vertices) < 3:
-            continue
-
-        # Optional: remove consecutive duplicate vertices
-        def dedup(seq):
-            out = []
-            for p in seq:
-                if not out or p != out[-1]:
-                    out.append(p)
-            # also drop if last equals first
-            if len(out) > 1 and out[0] == out[-1]:
-                out.pop()
-            return out
-
-        roof_vertices = dedup(roof_vertices)
-        if len(roof_vertices) < 3:
-            continue
-
-        min_z = min(p[2] for p in roof_vertices)
-        max_z = max(p[2] for p in roof_vertices)
-        if abs(max_z - min_z) < 1e-6:  # flat
-            continue
-
-        # Build base ring at min_z using same XY order
-        base_vertices = [(p[0], p[1], min_z) for p in roof_vertices]
-
-        # Triangulate bottom (don’t re-close)
-        _, bottom_faces_raw = triangulate_polygon(base_vertices)
-
-        n = len(roof_vertices)
-        all_vertices = roof_vertices + base_vertices
-        all_faces = []
-
-        # Top faces as-is
-        all_faces.extend(top_faces)
-
-        # Bottom faces: reverse winding and offset indices by n
-        bottom_faces = [[idx + n for idx in face[::-1]] for face in bottom_faces_raw]
-        all_faces.extend(bottom_faces)
-
-        # Walls: correct diagonal!
-        for i in range(n):
-            p1_idx = i
-            p2_idx = (i + 1) % n
-            b1_idx = i + n
-            b2_idx = (i + 1) % n + n
+    roofs = as_polygon_array(roof_surface_geometries, "roof").dedup()
+    roofs = roofs.select(roofs.lengths >= 3)
+    if len(roofs) == 0:
+        return 0.0
 
-            all_faces.append([p1_idx, p2_idx, b2_idx])  # diagonal p1 -> b2
-            all_faces.append([p1_idx, b2_idx, b1_idx])
+    mins, maxs = roofs.bounds()
+    not_flat = np.abs(maxs[:, 2] - mins[:, 2]) >= 1e-6 # flat surfaces have no attic volume
+    roofs = roofs.select(not_flat)
+    min_z = mins[not_flat, 2]
+    if len(roofs) == 0:
+        return 0.0
 
-        try:
-            mesh = trimesh.Trimesh(vertices=all_vertices, faces=all_faces, process=True)
-            mesh.remove_degenerate_faces()
-            mesh.remove_duplicate_faces()
-            mesh.remove_unreferenced_vertices()
-            mesh.fix_normals()
-
-            if mesh.is_watertight:
-                vol = mesh.volume
-                total_attic_volume += vol
-            else:
-                print("Warning: generated attic mesh component is not watertight.")
-        except Exception as e:
-            print(f"An error occurred during attic volume calculation for a roof surface: {e}")
+    # Plane of every roof surface (Newell normal through the vertex mean), in local coordinates of that surface
+    origins = roofs.centroids()
+    local = PolygonArray(roofs.coords - origins[roofs.ring_index], roofs.offsets, roofs.surface_type)
+    normals = local.newell()
+
+    # Signed area and centroid of the XY projections (shoelace)
+    x, y = local.coords[:, 0], local.coords[:, 1]
+    next_idx = local.next_index
+    x_next, y_next = x[next_idx], y[next_idx]
+    cross = x * y_next - x_next * y
+    ring = local.ring_index
+    area_xy = 0.5 * np.bincount(ring, weights=cross, minlength=len(local))
+
+    # vertical surfaces have no footprint
+    valid = (np.abs(normals[:, 2]) >= 1e-9) & (np.abs(area_xy) >= 1e-12)
+    if not valid.any():
+        return 0.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cx = np.bincount(ring, weights=(x + x_next) * cross, minlength=len(local)) / (6.0 * area_xy)
+        cy = np.bincount(ring, weights=(y + y_next) * cross, minlength=len(local)) / (6.0 * area_xy)
+        # Height of the roof plane above the baseline at the centroid of the footprint
+        z_at_centroid = -(normals[:, 0] * cx + normals[:, 1] * cy) / normals[:, 2] + origins[:, 2]
 
-    return total_attic_volume
+    return float(np.sum(np.abs(area_xy[valid]) * (z_at_centroid[valid] - min_z[valid])))
 
-def calculate_volume(triangulated_geometry, mesh, roof_surface_geometries, ground_surface_area, height, roof_type_nr):
+def calculate_volume(surface_geometries, roof_surface_geometries, ground_surface_area, height, roof_type_nr):
     '''
-    Calculates the volume of the geometry using trimesh.
-    Takes wall, roof and ground surface geometries as input.
-    Assumes the geometry is welded nicely.
+    Calculates the volume of the geometry directly from its (repaired) surface polygons, using the divergence theorem (see polyhedron_volume()).
+    Assumes the geometry is welded nicely. No triangulation and no trimesh objects are needed.
 
     Steps:
-    1. Triangulate the surfaces
-    2. Check watertightness of the triangulated mesh
-    3. Calculate & return the volume of the triangulation
+    1. Check whether the surfaces form a closed shell
+    2. Calculate & return the volume enclosed by the surfaces
 
     Args:
-        wall_surface_geometries: List of wall surface polygons
-        roof_surface_geometries: List of roof surface polygons
-        ground_surface_shape: List of ground surface polygons
+        surface_geometries: dict with the lists of "wall", "roof" and "ground" surface polygons (as returned by repair_geometry())
+        roof_surface_geometries: List of roof surface polygons, used for the attic volume
+        ground_surface_area: Area of the ground surface
+        height: Height of the building
+        roof_type_nr: Roof type (ALKIS Dachform)
 
     Returns:
-        float: The calculated volume, or 0.0 if watertightness check fails
+        dict: volume_model, volume_basement and volume_attic in m³
 
     TODO: Buildings with "Holes" (courtyards) are not always handled correctly, can lead to too high volumes.
     '''
 
-    if mesh is None:
-        print("Failed to create mesh from geometry")
+    if surface_geometries is None:
+        print("Failed to get surfaces from geometry")
         return 0.0
 
-    # Step 2: Check watertightness
-    is_watertight = mesh.is_watertight
+    all_surfaces = PolygonArray.from_surfaces(surface_geometries)
+
+    # Step 1: Check watertightness
+    is_watertight = is_closed_surface(all_surfaces)
 
     # Calculate basic volume (extruded groundSurface) for sanity check
     if roof_type_nr == 1000: # case Flachdach
@@ -162,13 +115,12 @@ def calculate_volume(triangulated_geometry, mesh, roof_surface_geometries, groun
     print(f"Basic volume (Ground surface area * height, with roof type considered): {simple_volume} m³")
 
     if not is_watertight:
-        print("Mesh is not watertight! Trying to calculate volume anyway.")
-        print(f"Mesh has {len(mesh.faces)} faces and {len(mesh.vertices)} vertices")
-        print(f"Number of holes: {len(mesh.facets_boundary) - len(mesh.facets)}")
+        print("Surfaces do not form a closed shell! Trying to calculate volume anyway.")
+        print(f"Shell has {len(all_surfaces)} surfaces")
 
-    # Step 3: Calculate volume
+    # Step 2: Calculate volume
     try:
-        volume = mesh.volume
+        volume = polyhedron_volume(all_surfaces)
         print(f"Successfully calculated volume: {volume} m³")
     except Exception as e:
         print(f"Error calculating volume: {e}. Returning basic volume instead: {simple_volume} m³")
@@ -195,5 +147,3 @@ def calculate_volume(triangulated_geometry, mesh, roof_surface_geometries, groun
         "volume_basement": volume_basement,
         "volume_attic": volume_attic
     }
-
-    
\ No newline at end of file
@@ -1,16 +1,21 @@
 from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 from handling import start_process
-from visualization.house_viz import convert_to_threejs_format, convert_to_threejs_from_database
+from visualization.house_viz import convert_to_threejs_format, convert_to_threejs_from_database, DEFAULT_POINT_BUDGET
 import os
 from supabase import create_client, Client
 from datetime import datetime
-from Supabase_database.handlers import insert_LOD2_data, insert_geom_data
+from Supabase_database.handlers import insert_LOD2_data, insert_geom_data, get_geom_version, get_geom_metadata, NumpyEncoder
+from api_helpers.http_cache import make_etag, etag_matches, choose_encoding, not_modified_response, streaming_json_response
 from helpers.addressf import get_coords
+from helpers.single_flight import run_single_flight, request_key
 from Supabase_database.functions.image_uploader import upload_image_and_save_to_db
 from Supabase_database.handlers import get_user_client
 from Supabase_database.handlers import update_building_data
+from Supabase_database import outbox
 
 
 try:
@@ -24,9 +29,21 @@ except ImportError:
 # Load environment variables
 load_dotenv()
 
+# Building and geometry rows of /api/address are written to Supabase in the background (Supabase_database/outbox.py)
+SUPABASE_OUTBOX = os.getenv('SUPABASE_OUTBOX', 'True').lower() == 'true'
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SUPABASE_OUTBOX:
+        outbox.start_flusher()
+    yield
+    # Writes everything that is due, the rest stays in the outbox file for the next start
+    await run_in_threadpool(outbox.stop_flusher)
+
 app = FastAPI(
     title="LOD2 Laser States API",
-    debug=os.getenv('DEBUG', 'False').lower() == 'true'
+    debug=os.getenv('DEBUG', 'False').lower() == 'true',
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -92,7 +109,11 @@ async def process_address(
 
     access_token = raw_token.split(" ", 1)[1]
 
-    result = return_address(
+    # Identical requests running at the same time (double click, several tabs, other uvicorn worker) share one computation.
+    # The pipeline runs in the thread pool, so it does not block the event loop for the other requests.
+    key = request_key(request.street, request.number, request.city, request.state, request.country,
+                      request.useLaserData, request.clickedCoordinates, request.ID_LOD2_list)
+    result = await run_in_threadpool(run_single_flight, key, lambda: return_address(
         request.street,
         request.number,
         request.city,
@@ -101,10 +122,10 @@ async def process_address(
         request.useLaserData,
         request.clickedCoordinates,
         request.ID_LOD2_list
-    )
+    ))
 
     if result:
-        # Insert data with user-scoped privileges
+        # Insert data with user-scoped privileges (queued in the outbox, so the response does not wait for the upload)
         insert_LOD2_data(result, access_token)
         geom_data = {
             "ID_LOD2": result["ID_LOD2"],
@@ -146,13 +167,23 @@ async def process_address(
             "ID_LOD2": None,
         }
 
+# Bump when the output of convert_to_threejs_format changes, so clients do not keep geometry cached in the old format
+THREEJS_FORMAT_VERSION = 1
+
 # This function gets the geometry from the database & converts it to ThreeJS format, then delivers it back to the frontend
 # Why is this happening in the backend? More possibilities for correcting the geometry, easier processing overall with python, make frontend lighter & simpler
-@app.post("/api/geom-to-threejs")
+# The laser points are reduced to point_budget points (voxel level of detail), point_budget=0 returns the full point cloud.
+# The response carries an ETag derived from the version (updated_at) of the geometry row: requests with a matching If-None-Match
+# get a 304 without loading and converting the geometry. The body is streamed and compressed (br/gzip) if the client accepts it.
+# GET is the cacheable variant, POST is kept for existing clients.
+@app.api_route("/api/geom-to-threejs", methods=["GET", "POST"])
 async def geom_to_threejs(
     ID_LOD2: str,
+    point_budget: int = DEFAULT_POINT_BUDGET,
     authorization: str | None = Header(None),
-    x_user_token: str | None = Header(None) # Catch the forwarded user token
+    x_user_token: str | None = Header(None), # Catch the forwarded user token
+    if_none_match: str | None = Header(None),
+    accept_encoding: str | None = Header(None)
 ):
     # Use the forwarded token if it exists (Cloud Run mode), 
     # otherwise fallback to authorization (Local dev mode)
@@ -163,4 +194,28 @@ async def geom_to_threejs(
 
     access_token = raw_token.split(" ", 1)[1]
 
-    return convert_to_threejs_from_database(ID_LOD2, access_token)
\ No newline at end of file
+    # The version query only reads updated_at (RLS applies as well), the geometry is only loaded if the client's copy is outdated
+    version = await run_in_threadpool(get_geom_version, ID_LOD2, access_token)
+    base_etag = make_etag(ID_LOD2, version, point_budget, THREEJS_FORMAT_VERSION) if version else None
+    if base_etag and etag_matches(if_none_match, base_etag):
+        return not_modified_response(base_etag, choose_encoding(accept_encoding))
+
+    result = await run_in_threadpool(convert_to_threejs_from_database, ID_LOD2, access_token, point_budget)
+    return streaming_json_response(result, accept_encoding, base_etag, NumpyEncoder)
+
+# Version and referenced building ids of the stored geometry, without loading the geometry columns
+@app.get("/api/geom-metadata")
+async def geom_metadata(
+    ID_LOD2: str,
+    authorization: str | None = Header(None),
+    x_user_token: str | None = Header(None), # Catch the forwarded user token
+):
+    raw_token = x_user_token or authorization
+    if not raw_token or not raw_token.startswith("Bearer "):
+         raise HTTPException(status_code=401, detail="Missing or invalid token")
+    access_token = raw_token.split(" ", 1)[1]
+
+    metadata = await run_in_threadpool(get_geom_metadata, ID_LOD2, access_token)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail=f"No geometry found for {ID_LOD2}")
+    return metadata
@@ -0,0 +1,31 @@
+import numpy as np
+import pyproj
+import pytest
+
+from helpers.addressf import convert_utm_to_lat_long, latlon_to_utm, utm_to_wgs84
+
+
+def _scalar_wgs84(easting, northing, zone_nr):
+    transformer = pyproj.Transformer.from_crs(f"EPSG:{32600 + zone_nr}", "EPSG:4326", always_xy=True)
+    return transformer.transform(easting, northing)
+
+
+@pytest.mark.parametrize("zone_nr", [32, 33])
+def test_vectorized_matches_scalar_transform(zone_nr):
+    rng = np.random.default_rng(zone_nr)
+    points = np.column_stack([rng.uniform(300000, 800000, 200), rng.uniform(5200000, 6100000, 200), rng.uniform(0, 50, 200)])
+
+    lonlat = utm_to_wgs84(points, zone_nr)
+
+    expected = np.array([_scalar_wgs84(e, n, zone_nr) for e, n, _ in points])
+    np.testing.assert_allclose(lonlat[:, :2], expected, rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(lonlat[:, 2], points[:, 2]) # heights are kept
+    assert utm_to_wgs84(np.empty((0, 2)), zone_nr).shape == (0, 2)
+
+
+def test_point_conversion_round_trip():
+    easting, northing, zone_nr, _ = latlon_to_utm(48.137, 11.575, 32)
+    lon, lat = convert_utm_to_lat_long((easting, northing, zone_nr))
+
+    assert (lon, lat) == pytest.approx(_scalar_wgs84(easting, northing, 32), abs=1e-12)
+    assert (lon, lat) == pytest.approx((11.575, 48.137), abs=1e-9)
@@ -0,0 +1,53 @@
+import contextlib
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from benchmarks import fixtures
+from helpers.attachedWalls import _attached_from_adjacency, build_wall_adjacency, building_reference_point, subtract_attached_walls
+from helpers.geometry_helpers import parse_wall_surfaces, polygon_area_3d
+from helpers.geomf import create_ground_surface_list
+
+
+@pytest.fixture(scope="module")
+def tile():
+    xml, _ = fixtures.tile(60, seed=1)
+    xml_root = ET.fromstring(xml)
+    footprints = create_ground_surface_list(xml_root, fixtures.ns)
+    return xml_root, footprints, build_wall_adjacency(xml_root, fixtures.ns, footprints)
+
+
+def _subtract(building, xml_root, footprints, adjacency):
+    building_id = building.get("{http://www.opengis.net/gml}id")
+    walls = parse_wall_surfaces(building, fixtures.ns)
+    point = building_reference_point(building, fixtures.ns)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return subtract_attached_walls(walls, xml_root, fixtures.ns, point, building_id, footprints, adjacency)
+
+
+def test_adjacency_matches_on_the_fly_matching(tile):
+    xml_root, footprints, adjacency = tile
+    n_attached = 0
+    for building in xml_root.findall(".//bldg:Building", fixtures.ns):
+        building_id = building.get("{http://www.opengis.net/gml}id")
+        assert _attached_from_adjacency(adjacency, building_id, len(parse_wall_surfaces(building, fixtures.ns))) is not None
+        expected = _subtract(building, xml_root, footprints, None)
+        result = _subtract(building, xml_root, footprints, adjacency)
+        for key in ["neighbour_lod2_ids", "surrounding_buildings_lod2_ids", "neighbour_geometries", "surrounding_buildings_geometries"]:
+            assert result[key] == expected[key], key
+        assert sum(map(polygon_area_3d, result["Wall_geometries_external"])) == \
+            pytest.approx(sum(map(polygon_area_3d, expected["Wall_geometries_external"])), abs=1e-6)
+        n_attached += bool(result["neighbour_lod2_ids"])
+    assert n_attached > 0
+
+
+def test_unknown_building_falls_back_to_matching(tile):
+    xml_root, footprints, adjacency = tile
+    building = xml_root.find(".//bldg:Building", fixtures.ns)
+    building.set("{http://www.opengis.net/gml}id", "DEBY_LOD2_UNKNOWN")
+    try:
+        result = _subtract(building, xml_root, footprints, adjacency)
+    finally:
+        building.set("{http://www.opengis.net/gml}id", "DEBY_LOD2_000000")
+    assert "DEBY_LOD2_000001" in result["neighbour_lod2_ids"] + result["surrounding_buildings_lod2_ids"]
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+
+from helpers.geomf import group_extrusions
+
+
+def _as_sets(clusters):
+    return sorted(sorted(map(tuple, np.round(cluster, 9))) for cluster in clusters)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_same_groups_as_dbscan(seed):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 3, size=(150, 3))
+
+    labels = DBSCAN(eps=0.3, min_samples=1).fit(points).labels_
+    expected = [points[labels == label] for label in np.unique(labels)]
+
+    assert _as_sets(group_extrusions(points, threshold=0.3)) == _as_sets(expected)
+
+
+def test_empty_and_single_point():
+    assert group_extrusions(np.empty((0, 3))) == []
+    clusters = group_extrusions(np.array([[1.0, 2.0, 3.0]]))
+    assert len(clusters) == 1 and clusters[0].shape == (1, 3)
+
+
+def test_keeps_point_order_within_groups():
+    points = np.array([[0, 0, 0], [10, 0, 0], [0.1, 0, 0], [10.2, 0, 0]], dtype=float)
+    clusters = group_extrusions(points, threshold=0.3)
+    assert [cluster.tolist() for cluster in clusters] == [[[0, 0, 0], [0.1, 0, 0]], [[10, 0, 0], [10.2, 0, 0]]]
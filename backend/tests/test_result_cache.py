@@ -0,0 +1,25 @@
+import numpy as np
+
+from helpers.result_cache import LRUCache, estimate_size
+
+
+def test_estimate_size_counts_arrays_once():
+    points = np.zeros((1000, 3))
+    assert estimate_size({"a": points, "b": [points, points]}) < points.nbytes + 1000
+    assert estimate_size({"a": points, "b": points.copy()}) >= 2 * points.nbytes
+
+
+def test_cache_is_limited_by_bytes():
+    size = np.zeros(1000).nbytes
+    cache = LRUCache("test", 100, maxbytes=3.5 * size)
+    for i in range(5):
+        cache.put(i, np.zeros(1000))
+    assert len(cache) == 3
+    assert cache.get(0) is None and cache.get(4) is not None
+    assert cache.nbytes == 3 * size
+
+    cache.put("large", np.zeros(10000))
+    assert cache.get("large") is None and len(cache) == 3
+
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
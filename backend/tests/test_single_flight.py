@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from helpers import single_flight
+
+N_PROCESSES = 3
+N_THREADS = 8
+
+
+def _slow_compute(counter_path):
+    with open(counter_path, "a") as f:
+        f.write(f"{os.getpid()}\n")
+    time.sleep(1.0)
+    return {"ID_LOD2": "DEBY_LOD2_TEST", "pid": os.getpid()}
+
+
+def _requests_in_worker(args):
+    counter_path, key = args
+    with ThreadPoolExecutor(N_THREADS) as pool:
+        return list(pool.map(lambda _: single_flight.run_single_flight(key, lambda: _slow_compute(counter_path)), range(N_THREADS)))
+
+
+@pytest.mark.skipif(single_flight.fcntl is None, reason="requests are only coalesced across processes with fcntl")
+def test_parallel_requests_compute_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_DIR", str(tmp_path / "single_flight"))
+    counter_path = tmp_path / "runs"
+    key = single_flight.request_key("Teststraße", "1", time.time())
+
+    # fork: the workers see the patched SINGLE_FLIGHT_DIR, like uvicorn workers sharing one host
+    with multiprocessing.get_context("fork").Pool(N_PROCESSES) as pool:
+        results = [r for rs in pool.map(_requests_in_worker, [(str(counter_path), key)] * N_PROCESSES) for r in rs]
+
+    assert len(results) == N_PROCESSES * N_THREADS
+    assert all(r == results[0] for r in results)
+    assert len(counter_path.read_text().splitlines()) == 1
+
+
+def test_exceptions_reach_all_waiting_callers(tmp_path, monkeypatch):
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_DIR", str(tmp_path / "single_flight"))
+    key = single_flight.request_key("failing")
+
+    def compute():
+        time.sleep(0.3)
+        raise ValueError("no building found")
+
+    def request(_):
+        try:
+            single_flight.run_single_flight(key, compute)
+        except ValueError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(request, range(4))) == ["no building found"] * 4
+
+
+def test_shared_dir_is_private(tmp_path, monkeypatch):
+    shared_dir = tmp_path / "single_flight"
+    shared_dir.mkdir(mode=0o777)
+    os.chmod(shared_dir, 0o777)
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_DIR", str(shared_dir))
+
+    single_flight._check_shared_dir()
+    assert stat.S_IMODE(os.stat(shared_dir).st_mode) == 0o700
+
+
+def test_shared_dir_of_other_user_is_refused(tmp_path, monkeypatch):
+    target = tmp_path / "elsewhere"
+    target.mkdir()
+    link = tmp_path / "single_flight"
+    link.symlink_to(target)
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_DIR", str(link))
+    with pytest.raises(OSError):
+        single_flight._check_shared_dir()
+
+    if os.getuid() == 0:
+        other = tmp_path / "other"
+        other.mkdir(mode=0o700)
+        os.chown(other, 65534, 65534)
+        monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_DIR", str(other))
+        with pytest.raises(OSError):
+            single_flight._check_shared_dir()
+        # The request still runs, only without sharing the result with other processes
+        assert single_flight.run_single_flight(single_flight.request_key("other"), lambda: 42) == 42
+
+
+@pytest.mark.skipif(single_flight.fcntl is None, reason="lock files need fcntl")
+def test_lock_follows_a_removed_lock_file(tmp_path):
+    lock_path = str(tmp_path / "key.lock")
+    holder = open(lock_path, "a+b")
+    single_flight.fcntl.flock(holder, single_flight.fcntl.LOCK_EX)
+    os.utime(lock_path, (0, 0))
+
+    with ThreadPoolExecutor(1) as pool:
+        waiter = pool.submit(single_flight._lock, lock_path) # opens the old file and waits for its lock
+        time.sleep(0.2)
+        # Cleanup of an old lock file, as in _remove_old_files(): removed while locked
+        os.remove(lock_path)
+        single_flight.fcntl.flock(holder, single_flight.fcntl.LOCK_UN)
+        holder.close()
+        lock_file = waiter.result(timeout=5)
+
+    with lock_file:
+        # Without the check the waiter would hold the lock of the removed file, and the path would not exist
+        assert os.path.exists(lock_path)
+        assert os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+        assert time.time() - os.path.getmtime(lock_path) < single_flight.SHARED_RESULT_TTL
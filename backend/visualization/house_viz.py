@@ -1,10 +1,43 @@
 import numpy as np
-from Supabase_database.handlers import get_geom_data
+from Supabase_database.handlers import get_geom_data, GEOM_VISUALIZATION_COLUMNS
+from helpers.laserf import voxel_downsample
+
+# Levels of detail for the laser points sent to the viewer: voxel sizes in metres, from fine to coarse.
+POINT_LOD_VOXEL_SIZES = [0.1, 0.25, 0.5, 1.0, 2.0]
+# Default maximum number of laser points (single + multi returns) sent to the viewer. Full detail is only sent on request (point_budget=0).
+DEFAULT_POINT_BUDGET = 50000
+
+def iter_point_lods(point_sets, voxel_sizes=POINT_LOD_VOXEL_SIZES):
+    """
+    Yields (voxel_size, downsampled point sets) from the finest to the coarsest level of detail.
+    Each level is only computed when it is requested, so callers can stop at the first level that is small enough.
+    """
+    for voxel_size in voxel_sizes:
+        yield voxel_size, [voxel_downsample(points, voxel_size)[0] for points in point_sets]
+
+def select_point_lod(point_sets, point_budget):
+    """
+    Picks the finest level of detail at which all given point sets together stay within point_budget points.
+    point_sets is a list of point clouds (e.g. single and multi returns), they are all downsampled with the same voxel size.
+    Returns the downsampled point sets and a dict describing the chosen level of detail.
+    """
+    point_sets = [np.asarray(points, dtype=float).reshape(-1, 3) for points in point_sets]
+    total = sum(len(points) for points in point_sets)
+    if not point_budget or total <= point_budget:
+        return point_sets, {"voxelSize": None, "returned": total, "total": total, "fullDetail": True}
+
+    # Coarser levels are only computed if the finer ones exceed the budget, the coarsest level is used in any case
+    for voxel_size, downsampled in iter_point_lods(point_sets):
+        returned = sum(len(points) for points in downsampled)
+        if returned <= point_budget:
+            break
+    return downsampled, {"voxelSize": voxel_size, "returned": returned, "total": total, "fullDetail": False}
 
 
 def convert_to_threejs_format(wall_surfaces, roof_surfaces=None, ground_surfaces=None, Points_single=None, Points_multi=None, Points_roof_extrusions=None, 
 Extrusion_tops=None, Extrusion_walls=None, Wall_centers=None, neighbour_geometries=None, surrounding_buildings_geometries=None,
-facade_N=None, facade_NE=None, facade_E=None, facade_SE=None, facade_S=None, facade_SW=None, facade_W=None, facade_NW=None):
+facade_N=None, facade_NE=None, facade_E=None, facade_SE=None, facade_S=None, facade_SW=None, facade_W=None, facade_NW=None,
+point_budget=None):
     flipY = -1 # If this is -1, the y-axis is flipped in the three.js visualization, which represents actual geometry
     def convert_vertices_to_xyz(vertices):
         return [{"x": float(v[0]), "y": float(v[1] * flipY), "z": float(v[2])} for v in vertices]
@@ -22,6 +55,10 @@ facade_N=None, facade_NE=None, facade_E=None, facade_SE=None, facade_S=None, fac
         # Handle empty entries in the wall centers by replacing them with dummy value "1,1,1". Should rarely happen if building models are intact.
         return [{"x": float(center[0]), "y": float(center[1] * flipY), "z": float(center[2])} if center is not None and len(center) > 0 else {"x": 1, "y": 1, "z": 1} for center in wall_centers]
 
+    # Reduce the laser points to the requested budget (level of detail), the frontend can fetch full detail with point_budget=0
+    (Points_single, Points_multi), points_lod = select_point_lod(
+        [Points_single if Points_single is not None else [], Points_multi if Points_multi is not None else []], point_budget)
+
     return {
         "walls": [{"vertices": convert_vertices_to_xyz(surface)} for surface in wall_surfaces] if wall_surfaces else [],
         "roofs": [{"vertices": convert_vertices_to_xyz(surface)} for surface in roof_surfaces] if roof_surfaces else [],
@@ -32,6 +69,7 @@ facade_N=None, facade_NE=None, facade_E=None, facade_SE=None, facade_S=None, fac
             "multi": convert_points_to_xyz(Points_multi),
             "roofExtrusions": [convert_points_to_xyz(cluster) for cluster in Points_roof_extrusions] if Points_roof_extrusions else []
         },
+        "pointsLod": points_lod,
         "extrusions": {
             "tops": [{"vertices": convert_vertices_to_xyz(surface)} for surface in Extrusion_tops] if Extrusion_tops else [],
             "walls": [[{"vertices": convert_vertices_to_xyz(wall)} for wall in element] for element in Extrusion_walls] if Extrusion_walls else []
@@ -48,8 +86,9 @@ facade_N=None, facade_NE=None, facade_E=None, facade_SE=None, facade_S=None, fac
         "surroundingBuildings": [{"vertices": convert_vertices_to_xyz(surface)} for building in surrounding_buildings_geometries for surface in building] if surrounding_buildings_geometries else []
     }
 
-def convert_to_threejs_from_database(ID_LOD2, access_token):
-    geom_data = get_geom_data(ID_LOD2, access_token)
+def convert_to_threejs_from_database(ID_LOD2, access_token, point_budget=DEFAULT_POINT_BUDGET):
+    # Only the columns drawn below, not the whole row
+    geom_data = get_geom_data(ID_LOD2, access_token, GEOM_VISUALIZATION_COLUMNS)
 
     # Helper function to safely parse geometry data
     def parse_geometry_data(data):
@@ -133,4 +172,5 @@ def convert_to_threejs_from_database(ID_LOD2, access_token):
     facade_NW = validate_geometry_list(facade_NW)
 
     return convert_to_threejs_format(wall_surfaces, roof_surfaces, ground_surfaces, Points_single, Points_multi, Points_roof_extrusions, 
-    Extrusion_tops, Extrusion_walls, Wall_centers, neighbour_geometries, surrounding_buildings_geometries, facade_N, facade_NE, facade_E, facade_SE, facade_S, facade_SW, facade_W, facade_NW)
\ No newline at end of file
+    Extrusion_tops, Extrusion_walls, Wall_centers, neighbour_geometries, surrounding_buildings_geometries, facade_N, facade_NE, facade_E, facade_SE, facade_S, facade_SW, facade_W, facade_NW,
+    point_budget=point_budget)
\ No newline at end of file
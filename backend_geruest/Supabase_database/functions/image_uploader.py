@@ -6,7 +6,7 @@ from dotenv import load_dotenv
 import jwt
 from ..client import get_user_client
 from aufmass_core.datastructure.aufmassClasses import Facade, FacadeImage
-from aufmass_core.database_upload_functions import _insert_aufmass_object, _upload_facade_image
+from aufmass_core.database_upload_functions import _upload_facade_image
 
 # Obtain a per-call client inside the function
 
@@ -138,16 +138,15 @@ def upload_image_and_save_to_db(
                     tags=tags or ["photo"]
                 )
                 
-                # Use the new upload_image function from database_functions.py
-                # Pass the in-memory content we read earlier and the content type we determined
-                _upload_facade_image(facade_image_obj, file_content_memory, access_token, content_type=content_type)
-                
-                # Insert into facade table
+                # Facade of the image, stored together with the image entry
                 facade_obj = Facade(
                     ID_LOD2=ID_LOD2,
                     facade_id=facade_id
                 )
-                _insert_aufmass_object(facade_obj, access_token)
+
+                # Use the new upload_image function from database_functions.py
+                # Pass the in-memory content we read earlier and the content type we determined
+                _upload_facade_image(facade_image_obj, file_content_memory, access_token, content_type=content_type, extra_objects=[facade_obj])
 
             except Exception as e:
                 print(f"Error handling facade upload/db insertion: {e}")
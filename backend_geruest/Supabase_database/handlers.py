@@ -1,10 +1,11 @@
 import jwt
 import json
 import numpy as np
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Sequence
 from datetime import datetime
 
 from .client import get_user_client
+from .upsert import upsert_rows, BUILDINGS_CONFLICT_KEYS
 
 class NumpyEncoder(json.JSONEncoder):
     """ Special json encoder for numpy types """
@@ -17,23 +18,31 @@ class NumpyEncoder(json.JSONEncoder):
             return obj.tolist()
         return json.JSONEncoder.default(self, obj)
 
+def _select_row(table_name: str, ID_LOD2: str, access_token: str, columns: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+    # Row of the building in table_name with only the given columns (all if None), RLS applies. Errors are raised.
+    select = ",".join(columns) if columns else "*"
+    response = get_user_client(access_token).table(table_name).select(select).eq("ID_LOD2", ID_LOD2).limit(1).execute()
+    return response.data[0] if response.data else None
+
 # ---------------------------------------------------------------------------
 # User-token functions (RLS enforced)
 # ---------------------------------------------------------------------------
 
-def get_building_data(ID_LOD2: str, access_token: str):
-    """Get building data from table buildings_data by ID_LOD2 using the caller's JWT so RLS applies."""
-    user_supabase = get_user_client(access_token)
-    
+def get_building_data(ID_LOD2: str, access_token: str, columns: Optional[Sequence[str]] = None):
+    """
+    Get building data from table buildings_data by ID_LOD2 using the caller's JWT so RLS applies.
+    Only the given columns are fetched if columns is set.
+    """
+
     # We do not need to manually filter by user_id here because RLS on the database
     # will automatically filter results to only those owned by the authenticated user.
     # The 'using (user_id = auth.uid())' policy handles this securely.
     
     try:
-        response = user_supabase.table("buildings_data").select("*").eq("ID_LOD2", ID_LOD2).execute()
+        row = _select_row("buildings_data", ID_LOD2, access_token, columns)
         
-        if response.data and len(response.data) > 0:
-            return response.data[0]  # Return the first matching record
+        if row is not None:
+            return row
         else:
             # Note: This might mean the record doesn't exist OR the user doesn't have permission
             print(f"No building data found for ID_LOD2: {ID_LOD2}")
@@ -61,9 +70,6 @@ def update_building_data(LOD2_ID: str, access_token: str, data:dict):
 
 def insert_LOD2_data(LOD2_data: dict, access_token: str):
     """Insert or update cleaned LOD2 data under the privileges of the end-user."""
-    # Get user info from the JWT to set ownership
-    user_supabase = get_user_client(access_token)
-
     # Exclude everything not needed by the frontend (and therefore not accepted by the database), such as visualization data, which is uploaded to another table
     excluded_keys = {
         "coordinates",
@@ -108,24 +114,15 @@ def insert_LOD2_data(LOD2_data: dict, access_token: str):
     # grab the user ID from the authenticated session (via the access_token).
     
     try:
-        # Check if record already exists for this ID_LOD2
-        response = user_supabase.table("buildings_data").select("ID_LOD2").eq("ID_LOD2", cleaned.get("ID_LOD2")).execute()
-
-        if response.data and len(response.data) > 0:
-            # Record exists, update it
-            user_supabase.table("buildings_data").update(cleaned).eq("ID_LOD2", cleaned.get("ID_LOD2")).execute()
-            print(f"LOD2 data successfully updated in database")
-        else:
-            # Record doesn't exist, insert it
-            user_supabase.table("buildings_data").insert(cleaned).execute()
-            print(f"LOD2 data successfully inserted to database")
+        # One upsert instead of select + update/insert, the row is matched on user_id and ID_LOD2
+        upsert_rows("buildings_data", cleaned, BUILDINGS_CONFLICT_KEYS, access_token)
+        print(f"LOD2 data successfully upserted to database")
     except Exception as e:
         print(f"Error upserting LOD2 data into buildings_data: {e}")
 
 def insert_geom_data(geom_data: dict, access_token: str):
     # Insert or update geometry data - this function also turns lists and arrays into json data to be properly stored in the database
     # The input dict geom_data has to contain the ID_LOD2 of the building as a key
-    user_supabase = get_user_client(access_token)
     insert_data = geom_data
     
     # We do NOT manually decode the JWT or set user_id here.
@@ -137,27 +134,22 @@ def insert_geom_data(geom_data: dict, access_token: str):
             insert_data[key] = json.dumps(value, cls=NumpyEncoder)
 
     try:
-        # Check if record already exists for this ID_LOD2
-        response = user_supabase.table("buildings_geometry").select("ID_LOD2").eq("ID_LOD2", insert_data.get("ID_LOD2")).execute()
-
-        if response.data and len(response.data) > 0:
-            # Record exists, update it
-            user_supabase.table("buildings_geometry").update(insert_data).eq("ID_LOD2", insert_data.get("ID_LOD2")).execute()
-            print(f"Geometry data successfully updated in database")
-        else:
-            # Record doesn't exist, insert it
-            user_supabase.table("buildings_geometry").insert(insert_data).execute()
-            print(f"Geometry data successfully inserted to database")
+        upsert_rows("buildings_geometry", insert_data, BUILDINGS_CONFLICT_KEYS, access_token)
+        print(f"Geometry data successfully upserted to database")
     except Exception as e:
         print(f"Error upserting geometry data into buildings_geometry: {e}")
     
 
-def get_geom_data(ID_LOD2: str, access_token: str):
-    """Get geometry data from table buildings_geometry by ID_LOD2 using the caller's JWT so RLS applies."""
-    user_supabase = get_user_client(access_token)
+def get_geom_data(ID_LOD2: str, access_token: str, columns: Optional[Sequence[str]] = None):
+    """
+    Get geometry data from table buildings_geometry by ID_LOD2 using the caller's JWT so RLS applies.
+    Only the given columns are fetched if columns is set, the geometry columns are large.
+    """
     try:
-        response = user_supabase.table("buildings_geometry").select("*").eq("ID_LOD2", ID_LOD2).execute()
-        return response.data[0]
+        row = _select_row("buildings_geometry", ID_LOD2, access_token, columns)
+        if row is None:
+            print(f"No geometry data found for ID_LOD2: {ID_LOD2}")
+        return row
     except Exception as e:
         print(f"Error retrieving geometry data: {e}")
         return None
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Shared write layer: rows are inserted or updated with one PostgREST upsert (INSERT ... ON CONFLICT DO UPDATE) per batch,
+instead of a select followed by an update or insert (two round trips per row, and a second writer could insert in between).
+The conflict columns need a unique index in the database, see sql/add_upsert_unique_constraints.sql.
+"""
+import os
+from typing import Iterable
+
+from postgrest import ReturnMethod
+
+from .client import get_user_client
+
+# Maximum number of rows sent in one request
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "500"))
+
+# Rows belong to the user (user_id defaults to auth.uid()), so every conflict target starts with user_id.
+# user_id is not sent, the database fills it in before checking for conflicts.
+BUILDINGS_CONFLICT_KEYS = ["user_id", "ID_LOD2"]
+
+
+def upsert_rows(table_name: str, rows: dict | Iterable[dict], on_conflict: list[str], access_token: str, batch_size: int | None = None) -> int:
+    """
+    Inserts or updates rows of table_name under the privileges of the user (RLS applies), matched on the on_conflict columns.
+    Rows with the same columns are sent together, at most batch_size per request, and nothing is returned (return=minimal).
+    Columns missing in a row keep their value when the row exists and get their database default when it is inserted.
+    Returns the number of requests sent, errors are raised.
+    """
+    rows = [rows] if isinstance(rows, dict) else list(rows)
+    if not rows:
+        return 0
+    batch_size = batch_size or UPSERT_BATCH_SIZE
+
+    # A bulk upsert sets every column of the request on every row, so a row without a column would overwrite it with its default:
+    # rows are grouped by their columns. Within a group, a later row with the same key replaces an earlier one,
+    # Postgres rejects a batch that hits the same row twice.
+    groups = {}
+    for row in rows:
+        key = tuple(str(row.get(column)) for column in on_conflict if column in row)
+        groups.setdefault(tuple(sorted(row)), {})[key] = row
+
+    client = get_user_client(access_token)
+    requests = 0
+    for group in groups.values():
+        group = list(group.values())
+        for start in range(0, len(group), batch_size):
+            batch = group[start:start + batch_size]
+            client.table(table_name).upsert(
+                batch if len(batch) > 1 else batch[0],
+                on_conflict=",".join(on_conflict),
+                returning=ReturnMethod.minimal,
+                default_to_null=False,
+            ).execute()
+            requests += 1
+    return requests
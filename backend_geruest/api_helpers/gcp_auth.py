@@ -1,16 +1,72 @@
+import asyncio
+import os
+import threading
+import time
+
 import google.auth
+import google.auth.exceptions
 import google.auth.transport.requests
 import google.oauth2.id_token
+import jwt
+
+# ID tokens are valid for one hour. They are cached per audience and fetched again this many seconds before they expire.
+TOKEN_REFRESH_MARGIN = 300
+# The local development fallback is cached as well, otherwise every request waits for the metadata server lookup to fail
+FALLBACK_TOKEN_TTL = 300
+# Cloud Run sets K_SERVICE. There a failed token fetch is an error (e.g. a short metadata server outage), not local development.
+ON_CLOUD_RUN = bool(os.getenv("K_SERVICE"))
+
+_token_cache = {} # audience -> (token, expires_at)
+_token_lock = threading.Lock()
+
+
+def _fetch_google_oidc_token(audience: str) -> tuple[str, float]:
+    # Returns the token and the time it should be refreshed at
+    try:
+        # This only works when running on Google Cloud (Cloud Run/Cloud Build)
+        auth_req = google.auth.transport.requests.Request()
+        token = google.oauth2.id_token.fetch_id_token(auth_req, audience)
+    except google.auth.exceptions.DefaultCredentialsError:
+        # No metadata server and no service account: fallback for local development (LOD is likely on localhost without auth)
+        if ON_CLOUD_RUN:
+            raise
+        return "local-dev-token", time.time() + FALLBACK_TOKEN_TTL
+    try:
+        # Only the expiry is read here, the token is verified by the receiving service
+        expires_at = jwt.decode(token, options={"verify_signature": False})["exp"]
+    except (jwt.InvalidTokenError, KeyError):
+        expires_at = time.time() + TOKEN_REFRESH_MARGIN + 60 # unknown expiry, fetch again in a minute
+    return token, expires_at - TOKEN_REFRESH_MARGIN
+
+
+def _cached_token(audience: str) -> str | None:
+    cached = _token_cache.get(audience)
+    if cached is not None and time.time() < cached[1]:
+        return cached[0]
+    return None
+
 
 def get_google_oidc_token(audience: str) -> str:
     """
     Fetches an OIDC ID token from the Google Metadata Server.
     The 'audience' must be the URL of the target service (LOD backend).
+    The token is cached until shortly before it expires, so only about one request per hour pays for fetching it.
+    Errors of the metadata server are raised (google.auth.exceptions.GoogleAuthError) and not cached, the next call tries again.
     """
-    try:
-        # This only works when running on Google Cloud (Cloud Run/Cloud Build)
-        auth_req = google.auth.transport.requests.Request()
-        return google.oauth2.id_token.fetch_id_token(auth_req, audience)
-    except Exception:
-        # Fallback for local development (LOD is likely on localhost without auth)
-        return "local-dev-token"
\ No newline at end of file
+    token = _cached_token(audience)
+    if token is not None:
+        return token
+    with _token_lock:
+        token = _cached_token(audience) # another thread may have refreshed it meanwhile
+        if token is None:
+            token, refresh_at = _fetch_google_oidc_token(audience)
+            _token_cache[audience] = (token, refresh_at)
+    return token
+
+
+async def get_google_oidc_token_async(audience: str) -> str:
+    # Same as get_google_oidc_token(), but fetching a new token runs in a thread instead of blocking the event loop
+    token = _cached_token(audience)
+    if token is not None:
+        return token
+    return await asyncio.to_thread(get_google_oidc_token, audience)
@@ -0,0 +1,247 @@
+"""
+Local job queue for the Aufmass pipeline, stored in a SQLite file.
+
+The API only inserts a job and returns its id. A worker process (aufmass_worker.py) claims the queued jobs one by one,
+runs aufmass_main() and writes the progress of every stage as events, which the API streams to the client (SSE).
+Every job belongs to the Supabase user that started it (user_id, verified by api_helpers.supabase_auth), only that user
+can read it and only jobs of the same user are merged.
+SQLite is enough here: jobs and workers live on the same host, and there are only a few jobs per minute.
+"""
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+import uuid
+
+# The jobs hold the access tokens of the users, so the database lives in a directory only this user can read
+AUFMASS_JOB_DB = os.getenv("AUFMASS_JOB_DB", os.path.join(tempfile.gettempdir(), f"aufmass_jobs_{os.getuid()}", "aufmass_jobs.sqlite3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS aufmass_jobs (
+    job_id       TEXT PRIMARY KEY,
+    ID_LOD2      TEXT NOT NULL,
+    user_id      TEXT,             -- owner of the job
+    access_token TEXT,             -- needed by the worker for RLS, removed when the job is finished
+    status       TEXT NOT NULL,    -- queued, running, done, failed
+    progress     REAL NOT NULL DEFAULT 0,
+    stage        TEXT,
+    error        TEXT,
+    worker_pid   INTEGER,
+    created_at   REAL NOT NULL,
+    started_at   REAL,
+    finished_at  REAL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS aufmass_jobs_status ON aufmass_jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS aufmass_jobs_user ON aufmass_jobs (user_id, ID_LOD2, status);
+CREATE TABLE IF NOT EXISTS aufmass_job_events (
+    event_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id     TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    event      TEXT NOT NULL       -- JSON
+);
+CREATE INDEX IF NOT EXISTS aufmass_job_events_job ON aufmass_job_events (job_id, event_id);
+"""
+
+# Columns returned to the client (never the access token or the owner)
+_PUBLIC_COLUMNS = "job_id, ID_LOD2, status, progress, stage, error, created_at, started_at, finished_at, updated_at"
+FINISHED_STATUSES = ("done", "failed")
+
+_local = threading.local() # connections of the API threads, per database path
+_created = set() # database paths whose file and schema were set up by this process
+_created_lock = threading.Lock()
+
+
+def _create_private_file(db_path: str):
+    # Directory 0700 owned by this user, file 0600 (SQLite creates the -wal / -shm files with the mode of the database file)
+    directory = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"Job directory {directory} is not a directory owned by this user")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(directory, 0o700)
+    os.close(os.open(db_path, os.O_RDWR | os.O_CREAT, 0o600))
+    os.chmod(db_path, 0o600)
+
+
+def connect(db_path: str | None = None) -> sqlite3.Connection:
+    # Autocommit mode, transactions are opened explicitly where needed. WAL lets the API read while the worker writes.
+    # The file, the schema and the migration are only set up on the first connection of the process.
+    db_path = db_path or AUFMASS_JOB_DB
+    with _created_lock:
+        first = db_path not in _created
+        if first:
+            _create_private_file(db_path)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA secure_delete=ON") # no access tokens left in free pages of finished jobs
+    if first:
+        conn.execute("PRAGMA journal_mode=WAL") # stored in the file
+        _add_missing_columns(conn)
+        conn.executescript(_SCHEMA)
+        with _created_lock:
+            _created.add(db_path)
+    return conn
+
+
+def connection(db_path: str | None = None) -> sqlite3.Connection:
+    # One connection per thread and database, kept open for the next status polls of the API (do not close it)
+    db_path = db_path or AUFMASS_JOB_DB
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = connect(db_path)
+    return conn
+
+
+def _add_missing_columns(conn: sqlite3.Connection):
+    # Databases created before jobs had an owner: jobs without user_id cannot be read by anyone and are removed by remove_old_jobs()
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(aufmass_jobs)")]
+    if columns and "user_id" not in columns:
+        conn.execute("ALTER TABLE aufmass_jobs ADD COLUMN user_id TEXT")
+
+
+def enqueue_job(conn: sqlite3.Connection, ID_LOD2: str, access_token: str, user_id: str) -> dict:
+    """
+    Queues the Aufmass of a building for the user and returns the job. If the same user already queued or runs this building,
+    that job is returned instead (with the user's newer access token), so double clicks do not run the pipeline twice.
+    Jobs of other users are never merged or changed.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT job_id FROM aufmass_jobs WHERE user_id = ? AND ID_LOD2 = ? AND status IN ('queued', 'running') ORDER BY created_at LIMIT 1",
+            (user_id, ID_LOD2)).fetchone()
+        if row is not None:
+            job_id = row["job_id"]
+            conn.execute("UPDATE aufmass_jobs SET access_token = ?, updated_at = ? WHERE job_id = ? AND user_id = ?",
+                         (access_token, now, job_id, user_id))
+        else:
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO aufmass_jobs (job_id, ID_LOD2, user_id, access_token, status, created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, ID_LOD2, user_id, access_token, now, now))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return get_job(conn, job_id, user_id)
+
+
+def claim_next_job(conn: sqlite3.Connection) -> dict | None:
+    # Atomically takes the oldest queued job (several workers may poll the same database). Returns None if the queue is empty.
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT job_id FROM aufmass_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute("UPDATE aufmass_jobs SET status = 'running', worker_pid = ?, started_at = ?, updated_at = ? WHERE job_id = ?",
+                     (os.getpid(), now, now, row["job_id"]))
+        job = conn.execute("SELECT * FROM aufmass_jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return dict(job)
+
+
+def add_event(conn: sqlite3.Connection, job_id: str, event: dict):
+    """
+    Stores a progress event of aufmass_main() and updates the overall progress (0..1) and the current stage of the job.
+    """
+    now = time.time()
+    progress, stage = None, None
+    if "stage_index" in event:
+        finished = event["status"] in ("done", "skipped")
+        steps = event["facade_count"] * event["stage_count"]
+        progress = (event["facade_index"] * event["stage_count"] + event["stage_index"] + finished) / steps
+        stage = f"{event['stage']} (facade {event['facade_index'] + 1}/{event['facade_count']})"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _insert_event(conn, job_id, event, now)
+        conn.execute("UPDATE aufmass_jobs SET progress = COALESCE(?, progress), stage = COALESCE(?, stage), updated_at = ? WHERE job_id = ?",
+                     (progress, stage, now, job_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _insert_event(conn: sqlite3.Connection, job_id: str, event: dict, now: float):
+    conn.execute("INSERT INTO aufmass_job_events (job_id, created_at, event) VALUES (?, ?, ?)", (job_id, now, json.dumps(event)))
+
+
+def finish_job(conn: sqlite3.Connection, job_id: str, status: str, error: str | None = None):
+    # Status and final event in one transaction, so a reader that sees the finished status also finds the final event
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _insert_event(conn, job_id, {"status": status, "error": error}, now)
+        conn.execute("UPDATE aufmass_jobs SET status = ?, error = ?, access_token = NULL, finished_at = ?, updated_at = ?, "
+                     "progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END WHERE job_id = ?",
+                     (status, error, now, now, status, job_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def get_job(conn: sqlite3.Connection, job_id: str, user_id: str) -> dict | None:
+    # None if the job does not exist or belongs to another user (both look the same to the caller)
+    row = conn.execute(f"SELECT {_PUBLIC_COLUMNS} FROM aufmass_jobs WHERE job_id = ? AND user_id = ?", (job_id, user_id)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def get_events(conn: sqlite3.Connection, job_id: str, after_event_id: int = 0) -> list[tuple[int, dict]]:
+    # Events of a job newer than after_event_id, as (event_id, event)
+    rows = conn.execute("SELECT event_id, event FROM aufmass_job_events WHERE job_id = ? AND event_id > ? ORDER BY event_id",
+                        (job_id, after_event_id)).fetchall()
+    return [(row["event_id"], json.loads(row["event"])) for row in rows]
+
+
+def requeue_stale_jobs(conn: sqlite3.Connection):
+    """
+    Puts jobs back into the queue whose worker process does not exist anymore (crash, container restart), returns their ids.
+    Only meaningful on the host the workers run on, which is always the case for this local queue.
+    """
+    stale = []
+    for row in conn.execute("SELECT job_id, worker_pid FROM aufmass_jobs WHERE status = 'running'").fetchall():
+        if row["worker_pid"] == os.getpid() or _process_alive(row["worker_pid"]):
+            continue
+        conn.execute("UPDATE aufmass_jobs SET status = 'queued', worker_pid = NULL, updated_at = ? WHERE job_id = ? AND status = 'running'",
+                     (time.time(), row["job_id"]))
+        stale.append(row["job_id"])
+    return stale
+
+
+def _process_alive(pid: int | None) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # exists, but belongs to another user
+    except OSError:
+        return False
+    return True
+
+
+def remove_old_jobs(conn: sqlite3.Connection, max_age_s: float = 7 * 24 * 3600):
+    # Finished jobs and their events are kept for a week, so clients can still look up the result
+    cutoff = time.time() - max_age_s
+    conn.execute("DELETE FROM aufmass_job_events WHERE job_id IN (SELECT job_id FROM aufmass_jobs WHERE status IN ('done', 'failed') AND finished_at < ?)", (cutoff,))
+    conn.execute("DELETE FROM aufmass_jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+    # Jobs without owner (created before jobs had one) cannot be read by anyone
+    conn.execute("DELETE FROM aufmass_job_events WHERE job_id IN (SELECT job_id FROM aufmass_jobs WHERE user_id IS NULL AND status IN ('done', 'failed'))")
+    conn.execute("DELETE FROM aufmass_jobs WHERE user_id IS NULL AND status IN ('done', 'failed')")
@@ -0,0 +1,71 @@
+import asyncio
+import hashlib
+import threading
+import time
+
+import jwt
+
+from Supabase_database.client import SUPABASE_ANON_KEY, SUPABASE_URL, get_http_client
+
+# Verified users are cached per access token for at most this many seconds (and never beyond the expiry of the token),
+# so polling the job status does not ask Supabase Auth on every request
+USER_CACHE_TTL = 300
+USER_CACHE_SIZE = 1000
+
+_user_cache = {} # sha256 of the access token -> (user id, valid until)
+_user_lock = threading.Lock()
+
+
+def _token_hash(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+def _cached_user(token_hash: str) -> str | None:
+    cached = _user_cache.get(token_hash)
+    if cached is not None and time.time() < cached[1]:
+        return cached[0]
+    return None
+
+
+def _fetch_user_id(access_token: str) -> tuple[str | None, float]:
+    # Supabase Auth checks the signature and the session of the token. Returns the user id (None if the token is invalid) and how long it can be cached.
+    response = get_http_client().get(f"{SUPABASE_URL}/auth/v1/user",
+                                     headers={"apikey": SUPABASE_ANON_KEY, "Authorization": f"Bearer {access_token}"})
+    if response.status_code in (401, 403):
+        return None, 0
+    response.raise_for_status()
+    valid_until = time.time() + USER_CACHE_TTL
+    try:
+        # Only the expiry is read here, the token was verified by Supabase Auth
+        valid_until = min(valid_until, jwt.decode(access_token, options={"verify_signature": False})["exp"])
+    except (jwt.InvalidTokenError, KeyError):
+        pass
+    return response.json()["id"], valid_until
+
+
+def get_user_id(access_token: str) -> str | None:
+    """
+    Returns the id of the Supabase user the access token belongs to, or None if the token is not valid (anymore).
+    Unlike reading the 'sub' claim, this cannot be faked with a self-made token, so it can be used to check who owns a job.
+    """
+    token_hash = _token_hash(access_token)
+    user_id = _cached_user(token_hash)
+    if user_id is not None:
+        return user_id
+    user_id, valid_until = _fetch_user_id(access_token)
+    if user_id is not None:
+        with _user_lock:
+            if len(_user_cache) >= USER_CACHE_SIZE:
+                now = time.time()
+                for key in [key for key, (_, until) in _user_cache.items() if until <= now] or list(_user_cache)[:USER_CACHE_SIZE // 10]:
+                    _user_cache.pop(key, None)
+            _user_cache[token_hash] = (user_id, valid_until)
+    return user_id
+
+
+async def get_user_id_async(access_token: str) -> str | None:
+    # Same as get_user_id(), but asking Supabase Auth runs in a thread instead of blocking the event loop
+    user_id = _cached_user(_token_hash(access_token))
+    if user_id is not None:
+        return user_id
+    return await asyncio.to_thread(get_user_id, access_token)
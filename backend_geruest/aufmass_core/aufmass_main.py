@@ -1,5 +1,6 @@
 import sys
 import os
+import time
 import numpy as np
 
 # Add backend directory to sys.path so 'aufmass_core' can be imported. Only needed for testing purposes.
@@ -11,7 +12,7 @@ if sam3_path not in sys.path:
     sys.path.insert(0, sam3_path)
 
 from aufmass_core.database_download_functions import _get_aufmass_objects, _get_facade_image
-from aufmass_core.database_upload_functions import _insert_aufmass_object
+from aufmass_core.database_upload_functions import _insert_aufmass_objects
 from aufmass_core.datastructure.aufmassClasses import *
 from dataclasses import fields
 from aufmass_core.preprocessing._1_lens_correction import lens_correction
@@ -27,7 +28,49 @@ from aufmass_core.postprocessing._7_2_simple_statistics import analyze_segmentat
 from aufmass_core.postprocessing._7_3_create_segmentation_overlay import create_segmentation_overlay
 from aufmass_core.postprocessing._7_1_filter_mask import filter_segmentation_mask
 
-def aufmass_main(ID_LOD2: str, access_token: str, execution_mode: str = "server"):
+# Stages run for every facade, in this order (used for the progress reports)
+AUFMASS_STAGES = [
+    "lens_correction",
+    "identify_main_facade",
+    "crop_image",
+    "rectify_image",
+    "main_segmentation",
+    "filter_segmentation_mask",
+    "analyze_segmentation_results",
+    "create_segmentation_overlay",
+]
+# Waiting time before a failed stage is retried, multiplied with the number of the attempt
+STAGE_RETRY_DELAY = float(os.getenv("AUFMASS_STAGE_RETRY_DELAY", "5"))
+
+
+def _print_progress(event: dict):
+    # Default progress report: just log the stage changes
+    error = f" ({event['error']})" if event.get("error") else ""
+    print(f"Facade {event['facade_id']} [{event['facade_index'] + 1}/{event['facade_count']}]: {event['stage']} {event['status']}{error}")
+
+
+def _run_stage(stage: str, function, report, stage_retries: int):
+    """
+    Runs one stage of a facade and reports its status ("running", "done", "retrying", "failed").
+    Exceptions (e.g. a dropped database connection or a model that ran out of memory) are retried up to stage_retries times,
+    afterwards the exception is raised.
+    """
+    for attempt in range(stage_retries + 1):
+        report(stage, "running", attempt)
+        try:
+            result = function()
+        except Exception as e:
+            if attempt < stage_retries:
+                report(stage, "retrying", attempt, f"{type(e).__name__}: {e}")
+                time.sleep(STAGE_RETRY_DELAY * (attempt + 1))
+                continue
+            report(stage, "failed", attempt, f"{type(e).__name__}: {e}")
+            raise
+        report(stage, "done", attempt)
+        return result
+
+
+def aufmass_main(ID_LOD2: str, access_token: str, execution_mode: str = "server", progress=None, stage_retries: int = 0):
     """
     Manages the steps ofthe building measurement process (Gebäudeaufmass).
     Only needs ID_LOD2 to clearly identify the building and  the access token for RLS compliance.
@@ -40,7 +83,11 @@ def aufmass_main(ID_LOD2: str, access_token: str, execution_mode: str = "server"
         access_token: Access token for RLS compliance
         execution_mode: Execution mode - "server" (default) or "local". 
                        If "local", visualization functions will be used, otherwise not.
+        progress: Called with a dict (facade_id, facade_index, facade_count, stage, stage_index, stage_count, status, attempt, error)
+                  whenever a stage starts, finishes, fails or is retried. Prints the stage changes if not given.
+        stage_retries: How often a failed stage is retried before the exception is raised.
     """
+    progress = progress or _print_progress
 
     # 0. Get all facades for the building from the database and turn them into Facade objects. Start the measurement process for each facade.
     facades_data = _get_aufmass_objects(ID_LOD2, "facade", access_token=access_token)
@@ -61,19 +108,27 @@ def aufmass_main(ID_LOD2: str, access_token: str, execution_mode: str = "server"
             print(f"Facade {facade_data.get('facade_id')} has no photo. Skipping.")
 
     print(f"Found {len(facades)} facades with photos for building {ID_LOD2}. Processing each facade...")
-    for facade in facades:
+    for facade_index, facade in enumerate(facades):
+        def report(stage, status, attempt=0, error=None, facade_index=facade_index, facade_id=facade.facade_id):
+            progress({"facade_id": facade_id, "facade_index": facade_index, "facade_count": len(facades),
+                      "stage": stage, "stage_index": AUFMASS_STAGES.index(stage), "stage_count": len(AUFMASS_STAGES),
+                      "status": status, "attempt": attempt, "error": error})
+
+        def run(stage, function):
+            return _run_stage(stage, function, report, stage_retries)
+
         ################# Preprocessing Steps #####################
         # 1. Lens Correction -> saved to db
-        lens_correction(ID_LOD2, facade.facade_id, access_token)
+        run("lens_correction", lambda: lens_correction(ID_LOD2, facade.facade_id, access_token))
         
         # 2. Identify Main Facade
-        identify_main_facade(ID_LOD2, facade.facade_id, access_token, execution_mode=execution_mode)
+        run("identify_main_facade", lambda: identify_main_facade(ID_LOD2, facade.facade_id, access_token, execution_mode=execution_mode))
         
         # 3. Crop Image -> saved to db
-        crop_image(ID_LOD2, facade.facade_id, access_token)
+        run("crop_image", lambda: crop_image(ID_LOD2, facade.facade_id, access_token))
         
         # 4. Rectify Image
-        rectify_image(ID_LOD2, facade.facade_id, access_token)
+        run("rectify_image", lambda: rectify_image(ID_LOD2, facade.facade_id, access_token))
         
         # 5. Identify Obscuring Elements - not active for now
         # identify_obscuring_elements(ID_LOD2, facade.facade_id, access_token)
@@ -82,21 +137,32 @@ def aufmass_main(ID_LOD2: str, access_token: str, execution_mode: str = "server"
         # generative_completion(ID_LOD2, facade.facade_id, access_token)
         
         ################# Main Processing Steps #####################
-        # 7. Main Segmentation (Return raw batch results meaning binary masks for each class, includes class_mappings, no upload)
-        elem_pred, config = main_segmentation(ID_LOD2, facade.facade_id, access_token)
+        # The results of the following stages are not read by a later stage, they are collected and written in one batch per facade
+        # (also when a stage fails, so the results of the finished stages are kept)
+        results = []
+        try:
+            # 7. Main Segmentation (Return raw batch results meaning binary masks for each class, includes class_mappings, raw mask added to results)
+            elem_pred, config = run("main_segmentation", lambda: main_segmentation(ID_LOD2, facade.facade_id, access_token, results=results))
 
-        # 7.1 Filter out Artifacts & unwanted Elements (upload to db)
-        elem_pred_filtered = filter_segmentation_mask(ID_LOD2, elem_pred, config, facade.facade_id, access_token, execution_mode=execution_mode)
-        
-        # 7.2 --- Analysis via _7_2_simple_statistics ---
-        # Show the segmentation mask in a transparent mode on the pre-processed input image; transparent_segmentation_overlay
-        if elem_pred_filtered is not None:
-            analyze_segmentation_results(ID_LOD2, elem_pred_filtered, config, facade.facade_id, access_token)
-        
-        # --- Create Segmentation Overlay Image ---
-        # Creates a transparent overlay of the segmentation mask on the rectified image
-        if elem_pred_filtered is not None:
-            create_segmentation_overlay(ID_LOD2, facade.facade_id, elem_pred_filtered, access_token, alpha=0.3, execution_mode=execution_mode)
+            # 7.1 Filter out Artifacts & unwanted Elements (cleaned mask added to results)
+            elem_pred_filtered = run("filter_segmentation_mask", lambda: filter_segmentation_mask(ID_LOD2, elem_pred, config, facade.facade_id, access_token, execution_mode=execution_mode, results=results))
+            
+            # 7.2 --- Analysis via _7_2_simple_statistics ---
+            # Show the segmentation mask in a transparent mode on the pre-processed input image; transparent_segmentation_overlay
+            if elem_pred_filtered is not None:
+                run("analyze_segmentation_results", lambda: analyze_segmentation_results(ID_LOD2, elem_pred_filtered, config, facade.facade_id, access_token, results=results))
+            else:
+                report("analyze_segmentation_results", "skipped")
+            
+            # --- Create Segmentation Overlay Image ---
+            # Creates a transparent overlay of the segmentation mask on the rectified image
+            if elem_pred_filtered is not None:
+                run("create_segmentation_overlay", lambda: create_segmentation_overlay(ID_LOD2, facade.facade_id, elem_pred_filtered, access_token, alpha=0.3, execution_mode=execution_mode))
+            else:
+                report("create_segmentation_overlay", "skipped")
+        finally:
+            if results:
+                _insert_aufmass_objects(results, access_token)
         
         ################# Post Processing Steps #####################
         # 8. Get Reference Scale - possibly takes place in the frontend
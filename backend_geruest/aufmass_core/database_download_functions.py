@@ -7,7 +7,7 @@ from Supabase_database.client import get_user_client
 from Supabase_database.handlers import NumpyEncoder
 from aufmass_core.datastructure.aufmassClasses import *
 
-def _get_aufmass_objects(ID_LOD2: str, table_name: str, ids: dict = None, tags: list = None, access_token: str = None) -> list[Any]:
+def _get_aufmass_objects(ID_LOD2: str, table_name: str, ids: dict = None, tags: list = None, access_token: str = None, columns: list[str] = None) -> list[Any]:
     """
     Function to retrieve aufmass objects from the database.
     
@@ -17,6 +17,7 @@ def _get_aufmass_objects(ID_LOD2: str, table_name: str, ids: dict = None, tags:
         ids: dict (optional) - specific IDs to filter by (e.g., {'facade_id': '1'})
         tags: list (optional) - filter by tags (must contain all provided tags)
         access_token: str
+        columns: list (optional) - only fetch these columns, e.g. ["mask_id"] to check for an existing mask without downloading the mask itself
     Returns:
         list[dict] - List of database records matching the criteria
     """
@@ -29,7 +30,7 @@ def _get_aufmass_objects(ID_LOD2: str, table_name: str, ids: dict = None, tags:
     
     try:
         # Build query - Removed .eq("user_id", user_id) as RLS handles this
-        query = client.table(table_name).select("*").eq("ID_LOD2", ID_LOD2)
+        query = client.table(table_name).select(",".join(columns) if columns else "*").eq("ID_LOD2", ID_LOD2)
         
         # Apply optional ID filters
         if ids:
@@ -2,7 +2,6 @@ import os
 import torch
 import tempfile
 import numpy as np
-import uuid
 import cv2
 import time
 
@@ -11,8 +10,7 @@ from aufmass_core.models.sam3_model_cache import get_sam3_segmenter
 
 # Importe für Datenbank
 from aufmass_core.database_download_functions import _get_facade_image
-from aufmass_core.database_upload_functions import _insert_aufmass_object
-from aufmass_core.database_download_functions import _get_aufmass_objects
+from aufmass_core.database_upload_functions import _insert_aufmass_object, _segmentation_mask_id
 from aufmass_core.datastructure.aufmassClasses import SegmentationMask
 from aufmass_core.helpers.mask_utils import mask_to_jsonb, merge_layers, get_shape_from_batch_results
 
@@ -32,38 +30,33 @@ def _get_config():
         }
     }
 
-def _save_raw_segmentation_mask(raw_pred, ID_LOD2, facade_id, access_token):
-    """Saves the raw (merged) segmentation mask to database before filtering."""
+def _save_raw_segmentation_mask(raw_pred, ID_LOD2, facade_id, access_token, results=None):
+    """Saves the raw (merged) segmentation mask to database before filtering (or adds it to results, written later in one batch)."""
     # Convert mask to JSONB format
     mask_jsonb = mask_to_jsonb(raw_pred)
     
-    # Check if mask already exists to update it instead of creating a new one
-    existing_masks = _get_aufmass_objects(ID_LOD2, "segmentation_mask", ids={"facade_id": facade_id}, tags=["raw_segmentation"], access_token=access_token)
-    
-    if existing_masks:
-        mask_id = existing_masks[0]["mask_id"]
-        print(f"[INFO] Updating existing raw_segmentation mask {mask_id}")
-    else:
-        mask_id = str(uuid.uuid4())
-        print(f"[INFO] Creating new raw_segmentation mask {mask_id}")
-    
+    # An existing raw_segmentation mask of the facade is updated (same tags, same mask_id), no need to look it up first
     raw_segmentation_mask = SegmentationMask(
         ID_LOD2=ID_LOD2,
         facade_id=facade_id,
-        mask_id=mask_id,
+        mask_id=_segmentation_mask_id(ID_LOD2, facade_id, ["raw_segmentation"]),
         tags=["raw_segmentation"],
         mask=mask_jsonb
     )
     
-    _insert_aufmass_object(raw_segmentation_mask, access_token)
+    if results is not None:
+        results.append(raw_segmentation_mask)
+    else:
+        _insert_aufmass_object(raw_segmentation_mask, access_token)
 
 
-def main_segmentation(ID_LOD2: str, facade_id: str, access_token: str):
+def main_segmentation(ID_LOD2: str, facade_id: str, access_token: str, results: list = None):
     '''
     The main segmentation process that identifies all facade elements using SAM3 after all preprocessing steps.
     Uses ID_LOD2 and facade_id to obtain the rectified image.
     Returns the raw batch results from SAM3 and config. 
     The merging and cleaning is now handled in postprocessing.
+    If results is given, the raw_segmentation mask is added to it instead of being written to the database.
     '''
     print(f"Starting SAM3 main segmentation for {ID_LOD2}, facade {facade_id}")
     
@@ -133,7 +126,7 @@ def main_segmentation(ID_LOD2: str, facade_id: str, access_token: str):
         raw_pred = merge_layers(batch_results, shape, class_mappings_dict, cleaning_config=None)
         
         if raw_pred is not None:
-            _save_raw_segmentation_mask(raw_pred, ID_LOD2, facade_id, access_token)
+            _save_raw_segmentation_mask(raw_pred, ID_LOD2, facade_id, access_token, results)
         else:
             print("Warning: Could not create raw_segmentation mask from batch results.")
         
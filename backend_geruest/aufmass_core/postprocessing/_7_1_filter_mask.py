@@ -4,9 +4,7 @@ import traceback
 import matplotlib.pyplot as plt
 from ..datastructure.aufmassClasses import SegmentationMask
 from ..helpers.mask_utils import mask_to_jsonb, merge_layers, get_shape_from_batch_results
-from ..database_upload_functions import _insert_aufmass_object
-from ..database_download_functions import _get_aufmass_objects
-import uuid
+from ..database_upload_functions import _insert_aufmass_object, _segmentation_mask_id
 
 # --- DEFAULT CLEANING CONFIGURATION ---
 # Can be overridden or adjusted via config in the future
@@ -109,32 +107,26 @@ def _visualize_mask_comparison(mask_before, mask_after, facade_id, class_mapping
         print(f"Warning: Konnte Visualisierung nicht erstellen: {e}")
         traceback.print_exc()
 
-def _save_cleaned_mask(cleaned_pred, ID_LOD2, facade_id, access_token):
-    """Saves the cleaned mask to database."""
+def _save_cleaned_mask(cleaned_pred, ID_LOD2, facade_id, access_token, results=None):
+    """Saves the cleaned mask to database (or adds it to results, written later in one batch)."""
     # Convert mask to JSONB format
     mask_jsonb = mask_to_jsonb(cleaned_pred)
     
-    # Check if mask already exists to update it instead of creating a new one
-    existing_masks = _get_aufmass_objects(ID_LOD2, "segmentation_mask", ids={"facade_id": facade_id}, tags=["facade_cleaned"], access_token=access_token)
-    
-    if existing_masks:
-        mask_id = existing_masks[0]["mask_id"]
-        print(f"[INFO] Updating existing mask {mask_id}")
-    else:
-        mask_id = str(uuid.uuid4())
-        print(f"[INFO] Creating new mask {mask_id}")
-    
+    # An existing facade_cleaned mask of the facade is updated (same tags, same mask_id), no need to look it up first
     cleaned_segmentation_mask = SegmentationMask(
         ID_LOD2=ID_LOD2,
         facade_id=facade_id,
-        mask_id=mask_id,
+        mask_id=_segmentation_mask_id(ID_LOD2, facade_id, ["facade_cleaned"]),
         tags=["facade_cleaned"],
         mask=mask_jsonb
     )
     
-    _insert_aufmass_object(cleaned_segmentation_mask, access_token)
+    if results is not None:
+        results.append(cleaned_segmentation_mask)
+    else:
+        _insert_aufmass_object(cleaned_segmentation_mask, access_token)
 
-def filter_segmentation_mask(ID_LOD2, elem_pred, config, facade_id, access_token, execution_mode: str = "server"):
+def filter_segmentation_mask(ID_LOD2, elem_pred, config, facade_id, access_token, execution_mode: str = "server", results: list = None):
     """
     Takes the segmentation result, removes illogical elements & artifacts:
     1. Remove facade areas & elements that are not connected to the main facade (e.g. Chimneys, artifacts)
@@ -143,6 +135,7 @@ def filter_segmentation_mask(ID_LOD2, elem_pred, config, facade_id, access_token
     Args:
         execution_mode: Execution mode - "server" (default) or "local". 
                        If "local", visualization functions will be used, otherwise not.
+        results: If given, the cleaned mask is added to it instead of being written to the database.
     """
 
     if elem_pred is None or config is None:
@@ -207,6 +200,6 @@ def filter_segmentation_mask(ID_LOD2, elem_pred, config, facade_id, access_token
         return None
 
     # Save cleaned mask
-    _save_cleaned_mask(cleaned_pred, ID_LOD2, facade_id, access_token)
+    _save_cleaned_mask(cleaned_pred, ID_LOD2, facade_id, access_token, results)
 
     return cleaned_pred
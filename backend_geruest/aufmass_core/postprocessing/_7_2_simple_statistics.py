@@ -5,11 +5,12 @@ from ..database_upload_functions import _insert_aufmass_object
 from ..database_download_functions import _get_aufmass_objects
 from ..datastructure.aufmassClasses import Facade
 
-def analyze_segmentation_results(ID_LOD2, elem_pred, config, facade_id, access_token):
+def analyze_segmentation_results(ID_LOD2, elem_pred, config, facade_id, access_token, results: list = None):
     """
     Analyzes the raw segmentation result (pixel definitions) to calculate:
     1. Window-to-Wall Ratio (WWR)
     2. Average Window Size (in pixels)
+    If results is given, the updated facade is added to it instead of being written to the database.
     """
 
     if elem_pred is None or config is None:
@@ -79,11 +80,11 @@ def analyze_segmentation_results(ID_LOD2, elem_pred, config, facade_id, access_t
             window_count = len(all_areas)
 
         # Insert WWR & window count into database
-        results = _get_aufmass_objects(ID_LOD2, "facade", ids={"facade_id": str(facade_id)}, access_token=access_token)
+        existing_facades = _get_aufmass_objects(ID_LOD2, "facade", ids={"facade_id": str(facade_id)}, access_token=access_token)
         
-        if results:
+        if existing_facades:
             # Convert dictionary result to Facade dataclass instance
-            facade_data = results[0]
+            facade_data = existing_facades[0]
             # Filter out fields that are not in the Facade dataclass (like 'user_id' or database-specific 'id')
             facade_obj = Facade(**{k: v for k, v in facade_data.items() if k in Facade.__dataclass_fields__})
         else:
@@ -92,7 +93,10 @@ def analyze_segmentation_results(ID_LOD2, elem_pred, config, facade_id, access_t
 
         facade_obj.wwr = wwr
         facade_obj.window_count = window_count
-        _insert_aufmass_object(facade_obj, access_token)
+        if results is not None:
+            results.append(facade_obj)
+        else:
+            _insert_aufmass_object(facade_obj, access_token)
         print(f"Updated database with WWR and window count for Facade {facade_id}: WWR={wwr:.2%}, Window Count={window_count}")
         
     except Exception as e:
@@ -1,12 +1,11 @@
 from aufmass_core.models.sam3_model_cache import get_sam3_segmenter
-from aufmass_core.database_download_functions import _get_facade_image, _get_aufmass_objects
-from aufmass_core.database_upload_functions import _insert_aufmass_object
+from aufmass_core.database_download_functions import _get_facade_image
+from aufmass_core.database_upload_functions import _insert_aufmass_object, _segmentation_mask_id
 from aufmass_core.datastructure.aufmassClasses import SegmentationMask
 from ..helpers.mask_utils import mask_to_jsonb
 from PIL import Image
 import torch
 import tempfile
-import uuid
 import os
 from io import BytesIO
 import time
@@ -328,16 +327,9 @@ def identify_main_facade(ID_LOD2: str, facade_id: str, access_token: str, execut
         
         # 7. Create SegmentationMask object
         
-        # Check if mask already exists to update it instead of creating a new one
-        # This prevents cluttering the DB with multiple masks for the same facade
-        existing_masks = _get_aufmass_objects(ID_LOD2, "segmentation_mask", ids={"facade_id": facade_id}, tags=["facade_unprocessed"], access_token=access_token)
-        
-        if existing_masks and len(existing_masks) > 0:
-            mask_id = existing_masks[0]["mask_id"]
-            print(f"[INFO] Updating existing mask {mask_id}")
-        else:
-            mask_id = str(uuid.uuid4())
-            print(f"[INFO] Creating new mask {mask_id}")
+        # An existing facade_unprocessed mask of the facade is updated (same tags, same mask_id) instead of creating a new one,
+        # this prevents cluttering the DB with multiple masks for the same facade
+        mask_id = _segmentation_mask_id(ID_LOD2, facade_id, ["facade_unprocessed"])
 
         segmentation_mask = SegmentationMask(
             ID_LOD2=ID_LOD2,
@@ -347,7 +339,7 @@ def identify_main_facade(ID_LOD2: str, facade_id: str, access_token: str, execut
             mask=mask_jsonb
         )
         
-        # 8. Save to database
+        # 8. Save to database (right away, _3_crop_image.py reads the mask)
         _insert_aufmass_object(segmentation_mask, access_token)
         
         print(f"[SUCCESS] Central facade identified for {ID_LOD2}/{facade_id}")
@@ -24,7 +24,7 @@ def load_mask_from_db(ID_LOD2: str, facade_id: str, tags: list[str], access_toke
         ValueError: If no mask is found or mask is invalid
     """
     ids = {"facade_id": facade_id}
-    results = _get_aufmass_objects(ID_LOD2, "segmentation_mask", ids=ids, tags=tags, access_token=access_token)
+    results = _get_aufmass_objects(ID_LOD2, "segmentation_mask", ids=ids, tags=tags, access_token=access_token, columns=["mask"])
     
     if not results or len(results) == 0:
         raise ValueError(f"No segmentation mask found for {ID_LOD2}/{facade_id} with tags {tags}")
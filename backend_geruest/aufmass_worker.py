@@ -0,0 +1,77 @@
+"""
+Worker process of the Aufmass job queue (see api_helpers/job_queue.py).
+
+Started automatically by main.py (AUFMASS_START_WORKER=true, default) or separately with:
+    python aufmass_worker.py
+Only one worker per host processes jobs at a time (lock file next to the job database), further workers wait as standby,
+so several uvicorn workers do not load the segmentation models several times.
+"""
+import os
+import time
+import traceback
+
+from api_helpers import job_queue
+
+try:
+    import fcntl # Unix only, without it every started worker processes jobs
+except ImportError:
+    fcntl = None
+
+POLL_INTERVAL = float(os.getenv("AUFMASS_POLL_INTERVAL", "1.0"))
+# How often a failed stage of a facade is retried before the job fails
+STAGE_RETRIES = int(os.getenv("AUFMASS_STAGE_RETRIES", "2"))
+
+
+def _acquire_worker_lock(db_path):
+    # Blocks until no other worker on this host holds the lock. The file stays open (and locked) for the lifetime of the process.
+    if fcntl is None:
+        return None
+    lock_file = open(f"{db_path}.worker.lock", "a+b")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def run_job(conn, job):
+    # Imported here, so the API process that starts the worker does not load the models
+    from aufmass_core.aufmass_main import aufmass_main
+
+    job_id = job["job_id"]
+    print(f"Aufmass job {job_id} started for building {job['ID_LOD2']}")
+    try:
+        aufmass_main(job["ID_LOD2"], job["access_token"], progress=lambda event: job_queue.add_event(conn, job_id, event), stage_retries=STAGE_RETRIES)
+    except Exception as e:
+        traceback.print_exc()
+        job_queue.finish_job(conn, job_id, "failed", f"{type(e).__name__}: {e}")
+        print(f"Aufmass job {job_id} failed: {e}")
+        return
+    job_queue.finish_job(conn, job_id, "done")
+    print(f"Aufmass job {job_id} done")
+
+
+def run_worker(db_path=None):
+    db_path = db_path or job_queue.AUFMASS_JOB_DB
+    worker_lock = _acquire_worker_lock(db_path)
+    conn = job_queue.connect(db_path)
+    stale = job_queue.requeue_stale_jobs(conn)
+    if stale:
+        print(f"Requeued {len(stale)} Aufmass job(s) of a stopped worker")
+    job_queue.remove_old_jobs(conn)
+    print(f"Aufmass worker {os.getpid()} waiting for jobs in {db_path}")
+    try:
+        while True:
+            job = job_queue.claim_next_job(conn)
+            if job is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+            run_job(conn, job)
+    finally:
+        conn.close()
+        if worker_lock is not None:
+            worker_lock.close()
+
+
+if __name__ == "__main__":
+    try:
+        run_worker()
+    except KeyboardInterrupt:
+        pass
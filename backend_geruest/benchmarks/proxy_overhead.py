@@ -0,0 +1,144 @@
+"""
+Latency overhead of the geruest proxy, measured against a local stub of the LOD2 backend (no Google Cloud, no database).
+
+Starts the stub upstream and the proxy (main.py) in separate processes and sends the same requests once directly to the stub
+and once through the proxy. The difference is the proxy overhead (token lookup, upstream connection, passing the body on).
+For comparison, the direct requests are also sent with a new client (new TCP connection) per request, as the proxy did before
+it kept a shared connection pool.
+
+Run from the backend_geruest folder:
+    python benchmarks/proxy_overhead.py --requests 500 --concurrency 16 --payload-kb 256
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+
+def _serve_stub(port, payload_kb):
+    # Stub of the LOD2 backend: fixed JSON answers, geometry of payload_kb kilobytes
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import Response
+
+    stub = FastAPI()
+    geometry = ('{"walls": [' + ",".join(["[1.25, 2.5, 3.75]"] * (payload_kb * 1024 // 18)) + "]}").encode()
+
+    @stub.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @stub.post("/api/address")
+    def address():
+        return {"message": "Adresse: Teststraße 1", "ID_LOD2": "DEBY_LOD2_TEST"}
+
+    @stub.api_route("/api/geom-to-threejs", methods=["GET", "POST"])
+    def geom():
+        return Response(geometry, media_type="application/json", headers={"ETag": '"stub"'})
+
+    uvicorn.run(stub, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _serve_proxy(port, upstream_url):
+    os.environ["BACKEND_LOD2_URL"] = upstream_url
+    os.environ["AUFMASS_START_WORKER"] = "false"
+    import uvicorn
+    from main import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _start(target, *args):
+    process = multiprocessing.get_context("spawn").Process(target=target, args=args, daemon=True)
+    process.start()
+    return process
+
+
+def _wait_ready(url, timeout=60):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout} s")
+
+
+async def _measure(base_url, path, n_requests, concurrency, shared_client=True):
+    # Latencies of n_requests requests (concurrency at a time), with one shared client or a new client per request
+    method = "POST" if path == "/api/address" else "GET"
+    kwargs = {"params": {"ID_LOD2": "DEBY_LOD2_TEST"}, "headers": {"Authorization": "Bearer benchmark"}}
+    if method == "POST":
+        kwargs = {"json": {"street": "Teststraße", "number": "1", "city": "München", "state": "Bayern", "country": "Deutschland"},
+                  "headers": {"Authorization": "Bearer benchmark"}}
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(client):
+        async with semaphore:
+            start = time.perf_counter()
+            if client is None:
+                async with httpx.AsyncClient() as own_client:
+                    response = await own_client.request(method, base_url + path, **kwargs)
+            else:
+                response = await client.request(method, base_url + path, **kwargs)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await one(client if shared_client else None) # warm-up
+        latencies.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*[one(client if shared_client else None) for _ in range(n_requests)])
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "req_s": n_requests / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency overhead of the geruest proxy against a local stub upstream.")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--payload-kb", type=int, default=256, help="Size of the stub geometry response")
+    parser.add_argument("--stub-port", type=int, default=18100)
+    parser.add_argument("--proxy-port", type=int, default=18103)
+    args = parser.parse_args()
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    proxy_url = f"http://127.0.0.1:{args.proxy_port}"
+    processes = [_start(_serve_stub, args.stub_port, args.payload_kb), _start(_serve_proxy, args.proxy_port, stub_url)]
+    try:
+        _wait_ready(stub_url + "/health")
+        _wait_ready(proxy_url + "/health")
+        print(f"{args.requests} requests, concurrency {args.concurrency}, geometry payload {args.payload_kb} KB")
+        print(f"{'':<52}{'p50':>10}{'p95':>10}{'req/s':>10}")
+        for path in ["/api/address", "/api/geom-to-threejs"]:
+            direct = asyncio.run(_measure(stub_url, path, args.requests, args.concurrency))
+            new_connection = asyncio.run(_measure(stub_url, path, args.requests, args.concurrency, shared_client=False))
+            proxied = asyncio.run(_measure(proxy_url, path, args.requests, args.concurrency))
+            for name, result in [("direct", direct), ("direct, new connection per request", new_connection), ("through proxy", proxied)]:
+                print(f"{path + ' ' + name:<52}{result['p50_ms']:>8.2f}ms{result['p95_ms']:>8.2f}ms{result['req_s']:>10.0f}")
+            print(f"{path + ' proxy overhead (p50)':<52}{proxied['p50_ms'] - direct['p50_ms']:>8.2f}ms\n")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
-from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from api_helpers.gcp_auth import get_google_oidc_token
+from contextlib import asynccontextmanager
+from api_helpers.gcp_auth import get_google_oidc_token_async
+from google.auth.exceptions import GoogleAuthError
+from api_helpers import job_queue
+from api_helpers.supabase_auth import get_user_id_async
+import asyncio
+import json
+import multiprocessing
 import httpx
 import os
 from Supabase_database.handlers import update_building_data
-from aufmass_core.aufmass_main import aufmass_main
 
 
 try:
@@ -19,9 +28,44 @@ except ImportError:
 # Load environment variables
 load_dotenv()
 
+# The Aufmass pipeline runs in a separate worker process (aufmass_worker.py), started together with the API unless disabled
+AUFMASS_START_WORKER = os.getenv('AUFMASS_START_WORKER', 'True').lower() == 'true'
+# How often the progress stream checks the job database for new events
+AUFMASS_EVENTS_POLL_INTERVAL = float(os.getenv('AUFMASS_EVENTS_POLL_INTERVAL', '0.5'))
+
+# Connection pool to the LOD2 backend, shared by all proxied requests
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '100'))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv('UPSTREAM_MAX_KEEPALIVE', '20'))
+
+def create_http_client() -> httpx.AsyncClient:
+    # One client for all requests to the LOD2 backend: TCP/TLS connections are kept alive and reused, with HTTP/2 if the h2 package is installed
+    try:
+        import h2 # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    limits = httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS, max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE, keepalive_expiry=60)
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=60.0)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.http_client = create_http_client()
+    worker = None
+    if AUFMASS_START_WORKER:
+        from aufmass_worker import run_worker
+        # spawn: the worker loads torch / SAM3, which should not inherit the state of the API process
+        worker = multiprocessing.get_context("spawn").Process(target=run_worker, name="aufmass-worker", daemon=True)
+        worker.start()
+    yield
+    await app.state.http_client.aclose()
+    if worker is not None and worker.is_alive():
+        worker.terminate()
+        worker.join(timeout=10)
+
 app = FastAPI(
     title="Backend Geruest API",
-    debug=os.getenv('DEBUG', 'False').lower() == 'true'
+    debug=os.getenv('DEBUG', 'False').lower() == 'true',
+    lifespan=lifespan
 )
 
 BACKEND_URL = os.getenv('BACKEND_LOD2_URL', 'http://localhost:8000')
@@ -45,6 +89,14 @@ app.add_middleware(
 def health_check():
     return {"status": "ok"}
 
+async def _backend_token() -> str:
+    # Google OIDC token for the shared LOD2 backend service (cached until shortly before it expires), 503 if it cannot be fetched right now
+    try:
+        return await get_google_oidc_token_async(BACKEND_URL)
+    except GoogleAuthError as e:
+        print(f"ERROR: Could not get a Google ID token for the backend: {e}")
+        raise HTTPException(status_code=503, detail="Backend service authentication unavailable")
+
 class AddressRequest(BaseModel):
     street: str
     number: str
@@ -58,66 +110,120 @@ class AddressRequest(BaseModel):
 @app.post("/api/address")
 async def process_address(
     request: AddressRequest,
+    http_request: Request,
     authorization: str | None = Header(None),
 ):
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing or invalid token")
     
-    # Get the Google OIDC token for the shared LOD2 backend service
-    google_token = get_google_oidc_token(BACKEND_URL)
+    # Get the Google OIDC token for the shared LOD2 backend service (cached until shortly before it expires)
+    google_token = await _backend_token()
 
-    async with httpx.AsyncClient() as client:
+    client: httpx.AsyncClient = http_request.app.state.http_client
+    try:
+        response = await client.post(
+            f"{BACKEND_URL}/api/address",
+            json=request.model_dump(),
+            headers={
+                "Authorization": f"Bearer {google_token}", # Proof for Google
+                "X-User-Token": authorization             # Original Supabase Bearer <token>
+            },
+            timeout=60.0
+        )
+    except httpx.RequestError as exc:
+         raise HTTPException(status_code=503, detail=f"Backend service unreachable: {exc}")
+    # Propagate status code and content
+    if response.status_code >= 400:
         try:
-            response = await client.post(
-                f"{BACKEND_URL}/api/address",
-                json=request.model_dump(),
-                headers={
-                    "Authorization": f"Bearer {google_token}", # Proof for Google
-                    "X-User-Token": authorization             # Original Supabase Bearer <token>
-                },
-                timeout=60.0
-            )
-            # Propagate status code and content
-            if response.status_code >= 400:
-                try:
-                    error_detail = response.json().get('detail', response.text)
-                except:
-                    error_detail = response.text
-                raise HTTPException(status_code=response.status_code, detail=error_detail)
-            
-            return response.json()
-        except httpx.RequestError as exc:
-             raise HTTPException(status_code=503, detail=f"Backend service unreachable: {exc}")
-
-@app.post("/api/geom-to-threejs")
+            error_detail = response.json().get('detail', response.text)
+        except:
+            error_detail = response.text
+        raise HTTPException(status_code=response.status_code, detail=error_detail)
+    
+    return response.json()
+
+# Headers passed through unchanged between the frontend and the LOD2 backend, so compression and conditional requests (ETag / 304) work end to end
+GEOM_REQUEST_HEADERS = ("if-none-match", "accept-encoding")
+GEOM_RESPONSE_HEADERS = ("etag", "content-encoding", "vary", "cache-control", "content-type")
+
+@app.api_route("/api/geom-to-threejs", methods=["GET", "POST"])
 async def geom_to_threejs(
+    request: Request,
     ID_LOD2: str,
+    point_budget: int | None = None,
     authorization: str | None = Header(None),
 ):
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing or invalid token")
     
-    google_token = get_google_oidc_token(BACKEND_URL)
-    async with httpx.AsyncClient() as client:
+    google_token = await _backend_token()
+    params = {"ID_LOD2": ID_LOD2}
+    if point_budget is not None:
+        params["point_budget"] = point_budget # Otherwise the LOD2 backend applies its default point budget
+    headers = {
+        "Authorization": f"Bearer {google_token}", # Proof for Google
+        "X-User-Token": authorization             # Original Supabase Bearer <token>
+    }
+    headers.update({name: request.headers[name] for name in GEOM_REQUEST_HEADERS if name in request.headers})
+    if "accept-encoding" not in headers:
+        headers["accept-encoding"] = "identity" # httpx would otherwise ask for gzip, which this client did not accept
+
+    client: httpx.AsyncClient = request.app.state.http_client
+    try:
+        upstream_request = client.build_request(request.method, f"{BACKEND_URL}/api/geom-to-threejs", params=params, headers=headers, timeout=60.0)
+        response = await client.send(upstream_request, stream=True)
+    except httpx.RequestError as exc:
+        raise HTTPException(status_code=503, detail=f"Backend service unreachable: {exc}")
+
+    async def close():
+        # Returns the connection to the pool
+        await response.aclose()
+
+    passthrough_headers = {name: response.headers[name] for name in GEOM_RESPONSE_HEADERS if name in response.headers}
+    if response.status_code == 304:
+        await close()
+        return Response(status_code=304, headers=passthrough_headers)
+    if response.status_code != 200:
+        await response.aread()
+        await close()
         try:
-            response = await client.post(
-                f"{BACKEND_URL}/api/geom-to-threejs",
-                params={"ID_LOD2": ID_LOD2},
-                headers={
-                    "Authorization": f"Bearer {google_token}", # Proof for Google
-                    "X-User-Token": authorization             # Original Supabase Bearer <token>
-                },
-                timeout=60.0
-            )
-            if response.status_code != 200:
-                try:
-                    detail = response.json().get("detail", response.text)
-                except:
-                    detail = response.text
-                raise HTTPException(status_code=response.status_code, detail=detail)
-            return response.json()
-        except httpx.RequestError as exc:
-             raise HTTPException(status_code=503, detail=f"Backend service unreachable: {exc}")
+            detail = response.json().get("detail", response.text)
+        except:
+            detail = response.text
+        raise HTTPException(status_code=response.status_code, detail=detail)
+    # Stream the (still compressed) body through instead of decoding and re-encoding the large JSON
+    return StreamingResponse(response.aiter_raw(), status_code=200, headers=passthrough_headers, background=BackgroundTask(close))
+
+@app.get("/api/geom-metadata")
+async def geom_metadata(
+    request: Request,
+    ID_LOD2: str,
+    authorization: str | None = Header(None),
+):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing or invalid token")
+
+    google_token = await _backend_token()
+    client: httpx.AsyncClient = request.app.state.http_client
+    try:
+        response = await client.get(
+            f"{BACKEND_URL}/api/geom-metadata",
+            params={"ID_LOD2": ID_LOD2},
+            headers={
+                "Authorization": f"Bearer {google_token}", # Proof for Google
+                "X-User-Token": authorization             # Original Supabase Bearer <token>
+            },
+            timeout=60.0
+        )
+    except httpx.RequestError as exc:
+        raise HTTPException(status_code=503, detail=f"Backend service unreachable: {exc}")
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail", response.text)
+        except:
+            detail = response.text
+        raise HTTPException(status_code=response.status_code, detail=detail)
+    return response.json()
 
 class SegmentationRequest(BaseModel):
     ID_LOD2: str
@@ -134,9 +240,79 @@ async def start_aufmass(
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Could not start Aufmass: Missing or invalid token")
     access_token = authorization.split(" ", 1)[1]
-    aufmass_main(request.ID_LOD2, access_token) # Main module for running the entire Aufmass process
+    user_id = await _verified_user_id(authorization)
+    # The Aufmass takes minutes, so it is only queued here and processed by the worker (aufmass_worker.py running aufmass_main).
+    # Progress: GET /api/aufmass_jobs/{job_id} or the event stream GET /api/aufmass_jobs/{job_id}/events
     # aufmass_testmodule(request.ID_LOD2, access_token) # Test module for testing one single module from the aufmass_core package
-    return
+    job = await run_in_threadpool(lambda: job_queue.enqueue_job(job_queue.connection(), request.ID_LOD2, access_token, user_id))
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+
+async def _verified_user_id(authorization: str | None) -> str:
+    # Supabase user of the bearer token (verified by Supabase Auth), jobs can only be read by the user that started them
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid token")
+    try:
+        user_id = await get_user_id_async(authorization.split(" ", 1)[1])
+    except httpx.HTTPError as e:
+        print(f"ERROR: Could not verify the access token: {e}")
+        raise HTTPException(status_code=503, detail="Could not verify the access token")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Missing or invalid token")
+    return user_id
+
+def _read_job(job_id: str, user_id: str, after_event_id: int | None = None):
+    # Job status and, if after_event_id is given, its progress events newer than that. (None, []) if the job is not the user's.
+    conn = job_queue.connection()
+    job = job_queue.get_job(conn, job_id, user_id)
+    if job is None:
+        return None, []
+    events = job_queue.get_events(conn, job_id, after_event_id) if after_event_id is not None else []
+    return job, events
+
+@app.get("/api/aufmass_jobs/{job_id}")
+async def get_aufmass_job(
+    job_id: str,
+    authorization: str | None = Header(None),
+):
+    user_id = await _verified_user_id(authorization)
+    job, _ = await run_in_threadpool(_read_job, job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Aufmass job {job_id} not found")
+    return job
+
+@app.get("/api/aufmass_jobs/{job_id}/events")
+async def stream_aufmass_job(
+    job_id: str,
+    request: Request,
+    authorization: str | None = Header(None),
+    last_event_id: str | None = Header(None),
+):
+    """
+    Server-sent events with the progress of an Aufmass job: one "progress" event per stage change of a facade
+    (see aufmass_main), then a final "done" or "failed" event. Reconnecting clients continue after the Last-Event-ID header.
+    """
+    user_id = await _verified_user_id(authorization)
+    job, _ = await run_in_threadpool(_read_job, job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Aufmass job {job_id} not found")
+
+    async def events():
+        after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+        while not await request.is_disconnected():
+            job, new_events = await run_in_threadpool(_read_job, job_id, user_id, after)
+            for event_id, event in new_events:
+                after = event_id
+                name = event["status"] if event["status"] in job_queue.FINISHED_STATUSES and "stage" not in event else "progress"
+                payload = dict(event, job_id=job_id, progress=job["progress"])
+                yield f"id: {event_id}\nevent: {name}\ndata: {json.dumps(payload)}\n\n"
+            if job is None or job["status"] in job_queue.FINISHED_STATUSES:
+                break
+            if not new_events:
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(AUFMASS_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__": # Start with: uvicorn main:app --reload --port 8003
@@ -35,6 +35,12 @@ export interface BuildingData {
     multi: Vector3D[];
     roofExtrusions: Vector3D[][];
   };
+  pointsLod?: {
+    voxelSize: number | null; // null: full detail
+    returned: number;
+    total: number;
+    fullDetail: boolean;
+  };
   extrusions: {
     tops: Surface[];
     walls: Surface[][];
@@ -4,9 +4,11 @@ import config from '@/config';
 
 // This function fetches the visualization data from the database (using the LOD2 Id as identifier) via an api call to the backend
 // The backend fetches the geometry data from the database and converts it into a format that can be used by the frontend (three.js visualization framework)
-export const fetchVisualizationData = async (lod2Id: string, accessToken: string): Promise<BuildingData | null> => {
+// pointBudget limits the number of laser points (voxel level of detail), 0 requests the full point cloud. Without it, the backend default is used.
+export const fetchVisualizationData = async (lod2Id: string, accessToken: string, pointBudget?: number): Promise<BuildingData | null> => {
   try {
-    const geomResponse = await fetch(`${config.apiUrl}/api/geom-to-threejs?ID_LOD2=${encodeURIComponent(lod2Id)}`, {
+    const budgetParam = pointBudget !== undefined ? `&point_budget=${pointBudget}` : '';
+    const geomResponse = await fetch(`${config.apiUrl}/api/geom-to-threejs?ID_LOD2=${encodeURIComponent(lod2Id)}${budgetParam}`, {
       method: 'POST',
       headers: {
         'Authorization': `Bearer ${accessToken}`